@@ -8,9 +8,49 @@ load_dotenv()
 class Settings:
     # Database
     DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///./uphera.db")
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+    DB_EXECUTOR_WORKERS: int = int(os.getenv("DB_EXECUTOR_WORKERS", os.getenv("DB_POOL_SIZE", "10")))
+    DB_EXECUTOR_MAX_PENDING: int = int(os.getenv("DB_EXECUTOR_MAX_PENDING", "200"))
+    DB_EXECUTOR_QUEUE_TIMEOUT: float = float(os.getenv("DB_EXECUTOR_QUEUE_TIMEOUT", "10"))
+    DB_SLOW_QUERY_MS: float = float(os.getenv("DB_SLOW_QUERY_MS", "200"))
     
     # Google Gemini
     GEMINI_API_KEY: str = os.getenv("GEMINI_API_KEY", "")
+    # "gemini", or "local" for the network-free stand-in model used in load tests
+    AI_PROVIDER: str = os.getenv("AI_PROVIDER", "gemini").lower()
+    AI_LOCAL_TOKENS_PER_SECOND: float = float(os.getenv("AI_LOCAL_TOKENS_PER_SECOND", "200"))
+    AI_LOCAL_FIRST_TOKEN_MS: float = float(os.getenv("AI_LOCAL_FIRST_TOKEN_MS", "300"))
+    AI_LOCAL_JITTER_MS: float = float(os.getenv("AI_LOCAL_JITTER_MS", "100"))
+    AI_LOCAL_CHUNK_TOKENS: int = int(os.getenv("AI_LOCAL_CHUNK_TOKENS", "8"))
+    AI_LOCAL_RESPONSE_TOKENS: int = int(os.getenv("AI_LOCAL_RESPONSE_TOKENS", "0"))
+    # System prompts at least this long are uploaded once as a Gemini context cache
+    GEMINI_CONTEXT_CACHE_MIN_TOKENS: int = int(os.getenv("GEMINI_CONTEXT_CACHE_MIN_TOKENS", "32768"))
+    GEMINI_CONTEXT_CACHE_TTL: float = float(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "3600"))
+    AI_STREAM_WORKERS: int = int(os.getenv("AI_STREAM_WORKERS", "8"))
+    AI_STREAM_BUFFER: int = int(os.getenv("AI_STREAM_BUFFER", "64"))
+    # Cached Gemini responses for identical prompts; a TTL of 0 disables the cache
+    AI_RESPONSE_CACHE_TTL: float = float(os.getenv("AI_RESPONSE_CACHE_TTL", "86400"))
+    AI_RESPONSE_CACHE_SIZE: int = int(os.getenv("AI_RESPONSE_CACHE_SIZE", "2000"))
+    # Upstream Gemini budget; AI_SHARED_RATE_LIMITS keeps the buckets in the database for all instances
+    AI_MAX_CONCURRENT: int = int(os.getenv("AI_MAX_CONCURRENT", "4"))
+    AI_REQUESTS_PER_MINUTE: float = float(os.getenv("AI_REQUESTS_PER_MINUTE", "60"))
+    AI_TOKENS_PER_MINUTE: float = float(os.getenv("AI_TOKENS_PER_MINUTE", "32000"))
+    AI_QUEUE_TIMEOUT: float = float(os.getenv("AI_QUEUE_TIMEOUT", "30"))
+    AI_SHARED_RATE_LIMITS: bool = os.getenv("AI_SHARED_RATE_LIMITS", "false").lower() == "true"
+    # Chat memory: verbatim recent turns, older questions kept as summary lines, token cap of the block
+    AI_MEMORY_TURNS: int = int(os.getenv("AI_MEMORY_TURNS", "6"))
+    AI_MEMORY_SUMMARY_TURNS: int = int(os.getenv("AI_MEMORY_SUMMARY_TURNS", "20"))
+    AI_MEMORY_MAX_TOKENS: int = int(os.getenv("AI_MEMORY_MAX_TOKENS", "1500"))
+    AI_MEMORY_USERS: int = int(os.getenv("AI_MEMORY_USERS", "1000"))
+    # SSE frames: coalesce chunks until this many bytes or milliseconds; gzip fetch streams that accept it
+    AI_SSE_FLUSH_BYTES: int = int(os.getenv("AI_SSE_FLUSH_BYTES", "512"))
+    AI_SSE_FLUSH_MS: float = float(os.getenv("AI_SSE_FLUSH_MS", "50"))
+    AI_SSE_GZIP: bool = os.getenv("AI_SSE_GZIP", "false").lower() == "true"
+    # Chat history, insights and documents are batched by a background writer; serverless writes through
+    AI_WRITE_BEHIND: bool = os.getenv("AI_WRITE_BEHIND", "false" if os.getenv("VERCEL") else "true").lower() == "true"
+    AI_WRITE_BATCH_SIZE: int = int(os.getenv("AI_WRITE_BATCH_SIZE", "100"))
+    AI_WRITE_FLUSH_SECONDS: float = float(os.getenv("AI_WRITE_FLUSH_SECONDS", "1"))
     
     # SendGrid
     SENDGRID_API_KEY: str = os.getenv("SENDGRID_API_KEY", "")
@@ -42,6 +82,13 @@ class Settings:
     SECRET_KEY: str = os.getenv("SECRET_KEY", "your-secret-key-here-change-in-production")
     ALGORITHM: str = os.getenv("ALGORITHM", "HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+    SESSION_CACHE_SIZE: int = int(os.getenv("SESSION_CACHE_SIZE", "10000"))
+    SESSION_CACHE_TTL: float = float(os.getenv("SESSION_CACHE_TTL", "300"))
+    # "session" issues opaque tokens backed by user_sessions, "jwt" issues signed tokens
+    AUTH_TOKEN_MODE: str = os.getenv("AUTH_TOKEN_MODE", "session").lower()
+    PASSWORD_HASH_ITERATIONS: int = int(os.getenv("PASSWORD_HASH_ITERATIONS", "600000"))
+    PASSWORD_HASHER_WORKERS: int = int(os.getenv("PASSWORD_HASHER_WORKERS", str(os.cpu_count() or 2)))
+    TOKEN_REVOCATION_REFRESH_SECONDS: float = float(os.getenv("TOKEN_REVOCATION_REFRESH_SECONDS", "30"))
     
     # API Settings
     API_HOST: str = os.getenv("API_HOST", "0.0.0.0")
@@ -52,6 +99,16 @@ class Settings:
     UPLOAD_DIR: str = os.getenv("UPLOAD_DIR", "./uploads")
     MAX_FILE_SIZE: int = int(os.getenv("MAX_FILE_SIZE", "10485760"))  # 10MB
     
+    # Job matching
+    JOB_INDEX_PATH: str = os.getenv("JOB_INDEX_PATH", "./job_index.npz")
+    RECOMMENDATION_TOP_K: int = int(os.getenv("RECOMMENDATION_TOP_K", "20"))
+    RECOMMENDATION_REFRESH_SECONDS: float = float(os.getenv("RECOMMENDATION_REFRESH_SECONDS", "60"))
+    # Load the matcher and its index at startup; serverless builds import it on first use instead
+    MATCHING_WARMUP: bool = os.getenv("MATCHING_WARMUP", "false" if os.getenv("VERCEL") else "true").lower() == "true"
+    JOB_COUNT_CACHE_TTL: float = float(os.getenv("JOB_COUNT_CACHE_TTL", "30"))
+    JOB_COUNT_CACHE_SIZE: int = int(os.getenv("JOB_COUNT_CACHE_SIZE", "256"))
+    JOB_VIEW_FLUSH_SECONDS: float = float(os.getenv("JOB_VIEW_FLUSH_SECONDS", "5"))
+    
     # Supabase (optional)
     SUPABASE_URL: str = os.getenv("SUPABASE_URL", "")
     SUPABASE_ANON_KEY: str = os.getenv("SUPABASE_ANON_KEY", "")
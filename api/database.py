@@ -3,29 +3,47 @@ Database setup for Up Hera
 SQLite database with proper user management
 """
 
+import asyncio
+import functools
+import logging
 import sqlite3
 import os
-import hashlib
 import uuid
 import threading
 import time
 import json
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
-from sqlalchemy import create_engine
+from typing import Callable, Dict, List, Optional, Any, Iterator, Set, Tuple, TypeVar
 from api.config import settings
+from api.migrations import LATEST_VERSION, apply_migrations, schema_version
+from api.security import password_hasher
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
 
 # Database file path
 # Vercel Serverless ortamında sadece /tmp yazılabilir.
 # Kalıcı DB kullanmıyorsanız en azından /tmp altında çalışalım (ephemeral).
 DB_PATH = os.getenv("DB_PATH", "/tmp/uphera.db")
 
-# Database lock for thread safety
-_db_lock = threading.Lock()
-
 # Database configuration - Vercel için basitleştirildi
 DATABASE_URL = settings.DATABASE_URL
 
+def _configure_connection(conn: sqlite3.Connection) -> None:
+    """Apply per-connection performance PRAGMAs"""
+    cursor = conn.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA cache_size=1000')
+    cursor.execute('PRAGMA temp_store=memory')
+    cursor.execute('PRAGMA busy_timeout=30000')
+    cursor.close()
+
 def get_db_connection():
     """Get database connection with proper settings"""
     # Ensure directory exists (especially for /tmp)
@@ -35,134 +53,681 @@ def get_db_connection():
         pass
 
     conn = sqlite3.connect(DB_PATH, timeout=60.0, check_same_thread=False)
-    cursor = conn.cursor()
+    _configure_connection(conn)
     
-    # Performance optimizations
-    cursor.execute('PRAGMA journal_mode=WAL')
-    cursor.execute('PRAGMA synchronous=NORMAL')
-    cursor.execute('PRAGMA cache_size=1000')
-    cursor.execute('PRAGMA temp_store=memory')
-    cursor.execute('PRAGMA busy_timeout=30000')
-    
-    return conn, cursor
+    return conn, conn.cursor()
 
-def init_db():
-    """Initialize database tables"""
-    with _db_lock:
-        conn, cursor = get_db_connection()
-        
-        # Users table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id TEXT PRIMARY KEY,
-                email TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                first_name TEXT NOT NULL,
-                last_name TEXT NOT NULL,
-                user_type TEXT DEFAULT 'mezun',
-                phone TEXT,
-                upschool_program TEXT,
-                graduation_date TEXT,
-                experience_level TEXT DEFAULT 'entry',
-                location TEXT,
-                portfolio_url TEXT,
-                github_url TEXT,
-                linkedin_url TEXT,
-                about_me TEXT,
-                skills TEXT, -- JSON string
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Add user_type column if it doesn't exist
+class ConnectionPool:
+    """Bounded pool of SQLite connections for a single database file.
+
+    Connections are opened lazily up to ``max_size`` and configured with the
+    PRAGMAs once, when they are created. Connections that sat idle longer
+    than ``health_check_interval`` are pinged before being handed out again
+    and transparently replaced if they turn out to be broken.
+
+    Reads borrow any free connection and run concurrently (WAL lets readers
+    proceed while a write is in progress). Writes go through ``writer()``,
+    which serializes them so they never fight over SQLite's write lock.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        max_size: int = 10,
+        timeout: float = 30.0,
+        health_check_interval: float = 30.0
+    ):
+        self.db_path = db_path
+        # Every ":memory:" connection is a separate database, so share one
+        self.max_size = 1 if db_path == ":memory:" else max(1, int(max_size))
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+
+        self._idle: List[Tuple[sqlite3.Connection, float]] = []
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._open = 0
+        self._closed = False
+        # Schema version this process has already confirmed (see migrate_db)
+        self.schema_version = 0
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_time": 0.0,
+            "timeouts": 0,
+            "created": 0,
+            "discarded": 0,
+            "writes": 0,
+            "write_waits": 0,
+            "write_wait_time": 0.0,
+        }
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=60.0, check_same_thread=False)
+        _configure_connection(conn)
+        return conn
+
+    @staticmethod
+    def _is_healthy(conn: sqlite3.Connection) -> bool:
         try:
-            cursor.execute('ALTER TABLE users ADD COLUMN user_type TEXT DEFAULT "mezun"')
-        except sqlite3.OperationalError:
-            pass  # Column already exists
-        
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
 
-        
-        # Jobs table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS jobs (
-                id TEXT PRIMARY KEY,
-                title TEXT NOT NULL,
-                company TEXT NOT NULL,
-                company_logo TEXT,
-                location TEXT,
-                description TEXT,
-                requirements TEXT, -- JSON string
-                salary_min INTEGER,
-                salary_max INTEGER,
-                job_type TEXT, -- full-time, part-time, contract
-                experience_level TEXT DEFAULT 'entry',
-                skills TEXT, -- JSON array
-                benefits TEXT, -- JSON array
-                remote_friendly BOOLEAN DEFAULT FALSE,
-                is_active BOOLEAN DEFAULT TRUE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                application_deadline TIMESTAMP,
-                views INTEGER DEFAULT 0,
-                applications_count INTEGER DEFAULT 0
-            )
-        ''')
-        
-        # Applications table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS applications (
-                id TEXT PRIMARY KEY,
-                user_id TEXT NOT NULL,
-                job_id TEXT NOT NULL,
-                status TEXT DEFAULT 'pending', -- pending, reviewed, interviewed, hired, rejected
-                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id),
-                FOREIGN KEY (job_id) REFERENCES jobs (id)
-            )
-        ''')
-        
-        # User sessions table
+    def acquire(self) -> sqlite3.Connection:
+        """Check out a connection, waiting up to ``timeout`` seconds for a free slot"""
+        deadline = time.monotonic() + self.timeout
+        wait_started: Optional[float] = None
+        conn: Optional[sqlite3.Connection] = None
+        last_used = 0.0
+
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise sqlite3.OperationalError("connection pool is closed")
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._open < self.max_size:
+                    self._open += 1
+                    break
+                if wait_started is None:
+                    wait_started = time.monotonic()
+                    self._stats["waits"] += 1
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise sqlite3.OperationalError(
+                        f"connection pool exhausted ({self.max_size} connections in use)"
+                    )
+                self._cond.wait(remaining)
+
+            self._stats["checkouts"] += 1
+            if wait_started is not None:
+                self._stats["wait_time"] += time.monotonic() - wait_started
+
+        if conn is not None:
+            if time.monotonic() - last_used < self.health_check_interval or self._is_healthy(conn):
+                return conn
+            self._close_quietly(conn)
+            with self._cond:
+                self._stats["discarded"] += 1
+
+        # Open a new connection for the slot reserved above
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._stats["created"] += 1
+        return conn
+
+    def release(self, conn: sqlite3.Connection, discard: bool = False) -> None:
+        """Return a connection to the pool, rolling back any open transaction"""
+        if not discard:
+            try:
+                if conn.in_transaction:
+                    conn.rollback()
+            except sqlite3.Error:
+                discard = True
+
+        with self._cond:
+            if discard or self._closed:
+                self._open -= 1
+                if discard:
+                    self._stats["discarded"] += 1
+                self._close_quietly(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a connection for the duration of the ``with`` block"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a connection on the serialized write path.
+
+        The transaction is committed when the block exits cleanly and rolled
+        back if it raises.
+        """
+        started = time.monotonic()
+        waited = not self._write_lock.acquire(blocking=False)
+        if waited and not self._write_lock.acquire(timeout=self.timeout):
+            raise sqlite3.OperationalError("timed out waiting for the database writer")
+        try:
+            with self._cond:
+                self._stats["writes"] += 1
+                if waited:
+                    self._stats["write_waits"] += 1
+                    self._stats["write_wait_time"] += time.monotonic() - started
+
+            with self.connection() as conn:
+                try:
+                    yield conn
+                    conn.commit()
+                except BaseException:
+                    try:
+                        conn.rollback()
+                    except sqlite3.Error:
+                        pass
+                    raise
+        finally:
+            self._write_lock.release()
+
+    def close(self) -> None:
+        """Close idle connections; checked-out ones are closed on release"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+    @staticmethod
+    def _close_quietly(conn: sqlite3.Connection) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def metrics(self) -> Dict[str, Any]:
+        """Pool counters for health/monitoring endpoints"""
+        with self._cond:
+            return {
+                "max_size": self.max_size,
+                "open": self._open,
+                "idle": len(self._idle),
+                "in_use": self._open - len(self._idle),
+                **self._stats,
+            }
+
+# Connection pools keyed by database path
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+def get_pool(db_path: Optional[str] = None) -> ConnectionPool:
+    """Get (or lazily create) the shared connection pool for a database file"""
+    path = db_path or DB_PATH
+    pool = _pools.get(path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(path)
+            if pool is None:
+                if path != ":memory:":
+                    try:
+                        os.makedirs(os.path.dirname(path), exist_ok=True)
+                    except Exception:
+                        pass
+                pool = ConnectionPool(
+                    path,
+                    max_size=settings.DB_POOL_SIZE,
+                    timeout=settings.DB_POOL_TIMEOUT
+                )
+                _pools[path] = pool
+    return pool
+
+@contextmanager
+def db_connection(db_path: Optional[str] = None) -> Iterator[Tuple[sqlite3.Connection, sqlite3.Cursor]]:
+    """Borrow a pooled connection, yielding ``(conn, cursor)`` like get_db_connection"""
+    with get_pool(db_path).connection() as conn:
+        cursor = conn.cursor()
+        try:
+            yield conn, cursor
+        finally:
+            cursor.close()
+
+@contextmanager
+def db_writer(db_path: Optional[str] = None) -> Iterator[Tuple[sqlite3.Connection, sqlite3.Cursor]]:
+    """Like db_connection, but on the pool's serialized write path; commits on success"""
+    with get_pool(db_path).writer() as conn:
+        cursor = conn.cursor()
+        try:
+            yield conn, cursor
+        finally:
+            cursor.close()
+
+def get_pool_metrics() -> Dict[str, Dict[str, Any]]:
+    """Metrics for every open connection pool"""
+    with _pools_lock:
+        pools = list(_pools.items())
+    return {path: pool.metrics() for path, pool in pools}
+
+def close_all_pools() -> None:
+    """Close every connection pool (application shutdown)"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+class DatabaseBusyError(Exception):
+    """Raised when the database executor stays saturated past its queue timeout"""
+
+class DatabaseExecutor:
+    """Runs blocking SQLite helpers off the event loop on a dedicated thread pool.
+
+    At most ``max_pending`` calls may be queued or running at once; further
+    callers wait up to ``queue_timeout`` seconds for a slot and then get a
+    DatabaseBusyError, so a burst of requests applies backpressure instead of
+    piling unbounded work onto the executor. Every call is timed per
+    function name, and calls slower than ``slow_query_ms`` are logged.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 10,
+        max_pending: int = 100,
+        queue_timeout: float = 10.0,
+        slow_query_ms: float = 200.0
+    ):
+        self.max_workers = max(1, int(max_workers))
+        self.max_pending = max(1, int(max_pending))
+        self.queue_timeout = queue_timeout
+        self.slow_query_ms = slow_query_ms
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        # asyncio primitives are bound to one loop; keep a slot semaphore per loop
+        self._slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+        self._in_flight = 0
+        self._rejected = 0
+        self._queries: Dict[str, Dict[str, float]] = {}
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="uphera-db"
+                )
+            return self._executor
+
+    def _slots_for(self, loop: asyncio.AbstractEventLoop) -> asyncio.Semaphore:
+        with self._lock:
+            slots = self._slots.get(loop)
+            if slots is None:
+                slots = asyncio.Semaphore(self.max_pending)
+                self._slots[loop] = slots
+            return slots
+
+    def _record(self, name: str, queue_ms: float, exec_ms: float, failed: bool) -> None:
+        with self._lock:
+            stats = self._queries.get(name)
+            if stats is None:
+                stats = {"count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0, "queue_ms": 0.0}
+                self._queries[name] = stats
+            stats["count"] += 1
+            stats["errors"] += int(failed)
+            stats["total_ms"] += exec_ms
+            stats["max_ms"] = max(stats["max_ms"], exec_ms)
+            stats["queue_ms"] += queue_ms
+        if exec_ms > self.slow_query_ms:
+            logger.warning(f"🐢 Slow database call {name}: {exec_ms:.1f}ms")
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Run ``func(*args, **kwargs)`` on the database executor and await the result"""
+        loop = asyncio.get_running_loop()
+        slots = self._slots_for(loop)
+        name = getattr(func, "__qualname__", repr(func))
+        queued_at = time.perf_counter()
+
+        try:
+            await asyncio.wait_for(slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._rejected += 1
+            raise DatabaseBusyError(f"database executor saturated ({self.max_pending} calls pending)")
+
+        with self._lock:
+            self._in_flight += 1
+
+        def _call() -> T:
+            started = time.perf_counter()
+            failed = True
+            try:
+                result = func(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                finished = time.perf_counter()
+                self._record(name, (started - queued_at) * 1000, (finished - started) * 1000, failed)
+
+        try:
+            return await loop.run_in_executor(self._get_executor(), _call)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            slots.release()
+
+    def metrics(self) -> Dict[str, Any]:
+        """Executor load and per-call timings"""
+        with self._lock:
+            queries = {
+                name: {
+                    "count": int(stats["count"]),
+                    "errors": int(stats["errors"]),
+                    "avg_ms": round(stats["total_ms"] / stats["count"], 3) if stats["count"] else 0.0,
+                    "max_ms": round(stats["max_ms"], 3),
+                    "avg_queue_ms": round(stats["queue_ms"] / stats["count"], 3) if stats["count"] else 0.0,
+                }
+                for name, stats in self._queries.items()
+            }
+            return {
+                "max_workers": self.max_workers,
+                "max_pending": self.max_pending,
+                "in_flight": self._in_flight,
+                "rejected": self._rejected,
+                "queries": queries,
+            }
+
+    def shutdown(self) -> None:
+        """Wait for running calls and stop the worker threads"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+# Shared executor used by the async API handlers and services
+db_executor = DatabaseExecutor(
+    max_workers=settings.DB_EXECUTOR_WORKERS,
+    max_pending=settings.DB_EXECUTOR_MAX_PENDING,
+    queue_timeout=settings.DB_EXECUTOR_QUEUE_TIMEOUT,
+    slow_query_ms=settings.DB_SLOW_QUERY_MS
+)
+
+async def run_db(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Await a blocking database helper without stalling the event loop"""
+    return await db_executor.run(func, *args, **kwargs)
+
+class SessionCache:
+    """Bounded LRU cache of validated sessions, keyed by token.
+
+    Stores the decoded user dict so authenticated requests can skip the
+    ``user_sessions JOIN users`` lookup. Entries expire after ``ttl`` seconds
+    or when the session itself expires, whichever comes first, and are
+    dropped explicitly on logout (per token) and profile updates (per user).
+    The cache is per process, so ``ttl`` bounds how long another replica may
+    keep serving a session that was revoked elsewhere.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 300.0):
+        self.max_size = max(1, int(max_size))
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[Dict[str, Any], float]]" = OrderedDict()
+        self._tokens_by_user: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+        # Bumped on every invalidation so lookups racing with one don't re-cache stale data
+        self._generation = 0
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    @staticmethod
+    def _copy(user: Dict[str, Any]) -> Dict[str, Any]:
+        return {**user, "skills": list(user.get("skills") or [])}
+
+    def generation(self) -> int:
+        """Invalidation counter to pass back to ``put`` after a DB lookup"""
+        return self._generation
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        """Return a copy of the cached user for ``token``, or None"""
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            user, expires_at = entry
+            if expires_at <= time.time():
+                self._remove(token)
+                self._stats["expirations"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(token)
+            self._stats["hits"] += 1
+            return self._copy(user)
+
+    def put(
+        self,
+        token: str,
+        user: Dict[str, Any],
+        session_expires_at: Optional[float] = None,
+        generation: Optional[int] = None
+    ) -> None:
+        """Cache ``user`` for ``token`` unless an invalidation happened since ``generation``"""
+        expires_at = time.time() + self.ttl
+        if session_expires_at is not None:
+            expires_at = min(expires_at, session_expires_at)
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._remove(token)
+            self._entries[token] = (self._copy(user), expires_at)
+            self._tokens_by_user.setdefault(user["id"], set()).add(token)
+            while len(self._entries) > self.max_size:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._stats["evictions"] += 1
+
+    def _remove(self, token: str) -> None:
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        user_id = entry[0]["id"]
+        tokens = self._tokens_by_user.get(user_id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[user_id]
+
+    def invalidate(self, token: str) -> None:
+        """Drop a single session (logout)"""
+        with self._lock:
+            self._generation += 1
+            self._stats["invalidations"] += 1
+            self._remove(token)
+
+    def invalidate_user(self, user_id: str) -> None:
+        """Drop every cached session of a user (profile changed)"""
+        with self._lock:
+            self._generation += 1
+            self._stats["invalidations"] += 1
+            for token in list(self._tokens_by_user.get(user_id, ())):
+                self._remove(token)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._tokens_by_user.clear()
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+                **self._stats,
+            }
+
+session_cache = SessionCache(
+    max_size=settings.SESSION_CACHE_SIZE,
+    ttl=settings.SESSION_CACHE_TTL
+)
+
+def _session_expiry_timestamp(value: Any) -> Optional[float]:
+    """Convert a stored ``expires_at`` value to a UNIX timestamp"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value)).timestamp()
+    except ValueError:
+        return None
+
+class TokenRevocationList:
+    """In-memory set of revoked signed-token ids (``jti``).
+
+    Logouts on this process are added immediately; revocations made by other
+    replicas are picked up by ``refresh``, which reloads the unexpired rows of
+    ``revoked_tokens`` and runs off the request path every
+    ``refresh_interval`` seconds. Entries are dropped once the token they
+    revoke has expired, so the set only grows with the logout rate.
+    """
+
+    def __init__(self, refresh_interval: float = 30.0):
+        self.refresh_interval = refresh_interval
+        self._revoked: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._last_refresh = 0.0
+
+    def is_revoked(self, jti: str) -> bool:
+        with self._lock:
+            return jti in self._revoked
+
+    def add(self, jti: str, expires_at: float) -> None:
+        with self._lock:
+            self._revoked[jti] = expires_at
+
+    def refresh(self, db_path: Optional[str] = None) -> int:
+        """Reload revocations from the database, returns how many are active"""
+        now = time.time()
+        with db_connection(db_path) as (conn, cursor):
+            cursor.execute('SELECT jti, expires_at FROM revoked_tokens WHERE expires_at > ?', (now,))
+            rows = cursor.fetchall()
+        with self._lock:
+            # Local entries survive a refresh that raced with their insert
+            revoked = {jti: exp for jti, exp in self._revoked.items() if exp > now}
+            revoked.update((jti, float(exp)) for jti, exp in rows)
+            self._revoked = revoked
+            self._last_refresh = now
+            return len(revoked)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "revoked": len(self._revoked),
+                "refresh_interval": self.refresh_interval,
+                "last_refresh": self._last_refresh,
+            }
+
+token_revocations = TokenRevocationList(refresh_interval=settings.TOKEN_REVOCATION_REFRESH_SECONDS)
+
+@functools.lru_cache(maxsize=None)
+def _jose() -> Optional[Tuple[Any, Any]]:
+    """``(jwt, JWTError)`` from python-jose, imported on first use; None if missing"""
+    try:
+        from jose import JWTError, jwt
+    except ImportError:  # python-jose is only needed when AUTH_TOKEN_MODE=jwt
+        return None
+    return jwt, JWTError
+
+def signed_tokens_enabled() -> bool:
+    """Whether new logins get signed tokens instead of session rows"""
+    return settings.AUTH_TOKEN_MODE == "jwt" and _jose() is not None
+
+def is_signed_token(token: str) -> bool:
+    """Signed tokens have three dot-separated segments, session tokens are UUIDs"""
+    return token.count(".") == 2
+
+def create_access_token(user_id: str, user_type: str = "mezun") -> str:
+    """Issue a signed token carrying the user id, type and expiry"""
+    jose = _jose()
+    if jose is None:
+        raise RuntimeError("python-jose is required for signed tokens")
+    jwt, _ = jose
+    now = int(time.time())
+    claims = {
+        "sub": user_id,
+        "type": user_type or "mezun",
+        "iat": now,
+        "exp": now + settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        "jti": uuid.uuid4().hex,
+    }
+    return jwt.encode(claims, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+
+def decode_access_token(token: str, check_revoked: bool = True) -> Optional[Dict[str, Any]]:
+    """Verify a signed token's signature, expiry and revocation without the database"""
+    jose = _jose()
+    if jose is None:
+        return None
+    jwt, JWTError = jose
+    try:
+        claims = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except JWTError:
+        return None
+    if not claims.get("sub") or not claims.get("jti"):
+        return None
+    if check_revoked and token_revocations.is_revoked(claims["jti"]):
+        return None
+    return claims
+
+def revoke_access_token(token: str) -> bool:
+    """Revoke a signed token on every replica (logout)"""
+    claims = decode_access_token(token, check_revoked=False)
+    if claims is None:
+        return False
+    with db_writer() as (conn, cursor):
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_sessions (
-                id TEXT PRIMARY KEY,
-                user_id TEXT NOT NULL,
-                token TEXT UNIQUE NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                expires_at TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-        
-        # Create indexes for better performance (after tables are created)
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_email ON users(email)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_user_type ON users(user_type)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_token ON user_sessions(token)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_user_id ON user_sessions(user_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_expires ON user_sessions(expires_at)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_applications_user_id ON applications(user_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_applications_job_id ON applications(job_id)')
-        
-        # Clean up expired sessions periodically
-        cursor.execute('DELETE FROM user_sessions WHERE expires_at < CURRENT_TIMESTAMP')
-        
-        conn.commit()
-        conn.close()
-        print("✅ Database initialized successfully!")
+            INSERT OR IGNORE INTO revoked_tokens (jti, user_id, expires_at)
+            VALUES (?, ?, ?)
+        ''', (claims["jti"], claims["sub"], claims["exp"]))
+    token_revocations.add(claims["jti"], float(claims["exp"]))
+    session_cache.invalidate(token)
+    return True
+
+def migrate_db(db_path: Optional[str] = None) -> int:
+    """Bring a database to the latest schema version and return it.
+
+    Up-to-date databases cost a single read of ``schema_version``, once per
+    process: the pool remembers the result, so every later call (each
+    service checks its tables) returns without touching the file. The
+    writer is only taken when migrations are pending.
+    """
+    pool = get_pool(db_path)
+    if pool.schema_version >= LATEST_VERSION:
+        return pool.schema_version
+    
+    with db_connection(db_path) as (conn, cursor):
+        version = schema_version(cursor)
+    if version < LATEST_VERSION:
+        with db_writer(db_path) as (conn, cursor):
+            apply_migrations(conn)
+            version = schema_version(cursor)
+    pool.schema_version = version
+    return version
+
+def init_db():
+    """Initialize database tables
+
+    Expired sessions are purged separately (``cleanup_expired_sessions``),
+    off the startup path.
+    """
+    migrate_db()
+    print("✅ Database initialized successfully!")
 
 def hash_password(password: str) -> str:
-    """Hash password using SHA-256"""
-    return hashlib.sha256(password.encode()).hexdigest()
+    """Hash password with salted PBKDF2 (see ``api.security``)"""
+    return password_hasher.hash(password)
 
 def verify_password(password: str, hashed: str) -> bool:
-    """Verify password against hash"""
-    return hash_password(password) == hashed
+    """Verify password against hash, accepting legacy SHA-256 digests"""
+    return password_hasher.verify(password, hashed)
 
 def get_user_by_email(email: str) -> Optional[Dict[str, Any]]:
     """Get user by email address"""
-    with _db_lock:
-        conn, cursor = get_db_connection()
-        
+    with db_connection() as (conn, cursor):
         cursor.execute('''
             SELECT id, email, first_name, last_name, upschool_program,
                    phone, graduation_date, experience_level, location,
@@ -171,7 +736,6 @@ def get_user_by_email(email: str) -> Optional[Dict[str, Any]]:
         ''', (email.lower().strip(),))
         
         user = cursor.fetchone()
-        conn.close()
         
         if user:
             return {
@@ -196,11 +760,11 @@ def get_user_by_email(email: str) -> Optional[Dict[str, Any]]:
 
 def create_user(user_data: Dict[str, Any]) -> str:
     """Create a new user"""
-    with _db_lock:
-        conn, cursor = get_db_connection()
-        
+    # Hash before taking the write lock; callers on the event loop pass a precomputed hash
+    password_hash = user_data.get('password_hash') or hash_password(user_data['password'])
+    
+    with db_writer() as (conn, cursor):
         user_id = str(uuid.uuid4())
-        password_hash = hash_password(user_data['password'])
         
         cursor.execute('''
                 INSERT INTO users (
@@ -228,15 +792,12 @@ def create_user(user_data: Dict[str, Any]) -> str:
             ))
         
         conn.commit()
-        conn.close()
         
         return user_id
 
-def authenticate_user(email: str, password: str) -> Optional[Dict[str, Any]]:
-    """Authenticate user and return user data"""
-    with _db_lock:
-        conn, cursor = get_db_connection()
-        
+def get_login_record(email: str) -> Optional[Tuple[Dict[str, Any], str]]:
+    """Return ``(user, password_hash)`` for an email, without checking the password"""
+    with db_connection() as (conn, cursor):
         cursor.execute('''
             SELECT id, email, password_hash, first_name, last_name, upschool_program,
                    phone, graduation_date, experience_level, location, skills, user_type
@@ -244,9 +805,8 @@ def authenticate_user(email: str, password: str) -> Optional[Dict[str, Any]]:
         ''', (email.lower().strip(),))
         
         user = cursor.fetchone()
-        conn.close()
         
-        if user and verify_password(password, user[2]):
+        if user:
             return {
                 "id": user[0],
                 "email": user[1],
@@ -259,24 +819,44 @@ def authenticate_user(email: str, password: str) -> Optional[Dict[str, Any]]:
                 "location": user[9],
                 "skills": json.loads(user[10]) if user[10] else [],
                 "userType": user[11] if len(user) > 11 else "mezun"
-            }
+            }, user[2]
         
         return None
 
+def update_password_hash(user_id: str, password_hash: str) -> None:
+    """Store an upgraded password hash (rehash on login)"""
+    with db_writer() as (conn, cursor):
+        cursor.execute(
+            'UPDATE users SET password_hash = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?',
+            (password_hash, user_id)
+        )
+
+def authenticate_user(email: str, password: str) -> Optional[Dict[str, Any]]:
+    """Authenticate user and return user data"""
+    record = get_login_record(email)
+    if not record:
+        password_hasher.check_unknown_user(password)
+        return None
+    
+    user, stored_hash = record
+    valid, new_hash = password_hasher.check(password, stored_hash)
+    if not valid:
+        return None
+    if new_hash:
+        update_password_hash(user["id"], new_hash)
+    return user
+
 def get_user_by_id(user_id: str) -> Optional[Dict[str, Any]]:
     """Get user by ID"""
-    with _db_lock:
-        conn, cursor = get_db_connection()
-        
+    with db_connection() as (conn, cursor):
         cursor.execute('''
             SELECT id, email, first_name, last_name, upschool_program,
                    phone, graduation_date, experience_level, location,
-                   portfolio_url, github_url, linkedin_url, about_me, skills
+                   portfolio_url, github_url, linkedin_url, about_me, skills, user_type
             FROM users WHERE id = ?
         ''', (user_id,))
         
         user = cursor.fetchone()
-        conn.close()
         
         if user:
             return {
@@ -293,16 +873,15 @@ def get_user_by_id(user_id: str) -> Optional[Dict[str, Any]]:
                 "githubUrl": user[10],
                 "linkedinUrl": user[11],
                 "aboutMe": user[12],
-                "skills": json.loads(user[13]) if user[13] else []
+                "skills": json.loads(user[13]) if user[13] else [],
+                "userType": user[14] or "mezun"
             }
         
         return None
 
 def update_user(user_id: str, user_data: Dict[str, Any]) -> bool:
     """Update user profile"""
-    with _db_lock:
-        conn, cursor = get_db_connection()
-        
+    with db_writer() as (conn, cursor):
         try:
             cursor.execute('''
                 UPDATE users SET
@@ -322,18 +901,21 @@ def update_user(user_id: str, user_data: Dict[str, Any]) -> bool:
             ))
             
             conn.commit()
-            conn.close()
+            session_cache.invalidate_user(user_id)
             return True
         except Exception as e:
             print(f"Error updating user: {e}")
-            conn.close()
             return False
 
-def create_session(user_id: str) -> str:
+def create_session(user_id: str, user_type: Optional[str] = None) -> str:
     """Create user session and return token"""
-    with _db_lock:
-        conn, cursor = get_db_connection()
-        
+    if signed_tokens_enabled():
+        if user_type is None:
+            user = get_user_by_id(user_id)
+            user_type = user["userType"] if user else "mezun"
+        return create_access_token(user_id, user_type)
+    
+    with db_writer() as (conn, cursor):
         session_id = str(uuid.uuid4())
         token = str(uuid.uuid4())
         expires_at = datetime.now() + timedelta(hours=24)
@@ -344,30 +926,66 @@ def create_session(user_id: str) -> str:
         ''', (session_id, user_id, token, expires_at))
         
         conn.commit()
-        conn.close()
         
         return token
 
+def delete_session(token: str) -> bool:
+    """Invalidate a session token (logout)"""
+    if is_signed_token(token):
+        return revoke_access_token(token)
+    with db_writer() as (conn, cursor):
+        cursor.execute('DELETE FROM user_sessions WHERE token = ?', (token,))
+        deleted = cursor.rowcount > 0
+    session_cache.invalidate(token)
+    return deleted
+
 def validate_session(token: str) -> Optional[Dict[str, Any]]:
     """Validate session token and return user data"""
-    with _db_lock:
-        conn, cursor = get_db_connection()
-        
+    user, resolved = lookup_cached_session(token)
+    if resolved:
+        return user
+    return load_session(token)
+
+def lookup_cached_session(token: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """Resolve a token from memory only.
+
+    Returns ``(user, resolved)``. Signed tokens that fail verification resolve
+    to None here; ``resolved`` is False only when the caller still has to run
+    ``load_session`` against the database.
+    """
+    if is_signed_token(token) and decode_access_token(token) is None:
+        return None, True
+    user = session_cache.get(token)
+    return user, user is not None
+
+def load_session(token: str) -> Optional[Dict[str, Any]]:
+    """Look a session up in the database and cache the result"""
+    generation = session_cache.generation()
+    
+    if is_signed_token(token):
+        claims = decode_access_token(token)
+        if claims is None:
+            return None
+        user_data = get_user_by_id(claims["sub"])
+        if user_data:
+            session_cache.put(token, user_data, float(claims["exp"]), generation)
+        return user_data
+    
+    with db_connection() as (conn, cursor):
         cursor.execute('''
             SELECT u.id, u.email, u.first_name, u.last_name, u.upschool_program,
                    u.phone, u.graduation_date, u.experience_level, u.location,
                    u.portfolio_url, u.github_url, u.linkedin_url, u.about_me, 
-                   u.skills, u.user_type
+                   u.skills, u.user_type, s.expires_at
             FROM user_sessions s
             JOIN users u ON s.user_id = u.id
             WHERE s.token = ? AND s.expires_at > CURRENT_TIMESTAMP
         ''', (token,))
         
         user = cursor.fetchone()
-        conn.close()
         
         if user:
-            return {
+            user_data = {
                 "id": user[0],
                 "email": user[1],
                 "firstName": user[2],
@@ -384,17 +1002,18 @@ def validate_session(token: str) -> Optional[Dict[str, Any]]:
                 "skills": json.loads(user[13]) if user[13] else [],
                 "userType": user[14] if len(user) > 14 else "mezun"
             }
+            session_cache.put(token, user_data, _session_expiry_timestamp(user[15]), generation)
+            return user_data
         
         return None
 
 def cleanup_expired_sessions():
     """Clean up expired sessions"""
     try:
-        with _db_lock:
-            conn, cursor = get_db_connection()
+        with db_writer() as (conn, cursor):
             cursor.execute('DELETE FROM user_sessions WHERE expires_at < CURRENT_TIMESTAMP')
+            cursor.execute('DELETE FROM revoked_tokens WHERE expires_at < ?', (int(time.time()),))
             conn.commit()
-            conn.close()
     except Exception as e:
         print(f"Error cleaning up sessions: {e}")
 
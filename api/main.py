@@ -4,10 +4,12 @@ UpSchool Mezunu Teknolojide Öncü Kadınlar İçin Tam Çalışan İş Platform
 """
 
 import asyncio
+import importlib.util
 import uuid
 import json
 import logging
 import os
+from contextlib import aclosing
 from datetime import datetime, timedelta
 from pathlib import Path
 from typing import List, Dict, Optional, Any
@@ -21,42 +23,68 @@ try:
     from pydantic import ConfigDict  # type: ignore
 except Exception:
     ConfigDict = None  # type: ignore
-import uvicorn
 
 # Configuration
 try:
     # Running as package (e.g., pytest, uvicorn with repo root)
     from api.config import settings
+    from api.security import password_hasher
     from api.database import (
         init_db, create_user, get_user_by_email, get_user_by_id,
         update_user, authenticate_user, create_session,
-        validate_session, hash_password, get_db_connection,
+        validate_session, load_session, delete_session, hash_password, get_db_connection,
+        db_connection, get_pool_metrics, close_all_pools,
+        run_db, db_executor, DatabaseBusyError, session_cache,
+        lookup_cached_session, token_revocations, signed_tokens_enabled,
+        get_login_record, update_password_hash, cleanup_expired_sessions,
     )
-    from api.services.enhanced_ai_service import enhanced_ai_service
-    from api.services.job_service import job_service
+    from api.streaming import SSEStream, accepts_gzip, coalesce, sse_stats
+    from api.services.enhanced_ai_service import AI_BUSY_MESSAGE, enhanced_ai_service, start_ai_write_flusher
+    from api.services.job_service import InvalidCursorError, job_service, start_job_view_flusher
     from api.services.websocket_service import websocket_service, manager
 except ImportError:
     # Running as script from api/ (e.g., CI integration step)
     from config import settings
+    from security import password_hasher
     from database import (
         init_db, create_user, get_user_by_email, get_user_by_id,
         update_user, authenticate_user, create_session,
-        validate_session, hash_password, get_db_connection,
+        validate_session, load_session, delete_session, hash_password, get_db_connection,
+        db_connection, get_pool_metrics, close_all_pools,
+        run_db, db_executor, DatabaseBusyError, session_cache,
+        lookup_cached_session, token_revocations, signed_tokens_enabled,
+        get_login_record, update_password_hash, cleanup_expired_sessions,
     )
+    from streaming import SSEStream, accepts_gzip, coalesce, sse_stats
     try:
-        from services.enhanced_ai_service import enhanced_ai_service
+        from services.enhanced_ai_service import AI_BUSY_MESSAGE, enhanced_ai_service, start_ai_write_flusher
     except ImportError:
         enhanced_ai_service = None
     try:
-        from services.job_service import job_service
+        from services.job_service import InvalidCursorError, job_service, start_job_view_flusher
     except ImportError:
         job_service = None
+        InvalidCursorError = ValueError
     try:
         from services.websocket_service import websocket_service, manager
     except ImportError:
         websocket_service = None
         manager = None
 
+# Job matching needs scikit-learn/numpy (requirements-ai.txt). Those imports
+# cost over a second, so the services are only imported on first use.
+if all(importlib.util.find_spec(name) for name in ("numpy", "scipy", "sklearn")):
+    try:
+        from api.services import LazyService, queue_dirty_user
+    except ImportError:
+        from services import LazyService, queue_dirty_user
+    ai_matcher = LazyService("ai_matching_service", "ai_matcher")
+    recommendation_service = LazyService("recommendation_service", "recommendation_service")
+    start_recommendation_refresher = LazyService("recommendation_service", "start_recommendation_refresher")
+else:
+    ai_matcher = None
+    recommendation_service = None
+
 """Configure logging early so it's available during imports below"""
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -67,6 +95,8 @@ if job_service is None:
     logger.warning("Job service not available")
 if websocket_service is None:
     logger.warning("WebSocket service not available")
+if ai_matcher is None:
+    logger.warning("AI matching service not available")
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -147,6 +177,14 @@ class JobApplicationRequest(BaseModel):
     resume_content: str = ""
 
 # Utility functions
+async def resolve_session(token: str) -> Optional[Dict[str, Any]]:
+    """Resolve a bearer token to a user, going to the database only on a cache miss"""
+    # Signed tokens are verified and cached sessions served in memory, skipping the executor hop
+    user, resolved = lookup_cached_session(token)
+    if resolved:
+        return user
+    return await run_db(load_session, token)
+
 async def get_current_user(authorization: Optional[str] = Header(None)) -> Dict[str, Any]:
     """Get current authenticated user"""
     if not authorization or not authorization.startswith("Bearer "):
@@ -154,7 +192,7 @@ async def get_current_user(authorization: Optional[str] = Header(None)) -> Dict[
     
     try:
         token = authorization.split(" ")[1]
-        user = validate_session(token)
+        user = await resolve_session(token)
 
         # Demo giriş için fallback: Frontend'te demo-token-* ile gelen istekleri kabul et
         if not user and token.startswith("demo-token"):
@@ -163,7 +201,7 @@ async def get_current_user(authorization: Optional[str] = Header(None)) -> Dict[
                 demo_first = os.getenv("DEMO_USER_FIRST", "Demo")
                 demo_last = os.getenv("DEMO_USER_LAST", "Kullanici")
 
-                existing = get_user_by_email(demo_email)
+                existing = await run_db(get_user_by_email, demo_email)
                 if not existing:
                     # Demo kullanıcıyı oluştur
                     demo_user_data = {
@@ -178,8 +216,8 @@ async def get_current_user(authorization: Optional[str] = Header(None)) -> Dict[
                         "skills": ["React", "TypeScript", "Python"],
                         "userType": "mezun"
                     }
-                    create_user(demo_user_data)
-                    existing = get_user_by_email(demo_email)
+                    await run_db(create_user, demo_user_data)
+                    existing = await run_db(get_user_by_email, demo_email)
 
                 # Demo kullanıcı nesnesini geri döndür
                 if existing:
@@ -191,6 +229,9 @@ async def get_current_user(authorization: Optional[str] = Header(None)) -> Dict[
             raise HTTPException(status_code=401, detail="Invalid or expired token")
 
         return user
+    except DatabaseBusyError as e:
+        logger.warning(f"Authentication deferred, database busy: {e}")
+        raise HTTPException(status_code=503, detail="Sunucu şu anda yoğun, lütfen tekrar deneyin")
     except Exception as e:
         logger.error(f"Authentication error: {e}")
         raise HTTPException(status_code=401, detail="Authentication failed")
@@ -202,7 +243,7 @@ async def get_current_user_optional(authorization: Optional[str] = Header(None))
     
     try:
         token = authorization.split(" ")[1]
-        user = validate_session(token)
+        user = await resolve_session(token)
         return user
     except Exception as e:
         logger.warning(f"Optional authentication failed: {e}")
@@ -243,6 +284,8 @@ async def startup_event():
             logger.warning(f"Admin bootstrap failed: {e}")
         
         # Initialize AI service
+        if enhanced_ai_service:
+            asyncio.create_task(start_ai_write_flusher())
         logger.info("✅ AI service initialized")
         # Optional warmup to reduce first-token latency
         try:
@@ -253,8 +296,27 @@ async def startup_event():
             logger.debug(f"Warmup skip: {warm_e}")
         
         # Initialize job service
+        if job_service:
+            asyncio.create_task(start_job_view_flusher())
         logger.info("✅ Job service initialized")
         
+        # Keep the matching services in sync with job changes once they are loaded
+        if ai_matcher and job_service:
+            job_service.add_listener(forward_job_changes(ai_matcher))
+            job_service.add_listener(forward_job_changes(recommendation_service))
+            asyncio.create_task(start_matching_refresher())
+            
+            # Long-running servers load the job feature index up front
+            if settings.MATCHING_WARMUP:
+                try:
+                    await run_db(recommendation_service.resolve)
+                    await run_db(ai_matcher.load_job_index, settings.JOB_INDEX_PATH, job_service)
+                except Exception as e:
+                    logger.warning(f"Job feature index not loaded: {e}")
+        
+        # Purge expired sessions without holding up startup
+        asyncio.create_task(run_db(cleanup_expired_sessions))
+        
         # Create upload directory if needed
         upload_dir = getattr(settings, 'UPLOAD_DIR', './uploads')
         os.makedirs(upload_dir, exist_ok=True)
@@ -266,6 +328,66 @@ async def startup_event():
         logger.error(f"❌ Startup failed: {e}")
         raise
 
+def forward_job_changes(service):
+    """``JobService`` listener for a lazily imported service; a no-op until it is loaded"""
+    def listener(event: str, job: Dict[str, Any]) -> None:
+        if service.loaded:
+            service.on_job_changed(event, job)
+    return listener
+
+async def start_matching_refresher():
+    """Run the recommendation refresher once the recommendation service is in use"""
+    while not recommendation_service.loaded:
+        await asyncio.sleep(settings.RECOMMENDATION_REFRESH_SECONDS)
+    await start_recommendation_refresher()
+
+async def refresh_token_revocations():
+    """Periodically sync signed-token revocations made by other replicas"""
+    while True:
+        try:
+            await run_db(token_revocations.refresh)
+        except Exception as e:
+            logger.warning(f"Token revocation refresh failed: {e}")
+        await asyncio.sleep(token_revocations.refresh_interval)
+
+@app.on_event("startup")
+async def startup_token_revocations():
+    """Keep the in-memory revocation list in sync when signed tokens are issued"""
+    if not signed_tokens_enabled():
+        return
+    if settings.SECRET_KEY == "your-secret-key-here-change-in-production":
+        logger.warning("⚠️ AUTH_TOKEN_MODE=jwt is using the default SECRET_KEY")
+    asyncio.create_task(refresh_token_revocations())
+    logger.info("🔐 Signed token authentication enabled")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Flush buffered job views, AI rows and the job index, stop AI workers and release pooled database connections"""
+    if job_service:
+        try:
+            flushed = job_service.view_counter.flush()
+            logger.info(f"✅ Flushed {flushed} buffered job views")
+        except Exception as e:
+            logger.error(f"❌ Job view flush on shutdown failed: {e}")
+    if enhanced_ai_service:
+        try:
+            written = enhanced_ai_service.writes.flush()
+            written += enhanced_ai_service.response_cache.flush_usage()
+            logger.info(f"✅ Flushed {written} queued AI rows")
+        except Exception as e:
+            logger.error(f"❌ AI write flush on shutdown failed: {e}")
+        enhanced_ai_service.stream_bridge.shutdown()
+    if ai_matcher and ai_matcher.loaded:
+        try:
+            if ai_matcher.save_job_index():
+                logger.info("✅ Saved the job feature index")
+        except Exception as e:
+            logger.error(f"❌ Job index save on shutdown failed: {e}")
+    db_executor.shutdown()
+    password_hasher.shutdown()
+    close_all_pools()
+    logger.info("👋 Database connections closed")
+
 # Health check endpoints
 @app.get("/")
 async def root():
@@ -288,9 +410,8 @@ async def health_check():
     """Health check endpoint"""
     try:
         # Test database connection
-        conn, cursor = get_db_connection()
-        cursor.execute("SELECT 1")
-        conn.close()
+        with db_connection() as (conn, cursor):
+            cursor.execute("SELECT 1")
         
         return {
             "status": "healthy",
@@ -318,9 +439,8 @@ async def health_detailed():
         # Database check
         db_status = "disconnected"
         try:
-            conn, cursor = get_db_connection()
-            cursor.execute("SELECT 1")
-            conn.close()
+            with db_connection() as (conn, cursor):
+                cursor.execute("SELECT 1")
             db_status = "connected"
         except Exception as e:
             db_status = f"error: {e}"
@@ -332,6 +452,23 @@ async def health_detailed():
             "status": "healthy",
             "checks": {
                 "database": db_status,
+                "database_pool": get_pool_metrics(),
+                "database_executor": db_executor.metrics(),
+                "session_cache": session_cache.metrics(),
+                "token_revocations": token_revocations.metrics(),
+                "password_hasher": password_hasher.metrics(),
+                "recommendations": (
+                    recommendation_service.metrics() if recommendation_service.loaded else {"loaded": False}
+                ) if recommendation_service else None,
+                "job_views": job_service.view_counter.metrics() if job_service else None,
+                "ai_streams": enhanced_ai_service.stream_bridge.metrics() if enhanced_ai_service else None,
+                "ai_response_cache": enhanced_ai_service.response_cache.metrics() if enhanced_ai_service else None,
+                "ai_single_flight": enhanced_ai_service.single_flight.metrics() if enhanced_ai_service else None,
+                "ai_limiter": enhanced_ai_service.limiter.metrics() if enhanced_ai_service else None,
+                "ai_prompts": enhanced_ai_service.prompts.metrics() if enhanced_ai_service else None,
+                "ai_memory": enhanced_ai_service.memory.metrics() if enhanced_ai_service else None,
+                "ai_sse": sse_stats.metrics(),
+                "ai_writes": enhanced_ai_service.writes.metrics() if enhanced_ai_service else None,
                 "memory": memory_status
             }
         }
@@ -358,7 +495,7 @@ async def register_graduate(graduate: GraduateRegistration):
             })
         
         # Check if user already exists
-        existing_user = get_user_by_email(email)
+        existing_user = await run_db(get_user_by_email, email)
         if existing_user:
             return JSONResponse(status_code=409, content={
                 "message": "Email already exists"
@@ -368,6 +505,7 @@ async def register_graduate(graduate: GraduateRegistration):
         user_data = {
             "email": email,
             "password": graduate.password,
+            "password_hash": await password_hasher.hash_async(graduate.password),
             "firstName": graduate.firstName.strip(),
             "lastName": graduate.lastName.strip(),
             "upschoolProgram": graduate.upschoolProgram,
@@ -378,10 +516,10 @@ async def register_graduate(graduate: GraduateRegistration):
             "userType": "mezun"
         }
         
-        user_id = create_user(user_data)
+        user_id = await run_db(create_user, user_data)
         
         # Create session for auto-login
-        token = create_session(user_id)
+        token = await run_db(create_session, user_id, "mezun")
         
         logger.info(f"✅ New graduate registered: {graduate.firstName} {graduate.lastName}")
         
@@ -414,8 +552,14 @@ async def login(request: LoginRequest):
         if not email or not request.password:
             raise HTTPException(status_code=400, detail="E-posta ve şifre gerekli")
         
-        # Authenticate user
-        user = authenticate_user(email, request.password)
+        # Authenticate user: lookup on the DB executor, KDF on the hasher pool
+        record = await run_db(get_login_record, email)
+        user, stored_hash = record if record else (None, None)
+        valid, new_hash = await password_hasher.check_async(request.password, stored_hash)
+        if not valid:
+            user = None
+        elif new_hash:
+            await run_db(update_password_hash, user["id"], new_hash)
         
         if not user:
             return JSONResponse(status_code=401, content={
@@ -423,7 +567,7 @@ async def login(request: LoginRequest):
             })
         
         # Create session
-        token = create_session(user["id"])
+        token = await run_db(create_session, user["id"], user.get("userType", "mezun"))
         
         logger.info(f"✅ Login successful: {user['firstName']} {user['lastName']}")
         
@@ -471,10 +615,7 @@ async def logout(current_user: Dict = Depends(get_current_user), authorization:
         if authorization and authorization.startswith("Bearer "):
             token = authorization.split(" ")[1]
         if token:
-            conn, cursor = get_db_connection()
-            cursor.execute('DELETE FROM user_sessions WHERE token = ?', (token,))
-            conn.commit()
-            conn.close()
+            await run_db(delete_session, token)
         return {"success": True, "message": "Çıkış yapıldı"}
     except HTTPException:
         raise
@@ -490,7 +631,7 @@ async def update_profile(
     """Update user profile"""
     try:
         # Mevcut kullanıcı verisini al ve kısmi güncellemeleri merge et
-        existing_user = get_user_by_id(current_user["id"]) or {}
+        existing_user = await run_db(get_user_by_id, current_user["id"]) or {}
         update_data = {
             "firstName": profile_data.firstName if profile_data.firstName is not None else existing_user.get("firstName", ""),
             "lastName": profile_data.lastName if profile_data.lastName is not None else existing_user.get("lastName", ""),
@@ -506,10 +647,13 @@ async def update_profile(
             "aboutMe": profile_data.aboutMe if profile_data.aboutMe is not None else existing_user.get("aboutMe", ""),
         }
         
-        success = update_user(current_user["id"], update_data)
+        success = await run_db(update_user, current_user["id"], update_data)
         
         if success:
-            updated_user = get_user_by_id(current_user["id"])
+            if recommendation_service:
+                # Rescored by the refresher; queued outside the service so it isn't imported here
+                queue_dirty_user(current_user["id"])
+            updated_user = await run_db(get_user_by_id, current_user["id"])
             return {
                 "success": True,
                 "message": "Profil başarıyla güncellendi!",
@@ -589,7 +733,8 @@ async def ai_chat(
 @app.post("/ai-coach/chat/stream")
 async def ai_chat_stream(
     data: ChatRequest,
-    current_user: Dict = Depends(get_current_user)
+    current_user: Dict = Depends(get_current_user),
+    accept_encoding: Optional[str] = Header(None)
 ):
     """Streaming AI chat using enhanced_ai_service with model-based validation."""
     try:
@@ -598,30 +743,46 @@ async def ai_chat_stream(
         # Pydantic validated input
         message = data.message
         context = data.context
+        # fetch() clients decode a gzip stream; EventSource ones use stream-get
+        sse = SSEStream(gzip=settings.AI_SSE_GZIP and accepts_gzip(accept_encoding))
 
         async def generate():
             try:
-                async for chunk in enhanced_ai_service.enhanced_chat(
-                    user_id=user_id,
-                    message=message,
-                    context=context,
-                    use_streaming=True,
-                    response_mode=data.response_mode or "auto",
-                    max_tokens=data.max_tokens
-                ):
-                    yield f"data: {json.dumps({'chunk': chunk})}\n\n"
-                yield f"data: {json.dumps({'done': True})}\n\n"
+                # aclosing: a client disconnect stops the Gemini stream behind it
+                async with aclosing(coalesce(
+                    enhanced_ai_service.enhanced_chat(
+                        user_id=user_id,
+                        message=message,
+                        context=context,
+                        use_streaming=True,
+                        response_mode=data.response_mode or "auto",
+                        max_tokens=data.max_tokens
+                    ),
+                    max_bytes=settings.AI_SSE_FLUSH_BYTES,
+                    max_delay=settings.AI_SSE_FLUSH_MS / 1000
+                )) as chunks:
+                    async for chunk in chunks:
+                        yield sse.frame({'chunk': chunk})
+                yield sse.frame({'done': True})
             except Exception as e:
-                yield f"data: {json.dumps({'error': str(e)})}\n\n"
-
+                yield sse.frame({'error': str(e)})
+            finally:
+                tail = sse.end()
+            if tail:
+                yield tail
+
+        headers = {
+            "Cache-Control": "no-cache, no-transform",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+            "Vary": "Accept-Encoding"
+        }
+        if sse.gzip:
+            headers["Content-Encoding"] = "gzip"
         return StreamingResponse(
             generate(),
             media_type="text/event-stream; charset=utf-8",
-            headers={
-                "Cache-Control": "no-cache, no-transform",
-                "Connection": "keep-alive",
-                "X-Accel-Buffering": "no"
-            }
+            headers=headers
         )
         
     except Exception as e:
@@ -641,21 +802,28 @@ async def ai_chat_stream_get(
     try:
         user_id = current_user.get('id', 'anonymous') if current_user else 'anonymous'
 
+        sse = SSEStream()
+
         async def generate():
             try:
                 # Initial ping
-                yield f"data: {json.dumps({'type': 'info', 'content': 'connected'})}\n\n"
+                yield sse.frame({'type': 'info', 'content': 'connected'})
 
                 # Stream AI chunks
-                async for chunk in enhanced_ai_service.enhanced_chat(
-                    user_id=user_id,
-                    message=message,
-                    context=context,
-                    use_streaming=True,
-                    response_mode=response_mode,
-                    max_tokens=max_tokens
-                ):
-                    yield f"data: {json.dumps({'type': 'content', 'content': chunk})}\n\n"
+                async with aclosing(coalesce(
+                    enhanced_ai_service.enhanced_chat(
+                        user_id=user_id,
+                        message=message,
+                        context=context,
+                        use_streaming=True,
+                        response_mode=response_mode,
+                        max_tokens=max_tokens
+                    ),
+                    max_bytes=settings.AI_SSE_FLUSH_BYTES,
+                    max_delay=settings.AI_SSE_FLUSH_MS / 1000
+                )) as chunks:
+                    async for chunk in chunks:
+                        yield sse.frame({'type': 'content', 'content': chunk})
 
                 # Finalize with suggestions
                 suggestions = [
@@ -664,10 +832,12 @@ async def ai_chat_stream_get(
                     "Kariyer planlama",
                     "Teknik beceri geliştirme"
                 ]
-                yield f"data: {json.dumps({'type': 'done', 'enhanced': True, 'suggestions': suggestions})}\n\n"
+                yield sse.frame({'type': 'done', 'enhanced': True, 'suggestions': suggestions})
             except Exception as e:
-                yield f"data: {json.dumps({'type': 'content', 'content': '❌ Hata: ' + str(e)})}\n\n"
-                yield f"data: {json.dumps({'type': 'done', 'enhanced': False})}\n\n"
+                yield sse.frame({'type': 'content', 'content': '❌ Hata: ' + str(e)})
+                yield sse.frame({'type': 'done', 'enhanced': False})
+            finally:
+                sse.end()
 
         return StreamingResponse(
             generate(),
@@ -710,7 +880,7 @@ async def upload_cv_endpoint(
 
         # Save a lightweight insight snapshot as well (for history endpoints)
         try:
-            enhanced_ai_service.save_ai_insights(user_id, "document_analysis", {
+            await run_db(enhanced_ai_service.save_ai_insights, user_id, "document_analysis", {
                 "analysis": analysis_text,
                 "filename": file.filename,
             })
@@ -738,7 +908,7 @@ class CVInsightsRequest(BaseModel):
 @app.post("/ai-coach/cv/insights")
 async def cv_insights_endpoint(payload: CVInsightsRequest):
     try:
-        items = enhanced_ai_service.get_user_insights(payload.user_id)
+        items = await run_db(enhanced_ai_service.get_user_insights, payload.user_id)
         # Pick the most recent document_analysis item
         selected = None
         for it in items:
@@ -814,22 +984,18 @@ async def get_chat_history(
     current_user: Dict = Depends(get_current_user),
     limit: int = Query(10, ge=1, le=50)
 ):
-    """Get user's chat history"""
+    """Get user's chat history, newest first"""
+    user_id = current_user.get('id', 'anonymous')
+    history = await run_db(enhanced_ai_service.get_chat_history, user_id, limit) if enhanced_ai_service else []
     return {
         "success": True,
-        "history": [],
-        "message": "AI servis şu anda Vercel deployment nedeniyle geçici olarak kullanılamıyor."
+        "history": history
     }
 
 @app.get("/ai-coach/insights")
 async def get_ai_insights(current_user: Dict = Depends(get_current_user)):
     """Get comprehensive AI insights for maximum token usage"""
     try:
-        from services.enhanced_ai_coach import EnhancedAICoach
-        
-        # Initialize AI coach
-        ai_coach = EnhancedAICoach()
-        
         # Create comprehensive insights prompt for maximum token usage
         insights_prompt = f"""
         As an expert career coach and AI analyst specializing in women in technology, provide comprehensive career insights and recommendations for the following user.
@@ -905,8 +1071,17 @@ async def get_ai_insights(current_user: Dict = Depends(get_current_user)):
         Make the insights extremely detailed, actionable, and comprehensive. Provide specific examples, actionable steps, and valuable recommendations that will help the user advance their career in technology.
         """
         
-        # Get comprehensive insights
-        insights = await ai_coach.get_insights(insights_prompt)
+        # Get comprehensive insights; the prompt only varies per user, so repeats hit the response cache
+        insights = await enhanced_ai_service.chat_nonstream(
+            insights_prompt, "career", response_mode="long", max_tokens=1024
+        )
+        # Busy and error replies come back as text; they are not insights
+        if insights == AI_BUSY_MESSAGE or insights.startswith("❌"):
+            return {
+                "success": False,
+                "insights": [],
+                "message": insights
+            }
         
         return {
             "success": True,
@@ -946,19 +1121,22 @@ async def get_jobs(
     experience_level: str = Query(""),
     remote_only: bool = Query(False),
     search: str = Query(""),
+    cursor: str = Query(""),
     current_user: Dict = Depends(get_current_user)
 ):
-    """Get job listings with filters"""
+    """Get job listings with filters; pass ``next_cursor`` as ``cursor`` for the next page"""
     try:
         if job_service:
-            jobs_data = job_service.get_jobs(
+            jobs_data = await run_db(
+                job_service.get_jobs,
                 limit=limit,
                 offset=offset,
                 location=location,
                 job_type=job_type,
                 experience_level=experience_level,
                 remote_only=remote_only,
-                search_query=search
+                search_query=search,
+                page_cursor=cursor
             )
         else:
             # Mock job data when service is not available
@@ -984,10 +1162,33 @@ async def get_jobs(
             **jobs_data
         }
         
+    except InvalidCursorError:
+        raise HTTPException(status_code=400, detail="Geçersiz sayfa imleci")
     except Exception as e:
         logger.error(f"❌ Jobs error: {e}")
         raise HTTPException(status_code=500, detail="İş ilanları alınamadı")
 
+@app.get("/api/jobs/recommended")
+async def get_recommended_jobs(
+    limit: int = Query(10, ge=1, le=50),
+    current_user: Dict = Depends(get_current_user)
+):
+    """Get the user's precomputed top job matches"""
+    if not recommendation_service:
+        raise HTTPException(status_code=503, detail="Öneri servisi şu anda kullanılamıyor")
+    try:
+        jobs = await run_db(recommendation_service.get_recommendations, current_user["id"], limit)
+        return {
+            "success": True,
+            "jobs": jobs,
+            "total": len(jobs)
+        }
+    except DatabaseBusyError:
+        raise HTTPException(status_code=503, detail="Sunucu şu anda yoğun, lütfen tekrar deneyin")
+    except Exception as e:
+        logger.error(f"❌ Recommendations error: {e}")
+        raise HTTPException(status_code=500, detail="Önerilen iş ilanları alınamadı")
+
 @app.get("/api/jobs/{job_id}")
 async def get_job(
     job_id: str,
@@ -995,7 +1196,7 @@ async def get_job(
 ):
     """Get single job by ID"""
     try:
-        job = job_service.get_job_by_id(job_id)
+        job = await run_db(job_service.get_job_by_id, job_id)
         
         if not job:
             raise HTTPException(status_code=404, detail="İş ilanı bulunamadı")
@@ -1020,11 +1221,12 @@ async def apply_to_job(
     """Apply to a job"""
     try:
         # Validate job exists
-        job = job_service.get_job_by_id(job_id)
+        job = await run_db(job_service.get_job_by_id, job_id)
         if not job:
             raise HTTPException(status_code=404, detail="Invalid or non-existent job ID")
 
-        result = job_service.apply_to_job(
+        result = await run_db(
+            job_service.apply_to_job,
             user_id=current_user["id"],
             job_id=job_id,
             cover_letter=application.cover_letter,
@@ -1058,7 +1260,7 @@ async def apply_to_job(
 async def get_my_applications(current_user: Dict = Depends(get_current_user)):
     """Get user's job applications"""
     try:
-        applications = job_service.get_user_applications(current_user["id"])
+        applications = await run_db(job_service.get_user_applications, current_user["id"])
         return {
             "success": True,
             "applications": applications
@@ -1076,7 +1278,7 @@ async def bookmark_job(
 ):
     """Bookmark/unbookmark a job"""
     try:
-        result = job_service.bookmark_job(current_user["id"], job_id)
+        result = await run_db(job_service.bookmark_job, current_user["id"], job_id)
         return result
     except HTTPException:
         raise
@@ -1088,7 +1290,7 @@ async def bookmark_job(
 async def get_my_bookmarks(current_user: Dict = Depends(get_current_user)):
     """Get user's bookmarked jobs"""
     try:
-        bookmarks = job_service.get_user_bookmarks(current_user["id"])
+        bookmarks = await run_db(job_service.get_user_bookmarks, current_user["id"])
         return {
             "success": True,
             "bookmarks": bookmarks
@@ -0,0 +1,366 @@
+"""
+Schema migrations for Up Hera
+Versioned, append-only schema steps tracked in the schema_version table
+"""
+
+import logging
+import sqlite3
+from typing import Callable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Secondary indexes of the job tables as (name, table, columns)
+JOB_INDEXES = [
+    # Newest-first listings, alone or with one equality filter; id is the keyset tie-breaker
+    ("idx_jobs_active_created", "jobs", "is_active, created_at, id"),
+    ("idx_jobs_active_type_created", "jobs", "is_active, job_type, created_at, id"),
+    ("idx_jobs_active_level_created", "jobs", "is_active, experience_level, created_at, id"),
+    ("idx_jobs_active_remote_created", "jobs", "is_active, remote_friendly, created_at, id"),
+    # Per-user lists in display order, and per-job lookups
+    ("idx_job_applications_user_applied", "job_applications", "user_id, applied_at"),
+    ("idx_job_applications_job", "job_applications", "job_id"),
+    ("idx_job_bookmarks_user_created", "job_bookmarks", "user_id, created_at"),
+    ("idx_job_bookmarks_job", "job_bookmarks", "job_id"),
+    ("idx_job_recommendations_user_score", "job_recommendations", "user_id, match_score DESC"),
+    ("idx_job_recommendations_job", "job_recommendations", "job_id"),
+]
+
+# Columns indexed by jobs_fts
+SEARCH_FIELDS = ["title", "company", "description", "skills", "requirements"]
+
+def fold_search_sql(column: str) -> str:
+    """SQL folding Turkish dotless/dotted I, which unicode61 keeps as distinct letters"""
+    return f"replace(replace({column}, 'ı', 'i'), 'İ', 'i')"
+
+def _columns(cursor: sqlite3.Cursor, table: str) -> List[str]:
+    cursor.execute(f"PRAGMA table_info({table})")
+    return [row[1] for row in cursor.fetchall()]
+
+def _tables(cursor: sqlite3.Cursor) -> List[str]:
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    return [row[0] for row in cursor.fetchall()]
+
+def create_core_tables(cursor: sqlite3.Cursor) -> None:
+    """Users and login sessions"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id TEXT PRIMARY KEY,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            first_name TEXT NOT NULL,
+            last_name TEXT NOT NULL,
+            user_type TEXT DEFAULT 'mezun',
+            phone TEXT,
+            upschool_program TEXT,
+            graduation_date TEXT,
+            experience_level TEXT DEFAULT 'entry',
+            location TEXT,
+            portfolio_url TEXT,
+            github_url TEXT,
+            linkedin_url TEXT,
+            about_me TEXT,
+            skills TEXT, -- JSON string
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # Databases created before user types existed
+    if "user_type" not in _columns(cursor, "users"):
+        cursor.execute("ALTER TABLE users ADD COLUMN user_type TEXT DEFAULT 'mezun'")
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_sessions (
+            id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            token TEXT UNIQUE NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_email ON users(email)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_user_type ON users(user_type)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_token ON user_sessions(token)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_user_id ON user_sessions(user_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_expires ON user_sessions(expires_at)')
+
+def create_revoked_tokens(cursor: sqlite3.Cursor) -> None:
+    """Revoked signed tokens (AUTH_TOKEN_MODE=jwt), kept until the token itself expires"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS revoked_tokens (
+            jti TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            expires_at INTEGER NOT NULL, -- UNIX timestamp from the token's exp claim
+            revoked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_revoked_tokens_expires ON revoked_tokens(expires_at)')
+
+def create_job_tables(cursor: sqlite3.Cursor) -> None:
+    """Job postings, applications, bookmarks and stored recommendations"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            title TEXT NOT NULL,
+            company TEXT NOT NULL,
+            company_logo TEXT,
+            location TEXT,
+            job_type TEXT DEFAULT 'full-time',
+            experience_level TEXT DEFAULT 'entry',
+            salary_min INTEGER,
+            salary_max INTEGER,
+            description TEXT,
+            requirements TEXT, -- JSON array
+            skills TEXT, -- JSON array
+            benefits TEXT, -- JSON array
+            remote_friendly BOOLEAN DEFAULT FALSE,
+            is_active BOOLEAN DEFAULT TRUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            application_deadline TIMESTAMP,
+            views INTEGER DEFAULT 0,
+            applications_count INTEGER DEFAULT 0
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS job_applications (
+            id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            job_id TEXT NOT NULL,
+            status TEXT DEFAULT 'pending', -- pending, reviewed, interviewed, hired, rejected
+            cover_letter TEXT,
+            resume_content TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            notes TEXT,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (job_id) REFERENCES jobs (id),
+            UNIQUE(user_id, job_id)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS job_bookmarks (
+            id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            job_id TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (job_id) REFERENCES jobs (id),
+            UNIQUE(user_id, job_id)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS job_recommendations (
+            id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            job_id TEXT NOT NULL,
+            match_score REAL,
+            reasons TEXT, -- JSON array
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (job_id) REFERENCES jobs (id),
+            UNIQUE(user_id, job_id)
+        )
+    ''')
+
+def create_job_indexes(cursor: sqlite3.Cursor) -> None:
+    for name, table, columns in JOB_INDEXES:
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table}({columns})")
+
+def drop_legacy_applications(cursor: sqlite3.Cursor) -> None:
+    """Move rows of the old ``applications`` table into ``job_applications``"""
+    if "applications" not in _tables(cursor):
+        return
+    cursor.execute('''
+        INSERT OR IGNORE INTO job_applications (id, user_id, job_id, status, applied_at)
+        SELECT id, user_id, job_id, status, applied_at FROM applications
+    ''')
+    cursor.execute("DROP TABLE applications")
+
+def create_job_search_index(cursor: sqlite3.Cursor) -> None:
+    """FTS5 index over the searchable job columns, kept in sync by triggers.
+
+    Rows are keyed by the jobs rowid and hold the folded text of
+    ``SEARCH_FIELDS``. Skipped on SQLite builds without FTS5, where job
+    search falls back to LIKE; ``JobService`` runs it again at startup
+    while the table is missing, so a later build with FTS5 still gets it.
+    """
+    columns = ', '.join(SEARCH_FIELDS)
+    new_values = ', '.join(fold_search_sql(f"new.{field}") for field in SEARCH_FIELDS)
+    try:
+        cursor.execute("SAVEPOINT job_search_index")
+        cursor.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS jobs_fts USING fts5(
+                {columns},
+                tokenize = 'unicode61 remove_diacritics 2'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        cursor.execute("ROLLBACK TO job_search_index")
+        cursor.execute("RELEASE job_search_index")
+        logger.warning(f"⚠️ Full-text search unavailable, using LIKE search: {e}")
+        return
+
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS jobs_fts_insert AFTER INSERT ON jobs BEGIN
+            INSERT INTO jobs_fts (rowid, {columns}) VALUES (new.rowid, {new_values});
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS jobs_fts_delete AFTER DELETE ON jobs BEGIN
+            DELETE FROM jobs_fts WHERE rowid = old.rowid;
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS jobs_fts_update AFTER UPDATE OF {columns} ON jobs BEGIN
+            DELETE FROM jobs_fts WHERE rowid = old.rowid;
+            INSERT INTO jobs_fts (rowid, {columns}) VALUES (new.rowid, {new_values});
+        END
+    ''')
+
+    # Index jobs written before the search table existed
+    cursor.execute("DELETE FROM jobs_fts")
+    cursor.execute(f'''
+        INSERT INTO jobs_fts (rowid, {columns})
+        SELECT rowid, {', '.join(fold_search_sql(field) for field in SEARCH_FIELDS)} FROM jobs
+    ''')
+    cursor.execute("RELEASE job_search_index")
+
+def create_ai_tables(cursor: sqlite3.Cursor) -> None:
+    """Chat history, uploaded documents and AI insights of the coach"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS chat_history (
+            id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            message TEXT NOT NULL,
+            response TEXT NOT NULL,
+            context TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_documents (
+            id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            content TEXT NOT NULL,
+            file_type TEXT,
+            uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ai_insights (
+            id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            insight_type TEXT NOT NULL,
+            insight_data TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+def create_ai_response_cache(cursor: sqlite3.Cursor) -> None:
+    """Content-addressed Gemini responses (see ``AIResponseCache``)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ai_response_cache (
+            key TEXT PRIMARY KEY,
+            response TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            expires_at REAL NOT NULL,
+            last_used REAL NOT NULL,
+            hits INTEGER DEFAULT 0
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ai_response_cache_last_used ON ai_response_cache (last_used)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ai_response_cache_expires ON ai_response_cache (expires_at)")
+
+def create_ai_rate_limits(cursor: sqlite3.Cursor) -> None:
+    """Token buckets shared by every instance when AI_SHARED_RATE_LIMITS is on"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ai_rate_limits (
+            name TEXT PRIMARY KEY,
+            level REAL NOT NULL,
+            updated REAL NOT NULL
+        )
+    ''')
+
+def create_chat_history_index(cursor: sqlite3.Cursor) -> None:
+    """A user's chat history, newest first (history endpoint and chat memory)"""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_chat_history_user_created ON chat_history(user_id, created_at)")
+
+def create_recommendation_runs(cursor: sqlite3.Cursor) -> None:
+    """Users whose recommendations were computed, including those left with none"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS recommendation_runs (
+            user_id TEXT PRIMARY KEY,
+            computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        INSERT OR IGNORE INTO recommendation_runs (user_id)
+        SELECT DISTINCT user_id FROM job_recommendations
+    ''')
+
+# (version, name, step); append new steps, never edit or reorder applied ones
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Cursor], None]]] = [
+    (1, "core_tables", create_core_tables),
+    (2, "revoked_tokens", create_revoked_tokens),
+    (3, "job_tables", create_job_tables),
+    (4, "job_indexes", create_job_indexes),
+    (5, "drop_legacy_applications", drop_legacy_applications),
+    (6, "job_search_index", create_job_search_index),
+    (7, "ai_tables", create_ai_tables),
+    (8, "ai_response_cache", create_ai_response_cache),
+    (9, "ai_rate_limits", create_ai_rate_limits),
+    (10, "chat_history_index", create_chat_history_index),
+    (11, "recommendation_runs", create_recommendation_runs),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def schema_version(cursor: sqlite3.Cursor) -> int:
+    """Highest applied migration, 0 for a database that predates versioning"""
+    try:
+        cursor.execute("SELECT MAX(version) FROM schema_version")
+    except sqlite3.OperationalError:
+        return 0
+    return cursor.fetchone()[0] or 0
+
+def apply_migrations(conn: sqlite3.Connection) -> List[int]:
+    """Apply pending migrations, each in its own transaction; returns their versions.
+
+    Every step is written to be safe on databases whose tables were created
+    by the unversioned startup code, so those are brought under version
+    control by simply running all steps once.
+    """
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+
+    applied = []
+    for version, name, step in MIGRATIONS:
+        # IMMEDIATE takes the write lock, so another process can't run the same step
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            if schema_version(cursor) >= version:
+                conn.rollback()
+                continue
+            step(cursor)
+            cursor.execute("INSERT INTO schema_version (version, name) VALUES (?, ?)", (version, name))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logger.error(f"❌ Migration {version} ({name}) failed")
+            raise
+        applied.append(version)
+        logger.info(f"✅ Applied migration {version}: {name}")
+    return applied
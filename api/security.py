@@ -0,0 +1,168 @@
+"""
+Password hashing for Up Hera
+Salted PBKDF2-SHA256 running on a dedicated thread pool
+"""
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+from api.config import settings
+
+logger = logging.getLogger(__name__)
+
+class PasswordHasher:
+    """Slow, salted password hashing kept off the event loop.
+
+    Hashes are stored as ``pbkdf2_sha256$<iterations>$<salt>$<hash>``, so the
+    cost can be raised later without breaking existing accounts: ``check``
+    reports when a stored hash is weaker than the current settings (including
+    the legacy unsalted SHA-256 hex digests) and returns its replacement.
+
+    ``hashlib.pbkdf2_hmac`` releases the GIL, so the ``*_async`` methods run
+    it on a thread pool of its own. Logins therefore neither block the event
+    loop nor occupy the database executor's workers.
+    """
+
+    algorithm = "pbkdf2_sha256"
+
+    def __init__(self, iterations: int = 600000, max_workers: int = 2, salt_bytes: int = 16):
+        self.iterations = max(1, int(iterations))
+        self.max_workers = max(1, int(max_workers))
+        self.salt_bytes = salt_bytes
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "hashes": 0, "verifications": 0, "rehashes": 0,
+            "derivations": 0, "total_ms": 0.0, "max_ms": 0.0,
+        }
+        self._dummy_hash: Optional[str] = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="uphera-hasher"
+                )
+            return self._executor
+
+    def _derive(self, password: str, salt: bytes, iterations: int) -> bytes:
+        started = time.perf_counter()
+        derived = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, iterations)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._stats_lock:
+            self._stats["derivations"] += 1
+            self._stats["total_ms"] += elapsed_ms
+            self._stats["max_ms"] = max(self._stats["max_ms"], elapsed_ms)
+        return derived
+
+    @staticmethod
+    def _b64(raw: bytes) -> str:
+        return base64.b64encode(raw).decode().rstrip("=")
+
+    @staticmethod
+    def _unb64(text: str) -> bytes:
+        return base64.b64decode(text + "=" * (-len(text) % 4))
+
+    @staticmethod
+    def is_legacy(encoded: str) -> bool:
+        """Unsalted SHA-256 hex digests written before PBKDF2 was introduced"""
+        return len(encoded) == 64 and "$" not in encoded
+
+    def hash(self, password: str) -> str:
+        """Hash a password with a fresh salt at the configured cost"""
+        salt = os.urandom(self.salt_bytes)
+        derived = self._derive(password, salt, self.iterations)
+        with self._stats_lock:
+            self._stats["hashes"] += 1
+        return f"{self.algorithm}${self.iterations}${self._b64(salt)}${self._b64(derived)}"
+
+    def verify(self, password: str, encoded: str) -> bool:
+        """Check a password against a stored hash in constant time"""
+        with self._stats_lock:
+            self._stats["verifications"] += 1
+        if not encoded:
+            return False
+        if self.is_legacy(encoded):
+            legacy = hashlib.sha256(password.encode()).hexdigest()
+            return hmac.compare_digest(legacy, encoded)
+        try:
+            algorithm, iterations, salt, expected = encoded.split("$")
+            if algorithm != self.algorithm:
+                return False
+            derived = self._derive(password, self._unb64(salt), int(iterations))
+            return hmac.compare_digest(derived, self._unb64(expected))
+        except (ValueError, TypeError):
+            return False
+
+    def needs_rehash(self, encoded: str) -> bool:
+        """Whether a stored hash is legacy or weaker than the current cost"""
+        if self.is_legacy(encoded):
+            return True
+        try:
+            algorithm, iterations, _, _ = encoded.split("$")
+            return algorithm != self.algorithm or int(iterations) < self.iterations
+        except ValueError:
+            return True
+
+    def check(self, password: str, encoded: str) -> Tuple[bool, Optional[str]]:
+        """Verify a password, returning ``(valid, new_hash)``.
+
+        ``new_hash`` is set when the password matched but the stored hash
+        should be upgraded; the caller is responsible for persisting it.
+        """
+        if not self.verify(password, encoded):
+            return False, None
+        if not self.needs_rehash(encoded):
+            return True, None
+        with self._stats_lock:
+            self._stats["rehashes"] += 1
+        return True, self.hash(password)
+
+    def check_unknown_user(self, password: str) -> Tuple[bool, Optional[str]]:
+        """Burn the same KDF cost as a real check so unknown emails aren't distinguishable by timing"""
+        if self._dummy_hash is None:
+            self._dummy_hash = self.hash(os.urandom(8).hex())
+        self.verify(password, self._dummy_hash)
+        return False, None
+
+    async def hash_async(self, password: str) -> str:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), self.hash, password)
+
+    async def check_async(self, password: str, encoded: Optional[str]) -> Tuple[bool, Optional[str]]:
+        loop = asyncio.get_running_loop()
+        if encoded is None:
+            return await loop.run_in_executor(self._get_executor(), self.check_unknown_user, password)
+        return await loop.run_in_executor(self._get_executor(), self.check, password, encoded)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            derivations = self._stats["derivations"]
+            return {
+                "algorithm": self.algorithm,
+                "iterations": self.iterations,
+                "workers": self.max_workers,
+                "avg_ms": round(self._stats["total_ms"] / derivations, 3) if derivations else 0.0,
+                **{k: round(v, 3) if isinstance(v, float) else v for k, v in self._stats.items()},
+            }
+
+    def shutdown(self) -> None:
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+password_hasher = PasswordHasher(
+    iterations=settings.PASSWORD_HASH_ITERATIONS,
+    max_workers=settings.PASSWORD_HASHER_WORKERS
+)
@@ -1 +1,61 @@
-# Services module 
\ No newline at end of file
+# Services module
+
+import importlib
+import threading
+from typing import Any, Set
+
+# Profile changes waiting for the recommendation refresher; queueing them here
+# keeps profile updates from importing the matcher
+_dirty_users: Set[str] = set()
+_dirty_users_lock = threading.Lock()
+
+def queue_dirty_user(user_id: str) -> None:
+    with _dirty_users_lock:
+        _dirty_users.add(user_id)
+
+def take_dirty_users() -> Set[str]:
+    with _dirty_users_lock:
+        users = set(_dirty_users)
+        _dirty_users.clear()
+    return users
+
+class LazyService:
+    """Stand-in for a service module's global, imported on first attribute access.
+
+    Modules such as the job matcher pull in scikit-learn and numpy, which
+    would otherwise dominate a serverless cold start. ``loaded`` reports
+    whether the real object exists yet without importing it.
+    """
+
+    def __init__(self, module: str, name: str):
+        object.__setattr__(self, "_module", f"{__name__}.{module}")
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_target", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    @property
+    def loaded(self) -> bool:
+        return self._target is not None
+
+    def resolve(self) -> Any:
+        target = self._target
+        if target is None:
+            with self._lock:
+                target = self._target
+                if target is None:
+                    target = getattr(importlib.import_module(self._module), self._name)
+                    object.__setattr__(self, "_target", target)
+        return target
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self.resolve(), attr)
+
+    def __setattr__(self, attr: str, value: Any) -> None:
+        setattr(self.resolve(), attr, value)
+
+    def __call__(self, *args: Any, **kwargs: Any) -> Any:
+        return self.resolve()(*args, **kwargs)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self.loaded else "not loaded"
+        return f"<LazyService {self._module}.{self._name} ({state})>"
@@ -3,13 +3,22 @@ AI Job Matching Service
 Cosine similarity + rule-based boosts for accurate job matching
 """
 
+import hashlib
+import logging
+import os
+import threading
+from contextlib import contextmanager
 import numpy as np
+from scipy import sparse
+from sklearn.base import clone
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 import re
-from typing import Dict, List, Any, Tuple
+from typing import Callable, Dict, Iterator, List, Any, Optional, Set, Tuple
 import json
 
+logger = logging.getLogger(__name__)
+
 class AIMatchingService:
     def __init__(self):
         self.vectorizer = TfidfVectorizer(
@@ -67,6 +76,32 @@ class AIMatchingService:
             'antalya': 1.0,
             'remote': 1.1
         }
+        
+        # Bootcamp program -> job keywords
+        self.program_keywords = {
+            'frontend development': ['frontend', 'react', 'vue', 'angular', 'javascript', 'typescript', 'css', 'html'],
+            'backend development': ['backend', 'python', 'django', 'fastapi', 'node.js', 'express', 'java', 'spring'],
+            'data science': ['data', 'machine learning', 'python', 'pandas', 'numpy', 'tensorflow', 'scikit-learn'],
+            'mobile development': ['mobile', 'react native', 'flutter', 'swift', 'kotlin', 'ios', 'android'],
+            'full stack development': ['full stack', 'frontend', 'backend', 'react', 'node.js', 'python']
+        }
+        
+        # Weighted combination of the individual scores
+        self.score_weights = {
+            'skill_similarity': 0.35,
+            'skill_boost': 0.25,
+            'experience_match': 0.15,
+            'location_match': 0.10,
+            'program_relevance': 0.15
+        }
+        
+        # Persisted job feature index, see load_job_index
+        self.job_index: Optional["BatchMatchingEngine"] = None
+        self.job_index_path: Optional[str] = None
+        self._job_source: Any = None
+        self._index_lock = threading.RLock()
+        # Job changes since the index was last written to job_index_path
+        self._index_dirty = False
 
     def preprocess_text(self, text: str) -> str:
         """Text preprocessing for better matching"""
@@ -166,13 +201,7 @@ class AIMatchingService:
 
     def calculate_program_relevance(self, user_program: str, job_title: str, job_description: str) -> float:
         """Calculate bootcamp program relevance to job"""
-        program_keywords = {
-            'frontend development': ['frontend', 'react', 'vue', 'angular', 'javascript', 'typescript', 'css', 'html'],
-            'backend development': ['backend', 'python', 'django', 'fastapi', 'node.js', 'express', 'java', 'spring'],
-            'data science': ['data', 'machine learning', 'python', 'pandas', 'numpy', 'tensorflow', 'scikit-learn'],
-            'mobile development': ['mobile', 'react native', 'flutter', 'swift', 'kotlin', 'ios', 'android'],
-            'full stack development': ['full stack', 'frontend', 'backend', 'react', 'node.js', 'python']
-        }
+        program_keywords = self.program_keywords
         
         user_program_lower = user_program.lower()
         job_text = f"{job_title} {job_description}".lower()
@@ -209,13 +238,7 @@ class AIMatchingService:
         program_relevance = self.calculate_program_relevance(user_program, job_title, job_description)
         
         # Weighted combination
-        weights = {
-            'skill_similarity': 0.35,
-            'skill_boost': 0.25,
-            'experience_match': 0.15,
-            'location_match': 0.10,
-            'program_relevance': 0.15
-        }
+        weights = self.score_weights
         
         final_score = (
             skill_similarity * weights['skill_similarity'] +
@@ -232,12 +255,16 @@ class AIMatchingService:
 
     def rank_jobs(self, user_profile: Dict[str, Any], jobs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Rank jobs by match score"""
-        ranked_jobs = []
+        if not jobs:
+            return []
         
-        for job in jobs:
-            match_score = self.calculate_match_score(user_profile, job)
+        # One vectorizer fit and one sparse product for the whole list
+        scores = BatchMatchingEngine(self).fit(jobs).score(user_profile)
+        
+        ranked_jobs = []
+        for job, match_score in zip(jobs, scores):
             job_with_score = job.copy()
-            job_with_score['match_score'] = match_score
+            job_with_score['match_score'] = float(match_score)
             ranked_jobs.append(job_with_score)
         
         # Sort by match score (highest first)
@@ -245,5 +272,677 @@ class AIMatchingService:
         
         return ranked_jobs
 
+    def load_job_index(self, path: Optional[str], job_source: Any) -> "BatchMatchingEngine":
+        """Load the persisted job feature index and bring it up to date.
+
+        ``job_source`` is the ``JobService``: only jobs whose ``updated_at``
+        differs from the stored index are read back, and the index is rebuilt
+        from scratch when it is missing, built with another configuration or
+        has drifted too far from its vocabulary. Without a ``path`` the index
+        is only built in memory.
+        """
+        with self._index_lock:
+            self.job_index_path = path
+            self._job_source = job_source
+            versions = job_source.get_job_versions()
+            fetch = lambda ids: [job_matching_input(job) for job in job_source.get_jobs_by_ids(ids)]
+            
+            index = BatchMatchingEngine.load(path, self) if path else None
+            changed = True
+            if index is None:
+                index = BatchMatchingEngine(self).fit(fetch(list(versions)))
+            else:
+                changed = index.sync(versions, fetch)
+            if index.needs_refit():
+                index = BatchMatchingEngine(self).fit(fetch(list(versions)))
+                changed = True
+            if changed and path:
+                index.save(path)
+            
+            self.job_index = index
+            self._index_dirty = False
+            logger.info(f"✅ Job feature index ready ({len(index)} jobs)")
+            return index
+
+    def on_job_changed(self, event: str, job: Dict[str, Any]) -> None:
+        """``JobService`` listener keeping the feature index in sync.
+
+        Only the in-memory index changes here; ``save_job_index`` writes it
+        out later, off the job write's request.
+        """
+        with self._index_lock:
+            index = self.job_index
+            if index is None:
+                return
+            if event == "deleted" or not job.get("is_active", True):
+                index.remove(job["id"])
+            else:
+                index.upsert(job_matching_input(job))
+            
+            if index.needs_refit() and self._job_source is not None:
+                versions = self._job_source.get_job_versions()
+                jobs = self._job_source.get_jobs_by_ids(list(versions))
+                self.job_index = BatchMatchingEngine(self).fit([job_matching_input(j) for j in jobs])
+            self._index_dirty = True
+
+    def save_job_index(self) -> bool:
+        """Write the index to ``job_index_path`` if jobs changed since it was last written"""
+        with self._index_lock:
+            if not self._index_dirty or self.job_index is None or not self.job_index_path:
+                return False
+            self.job_index.save(self.job_index_path)
+            self._index_dirty = False
+            return True
+
+    @contextmanager
+    def locked_job_index(self, job_source: Any) -> Iterator["BatchMatchingEngine"]:
+        """The feature index, held so job changes wait until the caller is done with it.
+
+        Builds the index in memory if this process has not loaded it yet.
+        """
+        with self._index_lock:
+            yield self.job_index or self.load_job_index(None, job_source)
+
+    def score_indexed_jobs(self, user_profile: Dict[str, Any]) -> Dict[str, float]:
+        """Match scores for every indexed job, computed from stored features only"""
+        with self._index_lock:
+            index = self.job_index
+            if index is None:
+                return {}
+            return dict(zip(index.job_ids, index.score(user_profile).tolist()))
+
+class BatchMatchingEngine:
+    """Scores users against a whole job corpus at once.
+
+    The TF-IDF vocabulary is fitted once over every job's requirements and the
+    job vectors are kept as a sparse (jobs x terms) matrix, so skill similarity
+    for one user or many users is a single sparse matrix product. Everything
+    else the rule based boosts of ``calculate_match_score`` need is reduced to
+    per-job features when a job is added (requirement ids and positions,
+    experience weight, location code, program keyword hits), so scoring works
+    on NumPy arrays only and gives the same values as the per-job methods.
+
+    The engine doubles as the persisted job feature index: ``upsert`` and
+    ``remove`` keep it current as jobs change, and ``save``/``load`` store it
+    as an ``.npz`` file. ``upsert`` rewrites a changed job's matrix rows in
+    place, while new jobs are queued and stacked onto the matrices in one
+    pass when the index is next read. Jobs added after ``fit`` are vectorised with the
+    original vocabulary; ``needs_refit`` reports when enough of the corpus has
+    changed that the vocabulary should be rebuilt.
+    """
+
+    VERSION = 1
+
+    def __init__(self, matcher: AIMatchingService, refit_ratio: float = 0.2, refit_min: int = 50):
+        self.matcher = matcher
+        self.refit_ratio = refit_ratio
+        self.refit_min = refit_min
+        self.job_ids: List[str] = []
+        self.versions: List[Optional[str]] = []
+        self.upserts_since_fit = 0
+        self.vectorizer: Optional[TfidfVectorizer] = None
+        self._rows: Dict[str, int] = {}
+        self._requirement_index: Dict[str, int] = {}
+        self._location_codes: Dict[str, int] = {}
+        self._programs = list(matcher.program_keywords)
+        self.stats = {"pruned": 0, "full_scans": 0}
+        self._assemble([], [])
+
+    def __len__(self) -> int:
+        return len(self.job_ids)
+
+    def __contains__(self, job_id: str) -> bool:
+        return job_id in self._rows
+
+    # Building features
+
+    def _requirements(self, job: Dict[str, Any]) -> List[str]:
+        return [str(req).lower() for req in (job.get('required_skills') or [])]
+
+    def _document(self, requirements: List[str]) -> str:
+        return ' '.join(self.matcher.preprocess_text(req) for req in requirements)
+
+    @staticmethod
+    def _grams(text: str) -> Set[str]:
+        """1- to 3-character substrings, the keys of the requirement n-gram index"""
+        return {text[i:i + n] for n in (1, 2, 3) for i in range(len(text) - n + 1)}
+
+    def _register_requirement(self, req: str) -> int:
+        col = len(self._requirement_index)
+        self._requirement_index[req] = col
+        if self._requirement_grams is not None:
+            for gram in self._grams(req):
+                self._requirement_grams.setdefault(gram, set()).add(col)
+        return col
+
+    def _gram_index(self) -> Dict[str, Set[int]]:
+        """Inverted index from requirement n-grams to requirement ids, built on first use"""
+        if self._requirement_grams is None:
+            grams: Dict[str, Set[int]] = {}
+            for req, col in self._requirement_index.items():
+                for gram in self._grams(req):
+                    grams.setdefault(gram, set()).add(col)
+            self._requirement_grams = grams
+        return self._requirement_grams
+
+    def _lookup_names(self) -> Tuple[List[str], List[str]]:
+        # Requirement/location ids only ever grow, so the reverse lookups stay valid until they do
+        names = self._names
+        if names is None or len(names[0]) != len(self._requirement_index) or len(names[1]) != len(self._location_codes):
+            names = self._names = (list(self._requirement_index), list(self._location_codes))
+        return names
+
+    def matching_requirements(self, skill: str) -> Set[int]:
+        """Requirement ids the partial-match rule accepts for ``skill``.
+
+        Same result as testing ``skill in req or req in skill`` against every
+        requirement, but via the n-gram index: requirements containing the
+        skill must contain all of its n-grams, and requirements contained in
+        the skill are among its substrings.
+        """
+        skill = skill.lower()
+        requirements, _ = self._lookup_names()
+        if not skill:
+            return set(range(len(requirements)))
+        
+        grams = self._gram_index()
+        size = min(3, len(skill))
+        postings = sorted(
+            (grams.get(skill[i:i + size], set()) for i in range(len(skill) - size + 1)), key=len
+        )
+        matches = {col for col in postings[0].intersection(*postings[1:]) if skill in requirements[col]}
+        
+        for start in range(len(skill) + 1):
+            for end in range(start, len(skill) + 1):
+                col = self._requirement_index.get(skill[start:end])
+                if col is not None:
+                    matches.add(col)
+        return matches
+
+    def _featurize(self, job: Dict[str, Any], fallback_id: Optional[str] = None) -> Dict[str, Any]:
+        """Reduce a job to the inputs scoring needs, registering new requirement/location ids"""
+        matcher = self.matcher
+        requirements = self._requirements(job)
+        
+        positions: Dict[int, int] = {}
+        for position, req in enumerate(requirements):
+            col = self._requirement_index.get(req)
+            if col is None:
+                col = self._register_requirement(req)
+            positions.setdefault(col, position + 1)
+        
+        location = str(job.get('location') or 'Türkiye').lower()
+        text = f"{job.get('title', '')} {job.get('description', '')}".lower()
+        return {
+            "id": str(job.get('id') or fallback_id or len(self.job_ids)),
+            "version": job.get('updated_at'),
+            "positions": positions,
+            "requirement_count": len(requirements),
+            "experience": matcher.experience_weights.get(str(job.get('experience_level') or 'entry').lower(), 1.0),
+            "location": self._location_codes.setdefault(location, len(self._location_codes)),
+            "location_weight": matcher.location_weights.get(location, 1.0),
+            "remote": bool(job.get('remote_friendly', False)),
+            "programs": [
+                min(sum(1 for keyword in keywords if keyword in text) / len(keywords), 1.0)
+                for keywords in matcher.program_keywords.values()
+            ],
+        }
+
+    def _assemble(self, features: List[Dict[str, Any]], vectors: Any) -> None:
+        """Turn per-job features into the matrices and arrays used for scoring"""
+        rows = len(features)
+        self.job_ids = [feature["id"] for feature in features]
+        self.versions = [feature["version"] for feature in features]
+        self._rows = {job_id: row for row, job_id in enumerate(self.job_ids)}
+        vocabulary_size = len(self.vectorizer.vocabulary_) if self.vectorizer is not None else 0
+        self.job_matrix = sparse.csr_matrix(vectors) if rows and vocabulary_size else sparse.csr_matrix((rows, vocabulary_size))
+        
+        self._positions = self._position_matrix(features)
+        self._appended: List[Tuple[Dict[str, Any], Any]] = []
+        self._positions_csc: Optional[sparse.csc_matrix] = None
+        self._job_matrix_csc: Optional[sparse.csc_matrix] = None
+        self._names: Optional[Tuple[List[str], List[str]]] = None
+        self._requirement_grams: Optional[Dict[str, Set[int]]] = None
+        self._requirement_counts = np.array([f["requirement_count"] for f in features], dtype=np.float64)
+        self._job_experience = np.array([f["experience"] for f in features], dtype=np.float64)
+        self._job_location = np.array([f["location"] for f in features], dtype=np.int64)
+        self._job_location_weight = np.array([f["location_weight"] for f in features], dtype=np.float64)
+        self._remote = np.array([f["remote"] for f in features], dtype=bool)
+        self._program_matrix = np.array(
+            [f["programs"] for f in features], dtype=np.float64
+        ).reshape(rows, len(self._programs))
+
+    def _position_matrix(self, features: List[Dict[str, Any]]) -> sparse.csr_matrix:
+        """(jobs x requirements) matrix of each requirement's 1-based position in a job"""
+        row_ids = [row for row, feature in enumerate(features) for _ in feature["positions"]]
+        cols = [col for feature in features for col in feature["positions"]]
+        positions = [pos for feature in features for pos in feature["positions"].values()]
+        return sparse.csr_matrix(
+            (np.array(positions, dtype=np.float64), (row_ids, cols)),
+            shape=(len(features), len(self._requirement_index))
+        )
+
+    def _vectorize(self, requirements: List[List[str]]) -> Any:
+        documents = [self._document(reqs) for reqs in requirements]
+        if self.vectorizer is None:
+            return sparse.csr_matrix((len(documents), 0))
+        return self.vectorizer.transform(documents)
+
+    def fit(self, jobs: List[Dict[str, Any]]) -> "BatchMatchingEngine":
+        """Build the vocabulary, job vectors and per-job features from scratch"""
+        jobs = list(jobs)
+        self._requirement_index = {}
+        self._location_codes = {}
+        self._requirement_grams = None
+        requirements = [self._requirements(job) for job in jobs]
+        
+        # Skill similarity: one fit over the corpus instead of one per job
+        self.vectorizer = clone(self.matcher.vectorizer)
+        try:
+            vectors = self.vectorizer.fit_transform([self._document(reqs) for reqs in requirements])
+        except ValueError:
+            # Empty vocabulary (no job lists any usable requirement)
+            self.vectorizer = None
+            vectors = None
+        
+        self._assemble([self._featurize(job, str(row)) for row, job in enumerate(jobs)], vectors)
+        self.upserts_since_fit = 0
+        return self
+
+    # Incremental updates
+
+    def upsert(self, job: Dict[str, Any]) -> None:
+        """Add a job or replace its features in place"""
+        feature = self._featurize(job)
+        vector = sparse.csr_matrix(self._vectorize([self._requirements(job)]))
+        
+        row = self._rows.get(feature["id"])
+        if row is None:
+            # Stacked with any other new jobs when the index is next read
+            self._rows[feature["id"]] = len(self.job_ids)
+            self.job_ids.append(feature["id"])
+            self.versions.append(feature["version"])
+            self._appended.append((feature, vector))
+        else:
+            self._stack_appended()
+            positions = self._position_matrix([feature])
+            self.versions[row] = feature["version"]
+            self.job_matrix = self._replace_row(self.job_matrix, row, vector)
+            self._positions = self._replace_row(self._positions, row, positions)
+            self._positions_csc = None
+            self._job_matrix_csc = None
+            self._requirement_counts[row] = feature["requirement_count"]
+            self._job_experience[row] = feature["experience"]
+            self._job_location[row] = feature["location"]
+            self._job_location_weight[row] = feature["location_weight"]
+            self._remote[row] = feature["remote"]
+            self._program_matrix[row] = feature["programs"]
+        self.upserts_since_fit += 1
+
+    @staticmethod
+    def _replace_row(matrix: sparse.csr_matrix, row: int, values: sparse.csr_matrix) -> sparse.csr_matrix:
+        """``matrix`` with ``row`` set to the one-row ``values``, widened to its column count"""
+        values.sort_indices()
+        start, end = matrix.indptr[row], matrix.indptr[row + 1]
+        shape = (matrix.shape[0], max(matrix.shape[1], values.shape[1]))
+        if end - start == values.nnz and shape == matrix.shape:
+            # Same number of entries: overwrite them where they are
+            matrix.data[start:end] = values.data
+            matrix.indices[start:end] = values.indices
+            return matrix
+        indptr = matrix.indptr.astype(np.int64)
+        indptr[row + 1:] += values.nnz - (end - start)
+        return sparse.csr_matrix((
+            np.concatenate([matrix.data[:start], values.data, matrix.data[end:]]),
+            np.concatenate([matrix.indices[:start], values.indices, matrix.indices[end:]]),
+            indptr
+        ), shape=shape)
+
+    def _stack_appended(self) -> None:
+        """Stack the jobs ``upsert`` queued onto the matrices and arrays in one pass"""
+        if not self._appended:
+            return
+        features = [feature for feature, _ in self._appended]
+        vectors = [vector for _, vector in self._appended]
+        self._appended = []
+        # New requirement ids widen the positions matrix
+        self._positions.resize((self._positions.shape[0], len(self._requirement_index)))
+        self.job_matrix = sparse.vstack([self.job_matrix] + vectors, format='csr')
+        self._positions = sparse.vstack([self._positions, self._position_matrix(features)], format='csr')
+        self._positions_csc = None
+        self._job_matrix_csc = None
+        self._requirement_counts = np.concatenate([self._requirement_counts, [f["requirement_count"] for f in features]])
+        self._job_experience = np.concatenate([self._job_experience, [f["experience"] for f in features]])
+        self._job_location = np.concatenate([self._job_location, [f["location"] for f in features]]).astype(np.int64)
+        self._job_location_weight = np.concatenate([self._job_location_weight, [f["location_weight"] for f in features]])
+        self._remote = np.concatenate([self._remote, [f["remote"] for f in features]]).astype(bool)
+        self._program_matrix = np.vstack([self._program_matrix, [f["programs"] for f in features]])
+
+    def remove(self, job_id: str) -> bool:
+        """Drop a job from the index"""
+        row = self._rows.get(job_id)
+        if row is None:
+            return False
+        self._stack_appended()
+        keep = np.arange(len(self.job_ids)) != row
+        del self.job_ids[row]
+        del self.versions[row]
+        self._rows = {job_id: index for index, job_id in enumerate(self.job_ids)}
+        self.job_matrix = self.job_matrix[keep]
+        self._positions = self._positions[keep]
+        self._positions_csc = None
+        self._job_matrix_csc = None
+        self._requirement_counts = self._requirement_counts[keep]
+        self._job_experience = self._job_experience[keep]
+        self._job_location = self._job_location[keep]
+        self._job_location_weight = self._job_location_weight[keep]
+        self._remote = self._remote[keep]
+        self._program_matrix = self._program_matrix[keep]
+        return True
+
+    def sync(self, versions: Dict[str, Optional[str]], fetch_jobs: Callable[[List[str]], List[Dict[str, Any]]]) -> bool:
+        """Bring the index in line with ``{job_id: updated_at}``, fetching only changed jobs"""
+        removed = [job_id for job_id in self.job_ids if job_id not in versions]
+        for job_id in removed:
+            self.remove(job_id)
+        
+        changed = [
+            job_id for job_id, version in versions.items()
+            if job_id not in self._rows or self.versions[self._rows[job_id]] != version
+        ]
+        if changed:
+            for job in fetch_jobs(changed):
+                self.upsert(job)
+        return bool(removed or changed)
+
+    def subset(self, job_ids: List[str]) -> "BatchMatchingEngine":
+        """Engine scoring only the given (indexed) jobs, sharing this one's vocabulary"""
+        return self._subset_rows(np.array([self._rows[job_id] for job_id in job_ids], dtype=np.int64))
+
+    def _subset_rows(self, rows: np.ndarray) -> "BatchMatchingEngine":
+        self._stack_appended()
+        engine = BatchMatchingEngine(self.matcher)
+        engine.vectorizer = self.vectorizer
+        engine.job_ids = [self.job_ids[row] for row in rows]
+        engine.versions = [self.versions[row] for row in rows]
+        engine._rows = {job_id: index for index, job_id in enumerate(engine.job_ids)}
+        engine._requirement_index = self._requirement_index
+        engine._requirement_grams = self._gram_index()
+        engine._location_codes = self._location_codes
+        engine.job_matrix = self.job_matrix[rows]
+        engine._positions = self._positions[rows]
+        engine._requirement_counts = self._requirement_counts[rows]
+        engine._job_experience = self._job_experience[rows]
+        engine._job_location = self._job_location[rows]
+        engine._job_location_weight = self._job_location_weight[rows]
+        engine._remote = self._remote[rows]
+        engine._program_matrix = self._program_matrix[rows]
+        return engine
+
+    def describe(self, job_id: str) -> Dict[str, Any]:
+        """Indexed facts about a job, used to explain a match"""
+        self._stack_appended()
+        row = self._rows[job_id]
+        requirements, locations = self._lookup_names()
+        columns = self._positions[row].indices
+        return {
+            "requirements": [requirements[col] for col in columns],
+            "location": locations[self._job_location[row]],
+            "remote": bool(self._remote[row]),
+        }
+
+    def candidate_rows(self, user_skills: List[str]) -> np.ndarray:
+        """Rows of jobs sharing a requirement (partial-match rule) or a TF-IDF term with the user"""
+        if not user_skills or not self.job_ids:
+            return np.zeros(0, dtype=np.int64)
+        self._stack_appended()
+        if self._positions_csc is None:
+            self._positions_csc = self._positions.tocsc()
+        
+        # CSC column slices list the rows holding a requirement/term without a full scan
+        found = []
+        columns = sorted(set().union(*(self.matching_requirements(skill) for skill in user_skills)))
+        if columns:
+            found.append(self._positions_csc[:, columns].indices)
+        if self.vectorizer is not None:
+            document = ' '.join(self.matcher.preprocess_text(skill) for skill in user_skills)
+            terms = self.vectorizer.transform([document]).indices
+            if len(terms):
+                if self._job_matrix_csc is None:
+                    self._job_matrix_csc = self.job_matrix.tocsc()
+                found.append(self._job_matrix_csc[:, terms].indices)
+        if not found:
+            return np.zeros(0, dtype=np.int64)
+        return np.unique(np.concatenate(found)).astype(np.int64)
+
+    def _skill_free_bound(self, user_profile: Dict[str, Any]) -> float:
+        """Highest score a job sharing no skill with the user can reach"""
+        matcher = self.matcher
+        weights = matcher.score_weights
+        user_boost = matcher.location_weights.get((user_profile.get('location') or '').lower(), 1.0)
+        best_location = max([1.0, (user_boost + max(matcher.location_weights.values(), default=1.0)) / 2])
+        best_program = 1.0 if (user_profile.get('upschoolProgram') or '').lower() in self._programs else 0.5
+        return 100 * (
+            weights['experience_match'] + weights['location_match'] * best_location +
+            weights['program_relevance'] * best_program
+        )
+
+    def top_k(self, user_profile: Dict[str, Any], k: int) -> List[Tuple[str, float]]:
+        """Best ``k`` jobs for a user, scoring only jobs that share a skill when that is exact.
+
+        Jobs without any skill overlap can score at most ``_skill_free_bound``;
+        if the k-th best candidate reaches it the pruned result is the true
+        top-k, otherwise the whole catalog is scored.
+        """
+        k = min(k, len(self.job_ids))
+        if k <= 0:
+            return []
+        
+        rows = self.candidate_rows(user_profile.get('skills') or [])
+        if len(rows) >= k and len(rows) < len(self.job_ids):
+            scores = self._subset_rows(rows).score(user_profile)
+            best = self._best(scores, k)
+            if scores[best[-1]] >= self._skill_free_bound(user_profile):
+                self.stats["pruned"] += 1
+                return [(self.job_ids[rows[i]], float(scores[i])) for i in best]
+        
+        self.stats["full_scans"] += 1
+        scores = self.score(user_profile)
+        return [(self.job_ids[i], float(scores[i])) for i in self._best(scores, k)]
+
+    @staticmethod
+    def _best(scores: np.ndarray, k: int) -> np.ndarray:
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top], kind="stable")]
+
+    def needs_refit(self) -> bool:
+        """Whether enough jobs were added/updated since ``fit`` to rebuild the vocabulary"""
+        return self.upserts_since_fit > max(self.refit_min, self.refit_ratio * len(self.job_ids))
+
+    # Persistence
+
+    def fingerprint(self) -> str:
+        """Identifies the matcher configuration the features were computed with"""
+        matcher = self.matcher
+        params = {k: v for k, v in matcher.vectorizer.get_params().items() if isinstance(v, (str, int, float, tuple, type(None)))}
+        config = [
+            self.VERSION, params, matcher.skill_weights, matcher.experience_weights,
+            matcher.location_weights, matcher.program_keywords
+        ]
+        return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()
+
+    def save(self, path: str) -> None:
+        """Write the index to ``path`` (.npz) atomically"""
+        self._stack_appended()
+        meta = {
+            "fingerprint": self.fingerprint(),
+            "job_ids": self.job_ids,
+            "versions": self.versions,
+            "requirements": list(self._requirement_index),
+            "locations": list(self._location_codes),
+            "vocabulary": {term: int(col) for term, col in self.vectorizer.vocabulary_.items()} if self.vectorizer else None,
+            "upserts_since_fit": self.upserts_since_fit,
+        }
+        job_matrix = self.job_matrix.tocsr()
+        positions = self._positions.tocsr()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                meta=np.array(json.dumps(meta)),
+                idf=self.vectorizer.idf_ if self.vectorizer else np.zeros(0),
+                job_data=job_matrix.data, job_indices=job_matrix.indices,
+                job_indptr=job_matrix.indptr, job_shape=np.array(job_matrix.shape),
+                pos_data=positions.data, pos_indices=positions.indices,
+                pos_indptr=positions.indptr, pos_shape=np.array(positions.shape),
+                requirement_counts=self._requirement_counts,
+                experience=self._job_experience,
+                location=self._job_location,
+                location_weight=self._job_location_weight,
+                remote=self._remote,
+                programs=self._program_matrix,
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, matcher: AIMatchingService) -> Optional["BatchMatchingEngine"]:
+        """Load an index saved by ``save``; None if missing or built with another configuration"""
+        if not os.path.exists(path):
+            return None
+        engine = cls(matcher)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                meta = json.loads(str(data["meta"]))
+                if meta["fingerprint"] != engine.fingerprint():
+                    return None
+                if meta["vocabulary"] is not None:
+                    params = matcher.vectorizer.get_params()
+                    params.update(vocabulary=meta["vocabulary"], max_features=None)
+                    engine.vectorizer = TfidfVectorizer(**params)
+                    engine.vectorizer.idf_ = data["idf"]
+                engine.job_ids = list(meta["job_ids"])
+                engine.versions = list(meta["versions"])
+                engine._rows = {job_id: row for row, job_id in enumerate(engine.job_ids)}
+                engine._requirement_index = {req: col for col, req in enumerate(meta["requirements"])}
+                engine._location_codes = {loc: code for code, loc in enumerate(meta["locations"])}
+                engine.upserts_since_fit = meta["upserts_since_fit"]
+                engine.job_matrix = sparse.csr_matrix(
+                    (data["job_data"], data["job_indices"], data["job_indptr"]), shape=tuple(data["job_shape"])
+                )
+                engine._positions = sparse.csr_matrix(
+                    (data["pos_data"], data["pos_indices"], data["pos_indptr"]), shape=tuple(data["pos_shape"])
+                )
+                engine._requirement_counts = data["requirement_counts"]
+                engine._job_experience = data["experience"]
+                engine._job_location = data["location"]
+                engine._job_location_weight = data["location_weight"]
+                engine._remote = data["remote"]
+                engine._program_matrix = data["programs"]
+        except (OSError, KeyError, ValueError) as e:
+            logger.warning(f"⚠️ Ignoring unreadable job index {path}: {e}")
+            return None
+        return engine
+
+    # Scoring
+
+    def skill_similarity(self, users_skills: List[List[str]]) -> np.ndarray:
+        """Cosine similarity of each user's skills to every job (users x jobs)"""
+        self._stack_appended()
+        if self.vectorizer is None or not self.job_ids:
+            return np.zeros((len(users_skills), len(self.job_ids)))
+        documents = [
+            ' '.join(self.matcher.preprocess_text(skill) for skill in (skills or [])) for skills in users_skills
+        ]
+        # TF-IDF rows are L2-normalised, so the dot product is the cosine
+        similarity = (self.vectorizer.transform(documents) @ self.job_matrix.T).toarray()
+        return np.clip(similarity, 0.0, 1.0)
+
+    def skill_boost(self, user_skills: List[str]) -> np.ndarray:
+        """Vectorised ``calculate_skill_boost`` for every job"""
+        self._stack_appended()
+        total = np.zeros(len(self.job_ids))
+        if not user_skills or not self._requirement_index:
+            return total
+        if self._positions_csc is None:
+            self._positions_csc = self._positions.tocsc()
+        
+        for skill in user_skills:
+            skill_lower = skill.lower()
+            weight = self.matcher.skill_weights.get(skill_lower, 1.0)
+            matching = sorted(self.matching_requirements(skill_lower))
+            if not matching:
+                continue
+            
+            # The per-job loop stops at the first matching requirement
+            candidates = self._positions_csc[:, matching].tocsr()
+            matched = np.diff(candidates.indptr) > 0
+            first = np.zeros(len(self.job_ids))
+            if matched.any():
+                first[matched] = np.minimum.reduceat(candidates.data, candidates.indptr[:-1][matched])
+            
+            exact_col = self._requirement_index.get(skill_lower)
+            if exact_col is not None:
+                exact_position = self._positions_csc[:, exact_col].toarray().ravel()
+                exact = (exact_position > 0) & (exact_position == first)
+            else:
+                exact = np.zeros(len(self.job_ids), dtype=bool)
+            total += np.where(exact, weight, np.where(matched, weight * 0.7, 0.0))
+        
+        boost = np.minimum(total / np.maximum(self._requirement_counts, 1.0), 1.0)
+        boost[self._requirement_counts == 0] = 0.0
+        return boost
+
+    def experience_match(self, user_experience: str) -> np.ndarray:
+        self._stack_appended()
+        user_weight = self.matcher.experience_weights.get((user_experience or 'entry').lower(), 1.0)
+        penalty = np.maximum(0.3, 1.0 - (self._job_experience - user_weight) * 0.2)
+        return np.where(user_weight >= self._job_experience, 1.0, penalty)
+
+    def location_match(self, user_location: str) -> np.ndarray:
+        self._stack_appended()
+        user_location_lower = (user_location or '').lower()
+        user_boost = self.matcher.location_weights.get(user_location_lower, 1.0)
+        match = (user_boost + self._job_location_weight) / 2
+        match[self._job_location == self._location_codes.get(user_location_lower, -1)] = 1.0
+        match[self._remote] = 1.0
+        return match
+
+    def program_relevance(self, user_program: str) -> np.ndarray:
+        self._stack_appended()
+        program = (user_program or '').lower()
+        if program not in self._programs:
+            return np.full(len(self.job_ids), 0.5)
+        return self._program_matrix[:, self._programs.index(program)]
+
+    def _combine(self, user_profile: Dict[str, Any], skill_similarity: np.ndarray) -> np.ndarray:
+        weights = self.matcher.score_weights
+        final_score = (
+            skill_similarity * weights['skill_similarity'] +
+            self.skill_boost(user_profile.get('skills') or []) * weights['skill_boost'] +
+            self.experience_match(user_profile.get('experienceLevel', 'entry')) * weights['experience_match'] +
+            self.location_match(user_profile.get('location', 'Türkiye')) * weights['location_match'] +
+            self.program_relevance(user_profile.get('upschoolProgram', 'Data Science')) * weights['program_relevance']
+        )
+        return np.round(np.clip(final_score * 100, 0, 100), 1)
+
+    def score(self, user_profile: Dict[str, Any]) -> np.ndarray:
+        """Match percentage of one user for every job, in ``job_ids`` order"""
+        return self.score_many([user_profile])[0]
+
+    def score_many(self, user_profiles: List[Dict[str, Any]]) -> np.ndarray:
+        """Match percentages as a (users x jobs) array"""
+        similarity = self.skill_similarity([profile.get('skills') or [] for profile in user_profiles])
+        if not user_profiles:
+            return similarity
+        return np.vstack([
+            self._combine(profile, similarity[row]) for row, profile in enumerate(user_profiles)
+        ])
+
+def job_matching_input(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Map a ``JobService`` job to the fields the matcher scores"""
+    return {**job, "required_skills": job.get("required_skills") or job.get("skills") or []}
+
 # Global instance
 ai_matcher = AIMatchingService() 
\ No newline at end of file
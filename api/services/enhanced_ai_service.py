@@ -1,27 +1,1002 @@
 """
 Enhanced AI Service
-- Gemini-first streaming (single provider)
+- Gemini-first streaming (single provider; AI_PROVIDER=local swaps in a stand-in model for load tests)
 """
 import asyncio
+import functools
+import hashlib
+import heapq
 import json
 import logging
-import httpx
-from typing import AsyncGenerator, Dict, Any, Optional, List
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing, asynccontextmanager
+from typing import AsyncGenerator, AsyncIterator, Awaitable, Callable, Dict, Any, Iterable, NamedTuple, Optional, List, Tuple, TypeVar
 from pathlib import Path
-import sqlite3
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
 import threading
+import weakref
 
 from api.config import settings
+from api.database import db_connection, db_writer, migrate_db, run_db
 
 logger = logging.getLogger(__name__)
 
-# Optional import: google-generativeai (Gemini)
-try:
-    import google.generativeai as genai  # type: ignore
-except Exception:  # pragma: no cover
-    genai = None  # type: ignore
+T = TypeVar("T")
+
+AI_BUSY_MESSAGE = "⏳ AI servisi şu anda çok yoğun, lütfen birazdan tekrar deneyin."
+
+class _StreamFailure:
+    """Carries an exception raised by the SDK on the worker thread to the consumer"""
+
+    def __init__(self, error: Exception):
+        self.error = error
+
+class StreamBridge:
+    """Runs blocking AI SDK calls on a bounded thread pool and relays streamed chunks to asyncio.
+
+    A stream's worker pulls chunks from the synchronous SDK iterator and hands
+    each one to the event loop with ``call_soon_threadsafe``, so it never
+    waits on the loop. At most ``buffer_size`` chunks may sit unread; beyond
+    that the worker stops pulling from the SDK until the client catches up.
+    Closing the stream (e.g. the SSE client disconnected) makes the worker
+    stop at its next chunk and frees its pool slot; a chunk read already in
+    progress inside the SDK cannot be interrupted.
+    """
+
+    _DONE = object()
+
+    def __init__(self, max_workers: int = 8, buffer_size: int = 64):
+        self.max_workers = max(1, int(max_workers))
+        self.buffer_size = max(1, int(buffer_size))
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._stats = {
+            "streams": 0,
+            "active_streams": 0,
+            "waiting_for_worker": 0,
+            "completed": 0,
+            "cancelled": 0,
+            "errors": 0,
+            "chunks": 0,
+            "calls": 0,
+        }
+        self._ttft_count = 0
+        self._ttft_total_ms = 0.0
+        self._ttft_max_ms = 0.0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="uphera-ai"
+                )
+            return self._executor
+
+    def _count(self, **changes: int) -> None:
+        with self._lock:
+            for name, delta in changes.items():
+                self._stats[name] += delta
+
+    def _record_first_chunk(self, started: float) -> None:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._ttft_count += 1
+            self._ttft_total_ms += elapsed_ms
+            self._ttft_max_ms = max(self._ttft_max_ms, elapsed_ms)
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Run a blocking, non-streaming SDK call on the pool"""
+        self._count(calls=1)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), functools.partial(func, *args, **kwargs))
+
+    async def stream(self, open_stream: Callable[[], Iterable[T]]) -> AsyncIterator[T]:
+        """Yield the items of ``open_stream()``, which is called and iterated on a worker"""
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        space = threading.Semaphore(self.buffer_size)
+        stop = threading.Event()
+        started = time.perf_counter()
+
+        def deliver(item: Any) -> bool:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+                return True
+            except RuntimeError:
+                # The event loop is gone; nobody is listening any more
+                stop.set()
+                return False
+
+        def produce() -> None:
+            self._count(waiting_for_worker=-1)
+            if stop.is_set():
+                return
+            try:
+                iterator = iter(open_stream())
+                try:
+                    for item in iterator:
+                        # Backpressure: wait for the consumer, but notice if it left
+                        while not space.acquire(timeout=0.1):
+                            if stop.is_set():
+                                return
+                        if stop.is_set() or not deliver(item):
+                            return
+                finally:
+                    close = getattr(iterator, "close", None)
+                    if stop.is_set() and callable(close):
+                        close()
+            except Exception as e:
+                deliver(_StreamFailure(e))
+            finally:
+                deliver(self._DONE)
+
+        self._count(streams=1, active_streams=1, waiting_for_worker=1)
+        outcome = "cancelled"
+        first = True
+        try:
+            self._get_executor().submit(produce)
+            while True:
+                item = await queue.get()
+                if item is self._DONE:
+                    outcome = "completed"
+                    break
+                if isinstance(item, _StreamFailure):
+                    outcome = "errors"
+                    raise item.error
+                space.release()
+                if first:
+                    self._record_first_chunk(started)
+                    first = False
+                self._count(chunks=1)
+                yield item
+        finally:
+            stop.set()
+            self._count(active_streams=-1, **{outcome: 1})
+
+    def metrics(self) -> Dict[str, Any]:
+        """Stream counts and time to first chunk"""
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "buffer_size": self.buffer_size,
+                **self._stats,
+                "avg_ttft_ms": round(self._ttft_total_ms / self._ttft_count, 3) if self._ttft_count else 0.0,
+                "max_ttft_ms": round(self._ttft_max_ms, 3),
+            }
+
+    def shutdown(self) -> None:
+        """Stop the worker threads without waiting for streams still talking to the SDK"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+class AIResponseCache:
+    """Gemini responses stored in SQLite, keyed by a hash of everything that shapes them.
+
+    The key covers the model, system prompt, user prompt and generation
+    config, so an identical request is answered from the table instead of
+    the API. Entries expire after ``ttl`` seconds; beyond ``max_entries``
+    the least recently used ones are evicted. The table is shared by every
+    process using the database, so a serverless instance benefits from
+    answers another one already paid for.
+
+    A hit only reads the table: its time and count are queued in memory and
+    written in one batch by ``flush_usage`` (run by the AI write flusher) or
+    ahead of the next ``put``, so eviction still sees them. Usage queued by
+    an instance that never flushes is lost, which only blurs LRU order.
+    """
+
+    def __init__(self, db_path: str = "uphera.db", ttl: float = 86400.0, max_entries: int = 2000):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_entries = max(1, int(max_entries))
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "errors": 0}
+        # key -> (last hit time, hits) not yet written to the table
+        self._usage: Dict[str, Tuple[float, int]] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    @staticmethod
+    def key(model: str, system_prompt: str, prompt: str, generation_config: Dict[str, Any]) -> str:
+        """Request fingerprint; whitespace differences in the user prompt don't matter"""
+        prompt = " ".join(prompt.split())
+        payload = json.dumps([model, system_prompt, prompt, generation_config], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._stats[name] += amount
+
+    def get(self, key: str) -> Optional[str]:
+        """Cached response for ``key``, or None if missing or expired"""
+        now = time.time()
+        try:
+            with db_connection(self.db_path) as (conn, cursor):
+                cursor.execute(
+                    "SELECT response FROM ai_response_cache WHERE key = ? AND expires_at > ?",
+                    (key, now)
+                )
+                row = cursor.fetchone()
+        except Exception as e:
+            # A broken cache must never break the coach; fall through to Gemini
+            logger.warning(f"AI response cache read failed: {e}")
+            self._count("errors")
+            return None
+        if row is None:
+            self._count("misses")
+            return None
+        with self._lock:
+            _, hits = self._usage.get(key, (now, 0))
+            self._usage[key] = (now, hits + 1)
+            self._stats["hits"] += 1
+        return row[0]
+
+    def _take_usage(self) -> Dict[str, Tuple[float, int]]:
+        with self._lock:
+            usage, self._usage = self._usage, {}
+        return usage
+
+    def _restore_usage(self, usage: Dict[str, Tuple[float, int]]) -> None:
+        with self._lock:
+            for key, (last_used, hits) in usage.items():
+                newer, more = self._usage.get(key, (last_used, 0))
+                self._usage[key] = (max(last_used, newer), hits + more)
+
+    @staticmethod
+    def _write_usage(cursor, usage: Dict[str, Tuple[float, int]]) -> None:
+        cursor.executemany(
+            "UPDATE ai_response_cache SET last_used = MAX(last_used, ?), hits = hits + ? WHERE key = ?",
+            [(last_used, hits, key) for key, (last_used, hits) in usage.items()]
+        )
+
+    def pending_usage(self) -> int:
+        with self._lock:
+            return len(self._usage)
+
+    def flush_usage(self) -> int:
+        """Write queued hit times and counts; returns how many entries were updated"""
+        usage = self._take_usage()
+        if not usage:
+            return 0
+        try:
+            with db_writer(self.db_path) as (conn, cursor):
+                self._write_usage(cursor, usage)
+        except Exception:
+            self._restore_usage(usage)
+            raise
+        return len(usage)
+
+    def put(self, key: str, response: str) -> None:
+        """Store a response, dropping expired and least recently used entries"""
+        now = time.time()
+        usage = self._take_usage()
+        try:
+            with db_writer(self.db_path) as (conn, cursor):
+                # Queued hits first, so they count for the eviction below
+                self._write_usage(cursor, usage)
+                cursor.execute('''
+                    INSERT OR REPLACE INTO ai_response_cache (key, response, created_at, expires_at, last_used, hits)
+                    VALUES (?, ?, ?, ?, ?, 0)
+                ''', (key, response, now, now + self.ttl, now))
+                cursor.execute("DELETE FROM ai_response_cache WHERE expires_at <= ?", (now,))
+                evicted = cursor.rowcount
+                cursor.execute('''
+                    DELETE FROM ai_response_cache WHERE key IN (
+                        SELECT key FROM ai_response_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                    )
+                ''', (self.max_entries,))
+                evicted += cursor.rowcount
+        except Exception as e:
+            logger.warning(f"AI response cache write failed: {e}")
+            self._restore_usage(usage)
+            self._count("errors")
+            return
+        self._count("stores")
+        self._count("evictions", evicted)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                "enabled": self.enabled,
+                "ttl": self.ttl,
+                "max_entries": self.max_entries,
+                "pending_usage": len(self._usage),
+                **self._stats,
+                "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+            }
+
+class _SharedStream:
+    """One upstream stream and the chunks it produced so far, replayed to late subscribers"""
+
+    def __init__(self):
+        self.chunks: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.changed = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def notify(self) -> None:
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+class SingleFlight:
+    """Coalesces concurrent identical AI requests into one upstream call.
+
+    ``call`` runs the upstream coroutine as its own task and every caller
+    with the same key awaits that task, so one caller disconnecting does not
+    fail the others. ``stream`` fans one upstream chunk stream out to every
+    subscriber: late joiners first get the chunks already produced, and the
+    upstream is cancelled once its last subscriber leaves. Keys are only
+    shared while a request is in flight; finished results live in the
+    response cache, not here.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # asyncio tasks are bound to one loop; keep the in-flight maps per loop
+        self._calls: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Task]]" = weakref.WeakKeyDictionary()
+        self._streams: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, _SharedStream]]" = weakref.WeakKeyDictionary()
+        self._stats = {"calls": 0, "coalesced_calls": 0, "streams": 0, "coalesced_streams": 0}
+
+    def _in_flight(self, table: "weakref.WeakKeyDictionary", loop: asyncio.AbstractEventLoop) -> Dict[str, Any]:
+        with self._lock:
+            flights = table.get(loop)
+            if flights is None:
+                flights = {}
+                table[loop] = flights
+            return flights
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    async def call(self, key: str, func: Callable[[], Awaitable[T]]) -> T:
+        """Await ``func()``, or the identical call already in flight"""
+        calls = self._in_flight(self._calls, asyncio.get_running_loop())
+        task = calls.get(key)
+        if task is None:
+            self._count("calls")
+            task = asyncio.ensure_future(func())
+            calls[key] = task
+            task.add_done_callback(lambda _: calls.pop(key, None))
+        else:
+            self._count("coalesced_calls")
+        # shield: a cancelled caller must not cancel the call the others wait for
+        return await asyncio.shield(task)
+
+    async def stream(self, key: str, open_stream: Callable[[], AsyncIterator[T]]) -> AsyncIterator[T]:
+        """Yield the chunks of ``open_stream()``, shared with identical streams in flight"""
+        streams = self._in_flight(self._streams, asyncio.get_running_loop())
+        shared = streams.get(key)
+        if shared is None:
+            self._count("streams")
+            shared = _SharedStream()
+            streams[key] = shared
+
+            async def pump() -> None:
+                try:
+                    async with aclosing(open_stream()) as chunks:
+                        async for chunk in chunks:
+                            shared.chunks.append(chunk)
+                            shared.notify()
+                except asyncio.CancelledError:
+                    shared.error = asyncio.CancelledError()
+                except Exception as e:
+                    shared.error = e
+                finally:
+                    shared.done = True
+                    if streams.get(key) is shared:
+                        del streams[key]
+                    shared.notify()
+
+            shared.task = asyncio.ensure_future(pump())
+        else:
+            self._count("coalesced_streams")
+
+        shared.subscribers += 1
+        position = 0
+        try:
+            while True:
+                while position < len(shared.chunks):
+                    chunk = shared.chunks[position]
+                    position += 1
+                    yield chunk
+                if shared.done:
+                    if shared.error is not None:
+                        raise shared.error
+                    return
+                await shared.changed.wait()
+        finally:
+            shared.subscribers -= 1
+            if shared.subscribers == 0 and not shared.done and shared.task is not None:
+                # Nobody is listening any more; stop the upstream call
+                shared.task.cancel()
+                if streams.get(key) is shared:
+                    del streams[key]
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            in_flight_calls = sum(len(calls) for calls in self._calls.values())
+            in_flight_streams = sum(len(streams) for streams in self._streams.values())
+            return {**self._stats, "in_flight_calls": in_flight_calls, "in_flight_streams": in_flight_streams}
+
+class AIBusyError(Exception):
+    """Raised when an AI request waited longer than the limiter's queue timeout"""
+
+def estimate_tokens(text: str) -> int:
+    """Rough output token count of a response (about four characters per token)"""
+    return max(1, len(text) // 4) if text else 0
+
+class _TokenBucket:
+    """``capacity`` units refilled continuously at ``capacity`` per minute"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = max(1.0, float(per_minute))
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, amount: float, now: float) -> float:
+        """Seconds until ``amount`` units are available"""
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.level
+        return missing / self.rate if missing > 0 else 0.0
+
+    def take(self, amount: float) -> None:
+        self.level -= min(amount, self.capacity)
+
+    def give(self, amount: float) -> None:
+        self.level = min(self.capacity, self.level + amount)
+
+class SharedRateLimits:
+    """Request and output-token buckets kept in SQLite, shared by every process on the database"""
+
+    def __init__(self, db_path: str, requests_per_minute: float, tokens_per_minute: float):
+        self.db_path = db_path
+        self.limits = {
+            "requests": max(1.0, float(requests_per_minute)),
+            "output_tokens": max(1.0, float(tokens_per_minute)),
+        }
+
+    def reserve(self, tokens: int) -> float:
+        """Take one request and ``tokens`` output tokens; returns 0, or seconds to wait before retrying"""
+        now = time.time()
+        with db_writer(self.db_path) as (conn, cursor):
+            levels = {}
+            wait = 0.0
+            for name, capacity in self.limits.items():
+                cursor.execute("SELECT level, updated FROM ai_rate_limits WHERE name = ?", (name,))
+                row = cursor.fetchone()
+                level = capacity if row is None else min(capacity, row[0] + (now - row[1]) * capacity / 60.0)
+                amount = min(1 if name == "requests" else tokens, capacity)
+                if level < amount:
+                    wait = max(wait, (amount - level) * 60.0 / capacity)
+                levels[name] = (level, amount)
+            if wait:
+                return wait
+            cursor.executemany(
+                "INSERT OR REPLACE INTO ai_rate_limits (name, level, updated) VALUES (?, ?, ?)",
+                [(name, level - amount, now) for name, (level, amount) in levels.items()]
+            )
+        return 0.0
+
+    def refund(self, tokens: int) -> None:
+        """Return reserved output tokens that were not used"""
+        if tokens <= 0:
+            return
+        with db_writer(self.db_path) as (conn, cursor):
+            cursor.execute(
+                "UPDATE ai_rate_limits SET level = MIN(level + ?, ?) WHERE name = 'output_tokens'",
+                (tokens, self.limits["output_tokens"])
+            )
+
+class _Waiter:
+    def __init__(self, loop: asyncio.AbstractEventLoop, priority: int, tokens: int):
+        self.loop = loop
+        self.future = loop.create_future()
+        self.priority = priority
+        self.tokens = tokens
+        self.enqueued = time.perf_counter()
+        self.granted = False
+        self.abandoned = False
+
+class AIGrant:
+    """A reserved upstream slot; set ``used_tokens`` so unused output tokens are refunded"""
+
+    def __init__(self, tokens: int, waited_ms: float):
+        self.tokens = tokens
+        self.used_tokens = tokens
+        self.waited_ms = waited_ms
+
+class UpstreamLimiter:
+    """Caps concurrent Gemini calls and their rate in requests and output tokens per minute.
+
+    Callers wait in a priority queue: short chats (priority 0) are served
+    before regular ones (1) and long generations such as insights (2), FIFO
+    within a level. Each call reserves its ``max_output_tokens`` up front and
+    refunds what the response did not use. Buckets live in this process by
+    default; ``shared`` moves them into SQLite so every instance on the
+    database draws from the same budget, while concurrency stays per
+    process. Callers still waiting after ``queue_timeout`` get AIBusyError
+    instead of a provider rate-limit error.
+    """
+
+    PRIORITIES = {"short": 0, "auto": 1, "long": 2}
+
+    def __init__(
+        self,
+        max_concurrent: int = 4,
+        requests_per_minute: float = 60,
+        tokens_per_minute: float = 32000,
+        queue_timeout: float = 30.0,
+        shared: Optional[SharedRateLimits] = None
+    ):
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.queue_timeout = queue_timeout
+        self.shared = shared
+        self._requests = _TokenBucket(requests_per_minute)
+        self._tokens = _TokenBucket(tokens_per_minute)
+
+        self._lock = threading.Lock()
+        self._queue: List[Tuple[int, int, _Waiter]] = []
+        self._seq = 0
+        self._active = 0
+        self._timer_at: Optional[float] = None
+        self._stats = {"granted": 0, "timeouts": 0, "wait_ms_total": 0.0, "wait_ms_max": 0.0}
+
+    @classmethod
+    def priority_for(cls, response_mode: str) -> int:
+        return cls.PRIORITIES.get((response_mode or "auto").lower(), 1)
+
+    def _dispatch(self) -> None:
+        """Grant queued waiters in priority order while capacity allows"""
+        woken = []
+        with self._lock:
+            now = time.monotonic()
+            while self._queue:
+                waiter = self._queue[0][2]
+                if waiter.abandoned:
+                    heapq.heappop(self._queue)
+                    continue
+                if self._active >= self.max_concurrent:
+                    break
+                if self.shared is None:
+                    wait = max(self._requests.wait_for(1, now), self._tokens.wait_for(waiter.tokens, now))
+                    if wait > 0:
+                        # Strict priority: lower levels don't overtake a head waiting for budget
+                        self._schedule(waiter.loop, now + wait)
+                        break
+                    self._requests.take(1)
+                    self._tokens.take(waiter.tokens)
+                heapq.heappop(self._queue)
+                self._active += 1
+                waiter.granted = True
+                waited_ms = (time.perf_counter() - waiter.enqueued) * 1000
+                self._stats["granted"] += 1
+                self._stats["wait_ms_total"] += waited_ms
+                self._stats["wait_ms_max"] = max(self._stats["wait_ms_max"], waited_ms)
+                woken.append((waiter, waited_ms))
+        for waiter, waited_ms in woken:
+            waiter.loop.call_soon_threadsafe(self._wake, waiter.future, waited_ms)
+
+    @staticmethod
+    def _wake(future: asyncio.Future, waited_ms: float) -> None:
+        if not future.done():
+            future.set_result(waited_ms)
+
+    def _schedule(self, loop: asyncio.AbstractEventLoop, at: float) -> None:
+        # Called with the lock held: wake the queue once the buckets have refilled
+        if self._timer_at is not None and self._timer_at <= at:
+            return
+        self._timer_at = at
+
+        def fire() -> None:
+            with self._lock:
+                self._timer_at = None
+            self._dispatch()
+
+        try:
+            loop.call_soon_threadsafe(loop.call_later, max(0.0, at - time.monotonic()), fire)
+        except RuntimeError:
+            self._timer_at = None
+
+    def _release(self, grant: AIGrant) -> None:
+        unused = max(0, grant.tokens - grant.used_tokens)
+        with self._lock:
+            self._active -= 1
+            if self.shared is None:
+                self._tokens.give(unused)
+        if self.shared is not None and unused:
+            try:
+                self.shared.refund(unused)
+            except Exception as e:
+                logger.warning(f"Shared AI rate limit refund failed: {e}")
+        self._dispatch()
+
+    @asynccontextmanager
+    async def reserve(self, priority: int = 1, tokens: int = 0) -> AsyncIterator[AIGrant]:
+        """Hold an upstream slot for the duration of the block"""
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(loop, priority, max(0, int(tokens)))
+        with self._lock:
+            self._seq += 1
+            heapq.heappush(self._queue, (priority, self._seq, waiter))
+        self._dispatch()
+
+        deadline = loop.time() + self.queue_timeout
+        try:
+            waited_ms = await asyncio.wait_for(waiter.future, self.queue_timeout)
+            grant = AIGrant(waiter.tokens, waited_ms)
+        except BaseException as e:
+            with self._lock:
+                granted, waiter.abandoned = waiter.granted, True
+            if granted:
+                self._release(AIGrant(waiter.tokens, 0.0))
+            else:
+                self._dispatch()
+            if isinstance(e, asyncio.TimeoutError):
+                with self._lock:
+                    self._stats["timeouts"] += 1
+                raise AIBusyError(f"AI request queue timed out after {self.queue_timeout}s")
+            raise
+
+        try:
+            while self.shared is not None:
+                wait = await run_db(self.shared.reserve, grant.tokens)
+                if not wait:
+                    break
+                if loop.time() + wait > deadline:
+                    with self._lock:
+                        self._stats["timeouts"] += 1
+                    grant.used_tokens = grant.tokens
+                    raise AIBusyError("shared AI rate limit exhausted")
+                await asyncio.sleep(wait)
+            yield grant
+        finally:
+            self._release(grant)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            depth = {"short": 0, "auto": 0, "long": 0}
+            names = {value: name for name, value in self.PRIORITIES.items()}
+            for priority, _, waiter in self._queue:
+                if not waiter.abandoned:
+                    depth[names.get(priority, "auto")] += 1
+            granted = self._stats["granted"]
+            return {
+                "max_concurrent": self.max_concurrent,
+                "active": self._active,
+                "queue_depth": sum(depth.values()),
+                "queue_depth_by_priority": depth,
+                "granted": granted,
+                "timeouts": self._stats["timeouts"],
+                "avg_wait_ms": round(self._stats["wait_ms_total"] / granted, 3) if granted else 0.0,
+                "max_wait_ms": round(self._stats["wait_ms_max"], 3),
+                "shared": self.shared is not None,
+                "requests_available": None if self.shared else round(self._requests.level, 2),
+                "output_tokens_available": None if self.shared else round(self._tokens.level, 2),
+            }
+
+class AssembledPrompt(NamedTuple):
+    """A Gemini request split into the fixed system part and the user's turn"""
+    system_prompt: str
+    user_turn: str
+    system_tokens: int
+    user_tokens: int
+
+    @property
+    def text(self) -> str:
+        """Single-string form for models without a system instruction"""
+        return f"{self.system_prompt}\n\n{self.user_turn}"
+
+class PromptAssembler:
+    """Builds Gemini prompts, memoizing the system prompt of each (context, mode).
+
+    The persona text and mode suffix never change between requests, so they
+    are assembled and token-counted once. Every request is recorded with its
+    system and user token counts, which shows how much of the prompt spend
+    is repeated boilerplate rather than the user's own text.
+    """
+
+    def __init__(self, build_system_prompt: Callable[[str, str], str], memo_size: int = 64):
+        self._build = build_system_prompt
+        self._system = functools.lru_cache(maxsize=memo_size)(self._system_prompt)
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "system_tokens": 0, "user_tokens": 0}
+        self._by_mode: Dict[str, Dict[str, int]] = {}
+
+    def _system_prompt(self, context: str, response_mode: str) -> Tuple[str, int]:
+        prompt = self._build(context, response_mode)
+        return prompt, estimate_tokens(prompt)
+
+    def system_prompt(self, context: str, response_mode: str = "auto") -> str:
+        return self._system(context or "general", (response_mode or "auto").lower())[0]
+
+    def assemble(self, message: str, context: str = "general", response_mode: str = "auto", history: str = "") -> AssembledPrompt:
+        mode = (response_mode or "auto").lower()
+        system_prompt, system_tokens = self._system(context or "general", mode)
+        user_turn = f"Kullanıcı: {message}\n\nAda AI:"
+        if history:
+            # Per-user, so it belongs to the user's turn rather than the shared system prompt
+            user_turn = f"{history}\n\n{user_turn}"
+        prompt = AssembledPrompt(system_prompt, user_turn, system_tokens, estimate_tokens(user_turn))
+
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["system_tokens"] += prompt.system_tokens
+            self._stats["user_tokens"] += prompt.user_tokens
+            mode_stats = self._by_mode.setdefault(mode, {"requests": 0, "system_tokens": 0, "user_tokens": 0})
+            mode_stats["requests"] += 1
+            mode_stats["system_tokens"] += prompt.system_tokens
+            mode_stats["user_tokens"] += prompt.user_tokens
+        return prompt
+
+    def metrics(self) -> Dict[str, Any]:
+        info = self._system.cache_info()
+        with self._lock:
+            total = self._stats["system_tokens"] + self._stats["user_tokens"]
+            return {
+                **self._stats,
+                "boilerplate_share": round(self._stats["system_tokens"] / total, 4) if total else 0.0,
+                "by_mode": {mode: dict(stats) for mode, stats in self._by_mode.items()},
+                "memoized_prompts": info.currsize,
+                "memo_hits": info.hits,
+            }
+
+class _Conversation:
+    def __init__(self, summary_turns: int):
+        self.summary: "deque[str]" = deque(maxlen=summary_turns)
+        self.turns: "deque[Tuple[str, str]]" = deque()
+        self.text = ""
+
+class ConversationMemory:
+    """Bounded chat context per user: a rolling summary plus the latest turns.
+
+    The last ``turns`` exchanges are kept verbatim; older ones are folded
+    into a summary line of what the user asked, of which only the newest
+    ``summary_turns`` are kept, and the whole block is trimmed to
+    ``max_tokens``. Prompt size therefore stays bounded however long the
+    conversation gets. A user's context is rebuilt from chat_history on
+    first use, then kept up to date in memory for the ``max_users`` most
+    recently active users.
+    """
+
+    SUMMARY_LINE_CHARS = 160
+
+    def __init__(
+        self,
+        load_history: Callable[[str, int], List[Dict]],
+        turns: int = 6,
+        summary_turns: int = 20,
+        max_tokens: int = 1500,
+        max_users: int = 1000
+    ):
+        self._load = load_history
+        self.turns = max(0, int(turns))
+        self.summary_turns = max(0, int(summary_turns))
+        self.max_tokens = max(1, int(max_tokens))
+        self.max_users = max(1, int(max_users))
+        self._lock = threading.Lock()
+        self._contexts: "OrderedDict[str, _Conversation]" = OrderedDict()
+        self._stats = {"hits": 0, "loads": 0, "folded_turns": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.turns + self.summary_turns > 0
+
+    @staticmethod
+    def _usable(response: str) -> bool:
+        # Error and busy replies carry nothing worth remembering
+        return bool(response) and not response.startswith("❌") and response != AI_BUSY_MESSAGE
+
+    def _fold(self, conversation: _Conversation) -> None:
+        message = " ".join(conversation.turns.popleft()[0].split())
+        if len(message) > self.SUMMARY_LINE_CHARS:
+            message = message[:self.SUMMARY_LINE_CHARS - 3] + "..."
+        if self.summary_turns:
+            conversation.summary.append(f"- {message}")
+        self._stats["folded_turns"] += 1
+
+    def _append(self, conversation: _Conversation, message: str, response: str) -> None:
+        if not self._usable(response):
+            return
+        conversation.turns.append((message, response))
+        while len(conversation.turns) > self.turns:
+            self._fold(conversation)
+
+    @staticmethod
+    def _render(conversation: _Conversation) -> str:
+        parts = []
+        if conversation.summary:
+            parts.append("Önceki konuşmada kullanıcının sorduğu konular:\n" + "\n".join(conversation.summary))
+        if conversation.turns:
+            parts.append("Son mesajlar:\n" + "\n\n".join(
+                f"Kullanıcı: {message}\nAda AI: {response}" for message, response in conversation.turns
+            ))
+        return "\n\n".join(parts)
+
+    def _fit(self, conversation: _Conversation) -> None:
+        """Render the context, dropping the oldest summary lines and then turns until it fits"""
+        while True:
+            text = self._render(conversation)
+            if estimate_tokens(text) <= self.max_tokens:
+                break
+            if conversation.summary:
+                conversation.summary.popleft()
+            elif conversation.turns:
+                self._fold(conversation)
+            else:
+                break
+        conversation.text = text
+
+    def context(self, user_id: str) -> str:
+        """Prompt block with the user's earlier conversation; reads the table on a miss"""
+        with self._lock:
+            conversation = self._contexts.get(user_id)
+            if conversation is not None:
+                self._contexts.move_to_end(user_id)
+                self._stats["hits"] += 1
+                return conversation.text
+
+        # Newest first from the table; replay oldest first
+        rows = self._load(user_id, self.turns + self.summary_turns)
+        conversation = _Conversation(self.summary_turns)
+        with self._lock:
+            for row in reversed(rows):
+                self._append(conversation, row["message"], row["response"])
+            self._fit(conversation)
+            self._stats["loads"] += 1
+            # Another request may have loaded it meanwhile; keep that one
+            conversation = self._contexts.setdefault(user_id, conversation)
+            self._contexts.move_to_end(user_id)
+            while len(self._contexts) > self.max_users:
+                self._contexts.popitem(last=False)
+            return conversation.text
+
+    def record(self, user_id: str, message: str, response: str) -> None:
+        """Add a finished exchange; users without a cached context read it from the table later"""
+        with self._lock:
+            conversation = self._contexts.get(user_id)
+            if conversation is None:
+                return
+            self._append(conversation, message, response)
+            self._fit(conversation)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "users": len(self._contexts),
+                **self._stats,
+            }
+
+class AIWriteBuffer:
+    """Write-behind buffer for chat history, AI insights and uploaded documents.
+
+    ``add`` only queues a row, so finishing a chat stream does no database
+    work; ``flush`` inserts every queued row in one transaction, one
+    multi-row insert per table. The background flusher runs on a timer, or
+    early once ``max_batch`` rows are queued, and the app flushes once more
+    on shutdown. Rows of a failed flush are put back and retried. Without
+    ``write_behind`` (serverless instances may be frozen before a timer
+    fires) ``add`` flushes immediately.
+    """
+
+    # Columns written per table; every table has user_id second
+    TABLES = {
+        "chat_history": ("id", "user_id", "message", "response", "context", "created_at"),
+        "ai_insights": ("id", "user_id", "insight_type", "insight_data", "created_at"),
+        "user_documents": ("id", "user_id", "filename", "content", "file_type", "uploaded_at"),
+    }
+
+    def __init__(self, db_path: str = "uphera.db", max_batch: int = 100, write_behind: bool = True):
+        self.db_path = db_path
+        self.max_batch = max(1, int(max_batch))
+        self.write_behind = write_behind
+        self._pending: Dict[str, List[tuple]] = {table: [] for table in self.TABLES}
+        self._count = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._waiter: Optional[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = None
+        self._stats = {"queued": 0, "written": 0, "flushes": 0, "failures": 0}
+
+    @staticmethod
+    def timestamp() -> str:
+        # Same format as CURRENT_TIMESTAMP, so queued and written rows sort together
+        return datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+
+    def add(self, table: str, row: tuple) -> None:
+        with self._lock:
+            self._pending[table].append(row)
+            self._count += 1
+            self._stats["queued"] += 1
+            full = self._count >= self.max_batch
+            waiter = self._waiter if full else None
+        if not self.write_behind:
+            self.flush()
+        elif waiter is not None:
+            loop, event = waiter
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                pass
+
+    def pending(self, table: Optional[str] = None, user_id: Optional[str] = None) -> List[tuple]:
+        """Queued rows of one table (or all), optionally of one user, oldest first"""
+        with self._lock:
+            tables = [table] if table else list(self._pending)
+            return [row for name in tables for row in self._pending[name] if user_id is None or row[1] == user_id]
+
+    async def wait(self, timeout: float) -> None:
+        """Sleep for ``timeout`` seconds, or until a full batch is queued"""
+        event = asyncio.Event()
+        with self._lock:
+            if self._count >= self.max_batch:
+                return
+            self._waiter = (asyncio.get_running_loop(), event)
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._lock:
+                self._waiter = None
+
+    def flush(self) -> int:
+        """Write queued rows to the database; returns how many were written"""
+        with self._flush_lock:
+            with self._lock:
+                batch = {table: rows for table, rows in self._pending.items() if rows}
+                self._pending = {table: [] for table in self.TABLES}
+                self._count = 0
+            if not batch:
+                return 0
+
+            try:
+                with db_writer(self.db_path) as (conn, cursor):
+                    for table, rows in batch.items():
+                        columns = self.TABLES[table]
+                        cursor.executemany(
+                            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                            rows
+                        )
+            except Exception:
+                # Put the rows back, ahead of anything queued meanwhile
+                with self._lock:
+                    for table, rows in batch.items():
+                        self._pending[table][:0] = rows
+                        self._count += len(rows)
+                    self._stats["failures"] += 1
+                raise
+
+            written = sum(len(rows) for rows in batch.values())
+            with self._lock:
+                self._stats["written"] += written
+                self._stats["flushes"] += 1
+            return written
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "write_behind": self.write_behind,
+                "pending": self._count,
+                **self._stats,
+            }
 
 class EnhancedAIService:
     """Production-ready AI service using Gemini only"""
@@ -34,6 +1009,49 @@ class EnhancedAIService:
         self.gemini_model_name = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
         self.gemini_model = None
         self._gemini_ready = False
+        # google.generativeai once configured, and a model per system prompt (see _model_for)
+        self._genai: Any = None
+        self._system_models: Dict[str, Tuple[Any, float]] = {}
+        self._system_models_lock = threading.Lock()
+        self.prompts = PromptAssembler(
+            lambda context, mode: self._augment_prompt_by_mode(self.get_system_prompt(context), mode)
+        )
+        # The Gemini SDK is synchronous; its calls run on this pool
+        self.stream_bridge = StreamBridge(
+            max_workers=settings.AI_STREAM_WORKERS,
+            buffer_size=settings.AI_STREAM_BUFFER
+        )
+        # Upstream concurrency and rate budget, shared by streaming and non-streaming calls
+        self.limiter = UpstreamLimiter(
+            max_concurrent=settings.AI_MAX_CONCURRENT,
+            requests_per_minute=settings.AI_REQUESTS_PER_MINUTE,
+            tokens_per_minute=settings.AI_TOKENS_PER_MINUTE,
+            queue_timeout=settings.AI_QUEUE_TIMEOUT,
+            shared=SharedRateLimits(
+                self.db_path, settings.AI_REQUESTS_PER_MINUTE, settings.AI_TOKENS_PER_MINUTE
+            ) if settings.AI_SHARED_RATE_LIMITS else None
+        )
+        # Concurrent identical requests share one upstream call
+        self.single_flight = SingleFlight()
+        self.response_cache = AIResponseCache(
+            self.db_path,
+            ttl=settings.AI_RESPONSE_CACHE_TTL,
+            max_entries=settings.AI_RESPONSE_CACHE_SIZE
+        )
+        # Chat history, insights and documents are written in batches off the request path
+        self.writes = AIWriteBuffer(
+            self.db_path,
+            max_batch=settings.AI_WRITE_BATCH_SIZE,
+            write_behind=settings.AI_WRITE_BEHIND
+        )
+        # Earlier turns of each user's conversation, added to their prompts
+        self.memory = ConversationMemory(
+            self.get_chat_history,
+            turns=settings.AI_MEMORY_TURNS,
+            summary_turns=settings.AI_MEMORY_SUMMARY_TURNS,
+            max_tokens=settings.AI_MEMORY_MAX_TOKENS,
+            max_users=settings.AI_MEMORY_USERS
+        )
         # Tunables for speed/quality balance (overridable via env)
         try:
             self.default_max_output_tokens = int(os.getenv("GEMINI_MAX_OUTPUT_TOKENS", "256"))
@@ -51,66 +1069,123 @@ class EnhancedAIService:
             self.default_top_k = int(os.getenv("GEMINI_TOP_K", "40"))
         except Exception:
             self.default_top_k = 40
-        try:
-            if genai and self.gemini_api_key:
-                genai.configure(api_key=self.gemini_api_key)
-                # Create model instance with generation defaults
-                gen_config = {
-                    "max_output_tokens": self.default_max_output_tokens,
-                    "temperature": self.default_temperature,
-                    "top_p": self.default_top_p,
-                    "top_k": self.default_top_k,
-                }
-                self.gemini_model = genai.GenerativeModel(self.gemini_model_name, generation_config=gen_config)  # type: ignore[arg-type]
-                self._gemini_ready = True
-        except Exception as e:  # pragma: no cover
-            logger.warning(f"Gemini initialization failed: {e}")
+        # google-generativeai is imported on first use: it dominates cold start
+        self._gemini_lock = threading.Lock()
+        self._gemini_checked = False
 
         self.init_ai_tables()
     
+    def _ensure_gemini(self) -> bool:
+        """Import and configure the Gemini client once, on first use"""
+        if self._gemini_checked:
+            return self._gemini_ready
+        with self._gemini_lock:
+            if self._gemini_checked:
+                return self._gemini_ready
+            if settings.AI_PROVIDER == "local":
+                self._use_local_model()
+                return self._gemini_ready
+            try:
+                # Optional import: google-generativeai (Gemini)
+                import google.generativeai as genai  # type: ignore
+            except Exception:  # pragma: no cover
+                genai = None  # type: ignore
+            try:
+                if genai and self.gemini_api_key:
+                    genai.configure(api_key=self.gemini_api_key)
+                    # Create model instance with generation defaults
+                    self.gemini_model = genai.GenerativeModel(self.gemini_model_name, generation_config=self._default_generation_config())  # type: ignore[arg-type]
+                    self._genai = genai
+                    self._gemini_ready = True
+            except Exception as e:  # pragma: no cover
+                logger.warning(f"Gemini initialization failed: {e}")
+            self._gemini_checked = True
+            return self._gemini_ready
+    
+    def _use_local_model(self) -> None:
+        """Serve every request from the deterministic stand-in model (load tests, benchmarks)"""
+        from api.services.local_llm import LocalModel
+        self.gemini_model = LocalModel(
+            tokens_per_second=settings.AI_LOCAL_TOKENS_PER_SECOND,
+            first_token_ms=settings.AI_LOCAL_FIRST_TOKEN_MS,
+            jitter_ms=settings.AI_LOCAL_JITTER_MS,
+            chunk_tokens=settings.AI_LOCAL_CHUNK_TOKENS,
+            response_tokens=settings.AI_LOCAL_RESPONSE_TOKENS
+        )
+        # Keeps its answers apart from Gemini's in the response cache
+        self.gemini_model_name = "local"
+        self._gemini_ready = True
+        self._gemini_checked = True
+        logger.warning("⚠️ AI provider is the local stand-in model; responses are synthetic")
+    
+    def _default_generation_config(self) -> Dict[str, Any]:
+        return {
+            "max_output_tokens": self.default_max_output_tokens,
+            "temperature": self.default_temperature,
+            "top_p": self.default_top_p,
+            "top_k": self.default_top_k,
+        }
+    
+    def _create_system_model(self, prompt: AssembledPrompt) -> Tuple[Any, float]:
+        """``(model, expires_at)`` carrying ``prompt``'s system part on the provider side"""
+        genai = self._genai
+        gen_config = self._default_generation_config()
+        # Gemini only caches contexts above a minimum size; our personas are usually far below it
+        if prompt.system_tokens >= settings.GEMINI_CONTEXT_CACHE_MIN_TOKENS and hasattr(genai, "caching"):
+            try:
+                ttl = settings.GEMINI_CONTEXT_CACHE_TTL
+                cached = genai.caching.CachedContent.create(
+                    model=self.gemini_model_name,
+                    system_instruction=prompt.system_prompt,
+                    ttl=timedelta(seconds=ttl)
+                )
+                logger.info(f"✅ Gemini context cache created ({prompt.system_tokens} tokens)")
+                # Renew a little before the provider drops it
+                return genai.GenerativeModel.from_cached_content(cached, generation_config=gen_config), time.time() + ttl * 0.9
+            except Exception as e:
+                logger.warning(f"Gemini context cache unavailable: {e}")
+        try:
+            return genai.GenerativeModel(
+                self.gemini_model_name, generation_config=gen_config, system_instruction=prompt.system_prompt
+            ), float("inf")
+        except TypeError:
+            # SDK without system instructions: keep sending the prompt inline
+            return None, float("inf")
+    
+    def _model_for(self, prompt: AssembledPrompt) -> Tuple[Any, str]:
+        """Model and request text for ``prompt``; runs on a worker thread.
+
+        Each system prompt gets one model that carries it as the system
+        instruction (or references a provider-side context cache), so only
+        the user's turn is sent as content.
+        """
+        if self._genai is None:
+            return self.gemini_model, prompt.text
+        with self._system_models_lock:
+            entry = self._system_models.get(prompt.system_prompt)
+        if entry is None or entry[1] <= time.time():
+            # Creating a context cache is a network call; keep other prompts' lookups unblocked
+            created = self._create_system_model(prompt)
+            with self._system_models_lock:
+                entry = self._system_models.get(prompt.system_prompt)
+                # Another thread may have installed a fresh model meanwhile; keep that one
+                if entry is None or entry[1] <= time.time():
+                    entry = self._system_models[prompt.system_prompt] = created
+        model = entry[0]
+        if model is None:
+            return self.gemini_model, prompt.text
+        return model, prompt.user_turn
+    
+    async def _gemini_available(self) -> bool:
+        if self._gemini_checked:
+            return self._gemini_ready
+        # The first import is slow; keep it off the event loop
+        return await asyncio.to_thread(self._ensure_gemini)
+    
     def init_ai_tables(self):
-        """Initialize AI-related database tables"""
+        """Initialize AI-related database tables (see ``api.migrations``)"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Chat history table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS chat_history (
-                    id TEXT PRIMARY KEY,
-                    user_id TEXT NOT NULL,
-                    message TEXT NOT NULL,
-                    response TEXT NOT NULL,
-                    context TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # User documents table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS user_documents (
-                    id TEXT PRIMARY KEY,
-                    user_id TEXT NOT NULL,
-                    filename TEXT NOT NULL,
-                    content TEXT NOT NULL,
-                    file_type TEXT,
-                    uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # AI insights table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS ai_insights (
-                    id TEXT PRIMARY KEY,
-                    user_id TEXT NOT NULL,
-                    insight_type TEXT NOT NULL,
-                    insight_data TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            conn.commit()
-            conn.close()
+            migrate_db(self.db_path)
             logger.info("✅ AI tables initialized")
             
         except Exception as e:
@@ -118,7 +1193,7 @@ class EnhancedAIService:
     
     async def check_gemini_status(self) -> bool:
         """Returns True if Gemini is configured and initialized."""
-        return bool(self._gemini_ready)
+        return await self._gemini_available()
     
     def _build_generation_config(self, max_tokens: Optional[int] = None, response_mode: str = "auto") -> Dict[str, Any]:
         # Clamp and select sensible defaults per mode
@@ -157,59 +1232,78 @@ class EnhancedAIService:
             return base_prompt + "\n\nLütfen yanıtı kapsamlı ve ayrıntılı ver (yaklaşık 200-300 kelime). Somut örnekler ve maddeler ekle; uygulanabilir öneriler sun."
         return base_prompt
 
-    async def chat_with_gemini_stream(self, message: str, context: str = "general", *, response_mode: str = "auto", max_tokens: Optional[int] = None) -> AsyncGenerator[str, None]:
+    async def chat_with_gemini_stream(self, message: str, context: str = "general", *, response_mode: str = "auto", max_tokens: Optional[int] = None, history: str = "") -> AsyncGenerator[str, None]:
         """Streaming chat via Gemini."""
-        if not self._gemini_ready or not self.gemini_model:
+        if not await self._gemini_available() or not self.gemini_model:
             yield "❌ Gemini API yapılandırılmadı"
             return
 
         # Build prompt
-        system_prompt = self._augment_prompt_by_mode(self.get_system_prompt(context), response_mode)
-        full_prompt = f"{system_prompt}\n\nKullanıcı: {message}\n\nAda AI:"
+        prompt = self.prompts.assemble(message, context, response_mode, history)
         gen_config = self._build_generation_config(max_tokens=max_tokens, response_mode=response_mode)
 
-        queue: asyncio.Queue = asyncio.Queue()
-        loop = asyncio.get_event_loop()
-
-        def _producer():
-            try:
-                # google-generativeai is synchronous; stream in a background thread
-                response = self.gemini_model.generate_content(full_prompt, stream=True, generation_config=gen_config)
-                for chunk in response:
-                    text = self._extract_gemini_text(chunk)
-                    if text:
-                        asyncio.run_coroutine_threadsafe(queue.put(text), loop).result()
-            except Exception as e:  # pragma: no cover
-                asyncio.run_coroutine_threadsafe(queue.put(f"__ERROR__:{e}"), loop).result()
-            finally:
-                asyncio.run_coroutine_threadsafe(queue.put("__DONE__"), loop).result()
+        def _open_stream():
+            model, contents = self._model_for(prompt)
+            response = model.generate_content(contents, stream=True, generation_config=gen_config)
+            return (text for text in map(self._extract_gemini_text, response) if text)
 
-        threading.Thread(target=_producer, daemon=True).start()
+        async def _upstream():
+            priority = self.limiter.priority_for(response_mode)
+            async with self.limiter.reserve(priority, gen_config["max_output_tokens"]) as grant:
+                grant.used_tokens = 0
+                async with aclosing(self.stream_bridge.stream(_open_stream)) as chunks:
+                    async for text in chunks:
+                        grant.used_tokens += estimate_tokens(text)
+                        yield text
 
-        while True:
-            item = await queue.get()
-            if item == "__DONE__":
-                break
-            if isinstance(item, str) and item.startswith("__ERROR__:"):
-                yield f"❌ AI servis hatası: {item.split(':',1)[1]}"
-                break
-            yield item
+        key = self.response_cache.key(self.gemini_model_name, prompt.system_prompt, prompt.user_turn, gen_config)
+        try:
+            async with aclosing(self.single_flight.stream(key, _upstream)) as chunks:
+                async for text in chunks:
+                    yield text
+        except AIBusyError:
+            yield AI_BUSY_MESSAGE
+        except Exception as e:
+            yield f"❌ AI servis hatası: {e}"
     
-    async def chat_nonstream(self, message: str, context: str = "general", *, response_mode: str = "auto", max_tokens: Optional[int] = None) -> str:
-        """Non-stream response via Gemini (sync API wrapped in thread)."""
+    async def chat_nonstream(self, message: str, context: str = "general", *, response_mode: str = "auto", max_tokens: Optional[int] = None, history: str = "") -> str:
+        """Non-stream response via Gemini (sync API wrapped in thread).
+
+        Identical requests are answered from the response cache, or share
+        the upstream call if one is already in flight.
+        """
         try:
-            if self._gemini_ready and self.gemini_model:
-                system_prompt = self._augment_prompt_by_mode(self.get_system_prompt(context), response_mode)
-                full_prompt = f"{system_prompt}\n\nKullanıcı: {message}\n\nAda AI:"
+            if await self._gemini_available() and self.gemini_model:
+                prompt = self.prompts.assemble(message, context, response_mode, history)
                 gen_config = self._build_generation_config(max_tokens=max_tokens, response_mode=response_mode)
+
                 def _run():
                     try:
-                        resp = self.gemini_model.generate_content(full_prompt, generation_config=gen_config)
-                        return self._extract_gemini_text(resp) or ""
+                        model, contents = self._model_for(prompt)
+                        resp = model.generate_content(contents, generation_config=gen_config)
+                        return self._extract_gemini_text(resp) or "", True
                     except Exception as e:  # pragma: no cover
-                        return f"❌ AI servis hatası: {str(e)}"
-                return await asyncio.to_thread(_run)
+                        return f"❌ AI servis hatası: {str(e)}", False
+
+                async def _fetch() -> str:
+                    if self.response_cache.enabled:
+                        cached = await run_db(self.response_cache.get, key)
+                        if cached is not None:
+                            return cached
+                    priority = self.limiter.priority_for(response_mode)
+                    async with self.limiter.reserve(priority, gen_config["max_output_tokens"]) as grant:
+                        text, ok = await self.stream_bridge.run(_run)
+                        grant.used_tokens = estimate_tokens(text)
+                    # Errors and empty answers are worth retrying, so they are not cached
+                    if ok and text and self.response_cache.enabled:
+                        await run_db(self.response_cache.put, key, text)
+                    return text
+
+                key = self.response_cache.key(self.gemini_model_name, prompt.system_prompt, prompt.user_turn, gen_config)
+                return await self.single_flight.call(key, _fetch)
             return "❌ Gemini API yapılandırılmadı"
+        except AIBusyError:
+            return AI_BUSY_MESSAGE
         except Exception as e:
             logger.error(f"Gemini chat error: {e}")
             return f"❌ AI servis hatası: {str(e)}"
@@ -245,32 +1339,42 @@ class EnhancedAIService:
         # Gemini readiness
         gemini_available = await self.check_gemini_status()
 
+        # Anonymous callers share one id, so they get no memory
+        history = ""
+        if self.memory.enabled and user_id != "anonymous":
+            history = await run_db(self.memory.context, user_id)
+
         if gemini_available and use_streaming:
-            full_response = ""
-            async for chunk in self.chat_with_gemini_stream(message, context, response_mode=response_mode, max_tokens=max_tokens):
-                full_response += chunk
-                yield chunk
-            self.save_chat_history(user_id, message, full_response, context)
+            parts: List[str] = []
+            # Closing this generator (client disconnect) closes the Gemini stream too
+            async with aclosing(self.chat_with_gemini_stream(message, context, response_mode=response_mode, max_tokens=max_tokens, history=history)) as chunks:
+                async for chunk in chunks:
+                    parts.append(chunk)
+                    yield chunk
+            full_response = "".join(parts)
+            await self._save(self.save_chat_history, user_id, message, full_response, context)
+            self.memory.record(user_id, message, full_response)
         else:
             # Non-stream path uses Gemini non-stream
-            response = await self.chat_nonstream(message, context, response_mode=response_mode, max_tokens=max_tokens)
-            self.save_chat_history(user_id, message, response, context)
+            response = await self.chat_nonstream(message, context, response_mode=response_mode, max_tokens=max_tokens, history=history)
+            await self._save(self.save_chat_history, user_id, message, response, context)
+            self.memory.record(user_id, message, response)
             yield response
     
+    async def _save(self, save: Callable[..., None], *args) -> None:
+        """Run a save method: it only queues with write-behind on, otherwise it writes"""
+        if self.writes.write_behind:
+            save(*args)
+        else:
+            await run_db(save, *args)
+    
     def save_chat_history(self, user_id: str, message: str, response: str, context: str):
-        """Save chat interaction to database"""
+        """Queue a chat interaction for the database"""
         try:
             import uuid
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO chat_history (id, user_id, message, response, context)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (str(uuid.uuid4()), user_id, message, response, context))
-            
-            conn.commit()
-            conn.close()
+            self.writes.add("chat_history", (
+                str(uuid.uuid4()), user_id, message, response, context, self.writes.timestamp()
+            ))
         except Exception as e:
             logger.error(f"Failed to save chat history: {e}")
 
@@ -300,28 +1404,29 @@ class EnhancedAIService:
             return ""
     
     def get_chat_history(self, user_id: str, limit: int = 10) -> List[Dict]:
-        """Get user's chat history"""
+        """Get user's chat history, newest first, including rows not yet written"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT message, response, context, created_at
-                FROM chat_history 
-                WHERE user_id = ?
-                ORDER BY created_at DESC
-                LIMIT ?
-            ''', (user_id, limit))
-            
-            rows = cursor.fetchall()
-            conn.close()
+            # Queued first: a flush in between leaves a row in both, never in neither
+            queued = self.writes.pending("chat_history", user_id)[::-1]
+            with db_connection(self.db_path) as (conn, cursor):
+                cursor.execute('''
+                    SELECT id, message, response, context, created_at
+                    FROM chat_history 
+                    WHERE user_id = ?
+                    ORDER BY created_at DESC, rowid DESC
+                    LIMIT ?
+                ''', (user_id, limit))
+                
+                rows = cursor.fetchall()
             
+            queued_ids = {row[0] for row in queued}
+            rows = [row[:1] + row[2:] for row in queued] + [row for row in rows if row[0] not in queued_ids]
             return [{
-                "message": row[0],
-                "response": row[1], 
-                "context": row[2],
-                "created_at": row[3]
-            } for row in rows]
+                "message": row[1],
+                "response": row[2], 
+                "context": row[3],
+                "created_at": row[4]
+            } for row in rows[:limit]]
             
         except Exception as e:
             logger.error(f"Failed to get chat history: {e}")
@@ -332,24 +1437,15 @@ class EnhancedAIService:
         try:
             import uuid
             
-            # Save document to database
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
             doc_id = str(uuid.uuid4())
             file_type = Path(filename).suffix.lower()
             
-            cursor.execute('''
-                INSERT INTO user_documents (id, user_id, filename, content, file_type)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (doc_id, user_id, filename, content, file_type))
-            
-            conn.commit()
-            conn.close()
+            # Save document to database
+            await self._save(self._insert_document, doc_id, user_id, filename, content, file_type)
             
             # Generate AI insights
             insights = await self.analyze_document(content, file_type)
-            self.save_ai_insights(user_id, "document_analysis", insights)
+            await self._save(self.save_ai_insights, user_id, "document_analysis", insights)
             
             return {
                 "success": True,
@@ -366,6 +1462,10 @@ class EnhancedAIService:
                 "message": "Döküman yükleme hatası"
             }
     
+    def _insert_document(self, doc_id: str, user_id: str, filename: str, content: str, file_type: str):
+        """Queue an uploaded document for the database"""
+        self.writes.add("user_documents", (doc_id, user_id, filename, content, file_type, self.writes.timestamp()))
+    
     async def analyze_document(self, content: str, file_type: str) -> Dict[str, Any]:
         """Analyze uploaded document with AI"""
         try:
@@ -386,14 +1486,8 @@ class EnhancedAIService:
             JSON formatında yanıt ver.
             """
             
-            gemini_available = await self.check_gemini_status()
-            
-            if gemini_available:
-                response_text = ""
-                async for chunk in self.chat_with_gemini_stream(analysis_prompt, "profile"):
-                    response_text += chunk
-            else:
-                response_text = await self.chat_nonstream(analysis_prompt, "profile")
+            # Non-streaming, so re-uploads of the same content hit the response cache
+            response_text = await self.chat_nonstream(analysis_prompt, "profile")
             
             # Try to parse as JSON, fallback to structured text
             try:
@@ -414,42 +1508,35 @@ class EnhancedAIService:
             }
     
     def save_ai_insights(self, user_id: str, insight_type: str, insight_data: Dict):
-        """Save AI insights to database"""
+        """Queue AI insights for the database"""
         try:
             import uuid
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO ai_insights (id, user_id, insight_type, insight_data)
-                VALUES (?, ?, ?, ?)
-            ''', (str(uuid.uuid4()), user_id, insight_type, json.dumps(insight_data)))
-            
-            conn.commit()
-            conn.close()
+            self.writes.add("ai_insights", (
+                str(uuid.uuid4()), user_id, insight_type, json.dumps(insight_data), self.writes.timestamp()
+            ))
         except Exception as e:
             logger.error(f"Failed to save AI insights: {e}")
     
     def get_user_insights(self, user_id: str) -> List[Dict]:
-        """Get user's AI insights"""
+        """Get user's AI insights, newest first, including rows not yet written"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT insight_type, insight_data, created_at
-                FROM ai_insights 
-                WHERE user_id = ?
-                ORDER BY created_at DESC
-            ''', (user_id,))
-            
-            rows = cursor.fetchall()
-            conn.close()
+            queued = self.writes.pending("ai_insights", user_id)[::-1]
+            with db_connection(self.db_path) as (conn, cursor):
+                cursor.execute('''
+                    SELECT id, insight_type, insight_data, created_at
+                    FROM ai_insights 
+                    WHERE user_id = ?
+                    ORDER BY created_at DESC
+                ''', (user_id,))
+                
+                rows = cursor.fetchall()
             
+            queued_ids = {row[0] for row in queued}
+            rows = [row[:1] + row[2:] for row in queued] + [row for row in rows if row[0] not in queued_ids]
             return [{
-                "type": row[0],
-                "data": json.loads(row[1]),
-                "created_at": row[2]
+                "type": row[1],
+                "data": json.loads(row[2]),
+                "created_at": row[3]
             } for row in rows]
             
         except Exception as e:
@@ -458,3 +1545,19 @@ class EnhancedAIService:
 
 # Global instance
 enhanced_ai_service = EnhancedAIService()
+
+async def start_ai_write_flusher():
+    """Background task writing queued chat history, insights, documents and cache usage to the database"""
+    writes = enhanced_ai_service.writes
+    response_cache = enhanced_ai_service.response_cache
+    while True:
+        try:
+            await writes.wait(settings.AI_WRITE_FLUSH_SECONDS)
+            if writes.pending():
+                await run_db(writes.flush)
+            if response_cache.pending_usage():
+                await run_db(response_cache.flush_usage)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"AI write flush error: {e}")
@@ -1,228 +1,441 @@
 """
 Job management service with real functionality
 """
-import sqlite3
+import asyncio
+import base64
 import json
+import re
+import sqlite3
+import threading
+import time
 import uuid
 import logging
-from typing import List, Dict, Any, Optional
+from collections import OrderedDict
+from typing import Callable, List, Dict, Any, Optional, Tuple
 from datetime import datetime, timedelta
 
+from api.config import settings
+from api.database import db_connection, db_writer, migrate_db, run_db
+from api.migrations import create_job_search_index
+
 logger = logging.getLogger(__name__)
 
+JOB_COLUMNS = '''
+    id, title, company, company_logo, location, job_type, experience_level,
+    salary_min, salary_max, description, requirements, skills, benefits,
+    remote_friendly, created_at, application_deadline, views, applications_count
+'''
+
+# Fields create_job/update_job accept; list values are stored as JSON
+JOB_FIELDS = [
+    "title", "company", "company_logo", "location", "job_type", "experience_level",
+    "salary_min", "salary_max", "description", "requirements", "skills", "benefits",
+    "remote_friendly", "is_active", "application_deadline"
+]
+JOB_JSON_FIELDS = {"requirements", "skills", "benefits"}
+
+# BM25 weights of the jobs_fts columns (title, company, description, skills, requirements)
+SEARCH_WEIGHTS = [10.0, 5.0, 1.0, 4.0, 2.0]
+
+class InvalidCursorError(ValueError):
+    """Raised for a page cursor that is malformed or belongs to another listing"""
+
+def fts_query(search_query: str) -> str:
+    """FTS5 MATCH expression requiring every word of the query as a prefix.
+
+    Words are quoted so FTS5 syntax in user input is matched literally;
+    unicode61 with ``remove_diacritics 2`` folds case and accents, so
+    "Istanbul", "İstanbul" and "istanbul" all match the same jobs.
+    """
+    folded = search_query.replace('ı', 'i').replace('İ', 'i')
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", folded))
+
+class JobViewCounter:
+    """Write-behind buffer for job detail views.
+    
+    ``record`` only bumps an in-memory count, so viewing a job stays a pure
+    read; ``flush`` adds the buffered counts to ``jobs.views`` in one
+    batched write. Counts of a failed flush are put back and retried, and
+    the app flushes once more on shutdown, so views are only lost if the
+    process dies in between.
+    """
+    
+    def __init__(self, db_path: str = "uphera.db"):
+        self.db_path = db_path
+        self._pending: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stats = {"recorded": 0, "flushed": 0, "flushes": 0, "failures": 0}
+    
+    def record(self, job_id: str) -> None:
+        with self._lock:
+            self._pending[job_id] = self._pending.get(job_id, 0) + 1
+            self._stats["recorded"] += 1
+    
+    def pending(self, job_id: Optional[str] = None) -> int:
+        """Buffered views of one job, or of all jobs"""
+        with self._lock:
+            if job_id is None:
+                return sum(self._pending.values())
+            return self._pending.get(job_id, 0)
+    
+    def flush(self) -> int:
+        """Write buffered views to the database; returns how many were written"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return 0
+            
+            try:
+                with db_writer(self.db_path) as (conn, cursor):
+                    cursor.executemany(
+                        "UPDATE jobs SET views = views + ? WHERE id = ?",
+                        [(count, job_id) for job_id, count in batch.items()]
+                    )
+            except Exception:
+                # Put the counts back for the next flush
+                with self._lock:
+                    for job_id, count in batch.items():
+                        self._pending[job_id] = self._pending.get(job_id, 0) + count
+                    self._stats["failures"] += 1
+                raise
+            
+            flushed = sum(batch.values())
+            with self._lock:
+                self._stats["flushed"] += flushed
+                self._stats["flushes"] += 1
+            return flushed
+    
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "pending_jobs": len(self._pending),
+                "pending_views": sum(self._pending.values()),
+                **self._stats,
+            }
+
 class JobService:
     """Real job management with database integration"""
     
-    def __init__(self, db_path: str = "uphera.db"):
+    def __init__(self, db_path: str = "uphera.db", count_cache_ttl: float = 30.0, count_cache_size: int = 256):
         self.db_path = db_path
+        self._listeners: List[Callable[[str, Dict[str, Any]], None]] = []
+        self.fts_enabled = False
+        self.count_cache_ttl = count_cache_ttl
+        self.count_cache_size = max(1, int(count_cache_size))
+        self._count_cache: "OrderedDict[tuple, Tuple[int, float]]" = OrderedDict()
+        self._count_lock = threading.Lock()
+        self._count_generation = 0
+        self.view_counter = JobViewCounter(db_path)
         self.init_job_tables()
         self.seed_demo_jobs()
     
     def init_job_tables(self):
-        """Initialize job-related database tables"""
+        """Bring the job tables to the current schema (see ``api.migrations``)"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Jobs table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS jobs (
-                    id TEXT PRIMARY KEY,
-                    title TEXT NOT NULL,
-                    company TEXT NOT NULL,
-                    company_logo TEXT,
-                    location TEXT,
-                    job_type TEXT DEFAULT 'full-time',
-                    experience_level TEXT DEFAULT 'entry',
-                    salary_min INTEGER,
-                    salary_max INTEGER,
-                    description TEXT,
-                    requirements TEXT, -- JSON array
-                    skills TEXT, -- JSON array
-                    benefits TEXT, -- JSON array
-                    remote_friendly BOOLEAN DEFAULT FALSE,
-                    is_active BOOLEAN DEFAULT TRUE,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    application_deadline TIMESTAMP,
-                    views INTEGER DEFAULT 0,
-                    applications_count INTEGER DEFAULT 0
-                )
-            ''')
-            
-            # Job applications table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS job_applications (
-                    id TEXT PRIMARY KEY,
-                    user_id TEXT NOT NULL,
-                    job_id TEXT NOT NULL,
-                    status TEXT DEFAULT 'pending',
-                    cover_letter TEXT,
-                    resume_content TEXT,
-                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    notes TEXT,
-                    FOREIGN KEY (user_id) REFERENCES users (id),
-                    FOREIGN KEY (job_id) REFERENCES jobs (id),
-                    UNIQUE(user_id, job_id)
-                )
-            ''')
-            
-            # Job bookmarks table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS job_bookmarks (
-                    id TEXT PRIMARY KEY,
-                    user_id TEXT NOT NULL,
-                    job_id TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (id),
-                    FOREIGN KEY (job_id) REFERENCES jobs (id),
-                    UNIQUE(user_id, job_id)
-                )
-            ''')
-            
-            # Job recommendations table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS job_recommendations (
-                    id TEXT PRIMARY KEY,
-                    user_id TEXT NOT NULL,
-                    job_id TEXT NOT NULL,
-                    match_score REAL,
-                    reasons TEXT, -- JSON array
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (id),
-                    FOREIGN KEY (job_id) REFERENCES jobs (id),
-                    UNIQUE(user_id, job_id)
-                )
-            ''')
-            
-            conn.commit()
-            conn.close()
+            migrate_db(self.db_path)
             logger.info("✅ Job tables initialized")
             
         except Exception as e:
             logger.error(f"❌ Job tables initialization failed: {e}")
+        
+        self.fts_enabled = self._has_search_index() or self._create_search_index()
+    
+    def _create_search_index(self) -> bool:
+        """Build jobs_fts when its migration was skipped for lack of FTS5 and FTS5 is available now"""
+        try:
+            with db_writer(self.db_path) as (conn, cursor):
+                create_job_search_index(cursor)
+        except sqlite3.Error as e:
+            logger.warning(f"⚠️ Job search index not created, using LIKE search: {e}")
+            return False
+        created = self._has_search_index()
+        if created:
+            logger.info("✅ Job search index created")
+        return created
+    
+    def _has_search_index(self) -> bool:
+        """Whether jobs_fts exists; SQLite builds without FTS5 use LIKE search"""
+        try:
+            with db_connection(self.db_path) as (conn, cursor):
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'jobs_fts'")
+                return cursor.fetchone() is not None
+        except sqlite3.Error:
+            return False
     
     def seed_demo_jobs(self):
         """Create demo job postings if none exist"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Check if jobs already exist
-            cursor.execute("SELECT COUNT(*) FROM jobs")
-            count = cursor.fetchone()[0]
-            
-            if count > 0:
-                conn.close()
-                return
+            with db_writer(self.db_path) as (conn, cursor):
+                # Check if jobs already exist
+                cursor.execute("SELECT COUNT(*) FROM jobs")
+                count = cursor.fetchone()[0]
+                
+                if count > 0:
+                    return
+                
+                demo_jobs = [
+                    {
+                        "title": "Frontend Developer",
+                        "company": "TechStart İstanbul",
+                        "company_logo": "https://via.placeholder.com/100x100?text=TS",
+                        "location": "İstanbul, Türkiye",
+                        "job_type": "full-time",
+                        "experience_level": "junior",
+                        "salary_min": 25000,
+                        "salary_max": 35000,
+                        "description": "React ve TypeScript ile modern web uygulamaları geliştiren Frontend Developer arıyoruz. UpSchool mezunları başvuru için teşvik edilir.",
+                        "requirements": ["React", "TypeScript", "HTML/CSS", "Git", "REST API"],
+                        "skills": ["React", "TypeScript", "JavaScript", "CSS", "HTML"],
+                        "benefits": ["Esnek çalışma saatleri", "Uzaktan çalışma imkanı", "Eğitim desteği", "Sağlık sigortası"],
+                        "remote_friendly": True,
+                        "application_deadline": (datetime.now() + timedelta(days=30)).isoformat()
+                    },
+                    {
+                        "title": "Full Stack Developer",
+                        "company": "Digital Agency Pro",
+                        "company_logo": "https://via.placeholder.com/100x100?text=DAP",
+                        "location": "Ankara, Türkiye",
+                        "job_type": "full-time",
+                        "experience_level": "mid",
+                        "salary_min": 35000,
+                        "salary_max": 45000,
+                        "description": "Full stack web geliştirme deneyimi olan, React ve Node.js teknolojilerinde uzman developer arayışımız.",
+                        "requirements": ["React", "Node.js", "MongoDB", "Express", "2+ yıl deneyim"],
+                        "skills": ["React", "Node.js", "MongoDB", "Express", "JavaScript"],
+                        "benefits": ["Rekabetçi maaş", "Proje bonusları", "Teknoloji eğitimleri", "Takım gezileri"],
+                        "remote_friendly": False,
+                        "application_deadline": (datetime.now() + timedelta(days=25)).isoformat()
+                    },
+                    {
+                        "title": "React Native Developer",
+                        "company": "MobilTech Solutions",
+                        "company_logo": "https://via.placeholder.com/100x100?text=MTS",
+                        "location": "İzmir, Türkiye",
+                        "job_type": "contract",
+                        "experience_level": "entry",
+                        "salary_min": 20000,
+                        "salary_max": 30000,
+                        "description": "Mobil uygulama geliştirme alanında büyüyen ekibimize katılacak React Native Developer.",
+                        "requirements": ["React Native", "JavaScript", "iOS/Android", "Git"],
+                        "skills": ["React Native", "JavaScript", "Mobile Development", "React"],
+                        "benefits": ["Flexible hours", "Remote work", "Learning budget", "Tech conferences"],
+                        "remote_friendly": True,
+                        "application_deadline": (datetime.now() + timedelta(days=20)).isoformat()
+                    },
+                    {
+                        "title": "Python Backend Developer",
+                        "company": "DataCorp Analytics",
+                        "company_logo": "https://via.placeholder.com/100x100?text=DCA",
+                        "location": "İstanbul, Türkiye",
+                        "job_type": "full-time",
+                        "experience_level": "junior",
+                        "salary_min": 28000,
+                        "salary_max": 38000,
+                        "description": "Veri analizi ve web backend geliştirme projelerinde çalışacak Python Developer.",
+                        "requirements": ["Python", "Django/FastAPI", "PostgreSQL", "REST API", "Git"],
+                        "skills": ["Python", "Django", "FastAPI", "PostgreSQL", "REST API"],
+                        "benefits": ["Mentorship program", "Conference tickets", "Health insurance", "Remote options"],
+                        "remote_friendly": True,
+                        "application_deadline": (datetime.now() + timedelta(days=35)).isoformat()
+                    },
+                    {
+                        "title": "UI/UX Designer & Frontend",
+                        "company": "Creative Digital",
+                        "company_logo": "https://via.placeholder.com/100x100?text=CD",
+                        "location": "Bursa, Türkiye",
+                        "job_type": "full-time",
+                        "experience_level": "entry",
+                        "salary_min": 22000,
+                        "salary_max": 32000,
+                        "description": "Tasarım ve frontend geliştirme becerilerini birleştiren hibrit pozisyon. Figma ve React deneyimi.",
+                        "requirements": ["Figma", "Adobe XD", "HTML/CSS", "JavaScript", "React", "Design systems"],
+                        "skills": ["UI/UX Design", "Figma", "React", "CSS", "JavaScript"],
+                        "benefits": ["Creative environment", "Design tools budget", "Flexible schedule", "Training programs"],
+                        "remote_friendly": False,
+                        "application_deadline": (datetime.now() + timedelta(days=28)).isoformat()
+                    }
+                ]
+                
+                for job_data in demo_jobs:
+                    job_id = str(uuid.uuid4())
+                    cursor.execute('''
+                        INSERT INTO jobs (
+                            id, title, company, company_logo, location, job_type, experience_level,
+                            salary_min, salary_max, description, requirements, skills, benefits,
+                            remote_friendly, application_deadline
+                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', (
+                        job_id, job_data["title"], job_data["company"], job_data["company_logo"],
+                        job_data["location"], job_data["job_type"], job_data["experience_level"],
+                        job_data["salary_min"], job_data["salary_max"], job_data["description"],
+                        json.dumps(job_data["requirements"]), json.dumps(job_data["skills"]),
+                        json.dumps(job_data["benefits"]), job_data["remote_friendly"],
+                        job_data["application_deadline"]
+                    ))
+                
+                conn.commit()
+            logger.info(f"✅ Seeded {len(demo_jobs)} demo jobs")
             
-            demo_jobs = [
-                {
-                    "title": "Frontend Developer",
-                    "company": "TechStart İstanbul",
-                    "company_logo": "https://via.placeholder.com/100x100?text=TS",
-                    "location": "İstanbul, Türkiye",
-                    "job_type": "full-time",
-                    "experience_level": "junior",
-                    "salary_min": 25000,
-                    "salary_max": 35000,
-                    "description": "React ve TypeScript ile modern web uygulamaları geliştiren Frontend Developer arıyoruz. UpSchool mezunları başvuru için teşvik edilir.",
-                    "requirements": ["React", "TypeScript", "HTML/CSS", "Git", "REST API"],
-                    "skills": ["React", "TypeScript", "JavaScript", "CSS", "HTML"],
-                    "benefits": ["Esnek çalışma saatleri", "Uzaktan çalışma imkanı", "Eğitim desteği", "Sağlık sigortası"],
-                    "remote_friendly": True,
-                    "application_deadline": (datetime.now() + timedelta(days=30)).isoformat()
-                },
-                {
-                    "title": "Full Stack Developer",
-                    "company": "Digital Agency Pro",
-                    "company_logo": "https://via.placeholder.com/100x100?text=DAP",
-                    "location": "Ankara, Türkiye",
-                    "job_type": "full-time",
-                    "experience_level": "mid",
-                    "salary_min": 35000,
-                    "salary_max": 45000,
-                    "description": "Full stack web geliştirme deneyimi olan, React ve Node.js teknolojilerinde uzman developer arayışımız.",
-                    "requirements": ["React", "Node.js", "MongoDB", "Express", "2+ yıl deneyim"],
-                    "skills": ["React", "Node.js", "MongoDB", "Express", "JavaScript"],
-                    "benefits": ["Rekabetçi maaş", "Proje bonusları", "Teknoloji eğitimleri", "Takım gezileri"],
-                    "remote_friendly": False,
-                    "application_deadline": (datetime.now() + timedelta(days=25)).isoformat()
-                },
-                {
-                    "title": "React Native Developer",
-                    "company": "MobilTech Solutions",
-                    "company_logo": "https://via.placeholder.com/100x100?text=MTS",
-                    "location": "İzmir, Türkiye",
-                    "job_type": "contract",
-                    "experience_level": "entry",
-                    "salary_min": 20000,
-                    "salary_max": 30000,
-                    "description": "Mobil uygulama geliştirme alanında büyüyen ekibimize katılacak React Native Developer.",
-                    "requirements": ["React Native", "JavaScript", "iOS/Android", "Git"],
-                    "skills": ["React Native", "JavaScript", "Mobile Development", "React"],
-                    "benefits": ["Flexible hours", "Remote work", "Learning budget", "Tech conferences"],
-                    "remote_friendly": True,
-                    "application_deadline": (datetime.now() + timedelta(days=20)).isoformat()
-                },
-                {
-                    "title": "Python Backend Developer",
-                    "company": "DataCorp Analytics",
-                    "company_logo": "https://via.placeholder.com/100x100?text=DCA",
-                    "location": "İstanbul, Türkiye",
-                    "job_type": "full-time",
-                    "experience_level": "junior",
-                    "salary_min": 28000,
-                    "salary_max": 38000,
-                    "description": "Veri analizi ve web backend geliştirme projelerinde çalışacak Python Developer.",
-                    "requirements": ["Python", "Django/FastAPI", "PostgreSQL", "REST API", "Git"],
-                    "skills": ["Python", "Django", "FastAPI", "PostgreSQL", "REST API"],
-                    "benefits": ["Mentorship program", "Conference tickets", "Health insurance", "Remote options"],
-                    "remote_friendly": True,
-                    "application_deadline": (datetime.now() + timedelta(days=35)).isoformat()
-                },
-                {
-                    "title": "UI/UX Designer & Frontend",
-                    "company": "Creative Digital",
-                    "company_logo": "https://via.placeholder.com/100x100?text=CD",
-                    "location": "Bursa, Türkiye",
-                    "job_type": "full-time",
-                    "experience_level": "entry",
-                    "salary_min": 22000,
-                    "salary_max": 32000,
-                    "description": "Tasarım ve frontend geliştirme becerilerini birleştiren hibrit pozisyon. Figma ve React deneyimi.",
-                    "requirements": ["Figma", "Adobe XD", "HTML/CSS", "JavaScript", "React", "Design systems"],
-                    "skills": ["UI/UX Design", "Figma", "React", "CSS", "JavaScript"],
-                    "benefits": ["Creative environment", "Design tools budget", "Flexible schedule", "Training programs"],
-                    "remote_friendly": False,
-                    "application_deadline": (datetime.now() + timedelta(days=28)).isoformat()
-                }
-            ]
+        except Exception as e:
+            logger.error(f"❌ Failed to seed demo jobs: {e}")
+    
+    @staticmethod
+    def _row_to_job(row) -> Dict[str, Any]:
+        """Map a ``JOB_COLUMNS`` row to the API's job dict"""
+        return {
+            "id": row[0],
+            "title": row[1],
+            "company": row[2],
+            "company_logo": row[3],
+            "location": row[4],
+            "job_type": row[5],
+            "experience_level": row[6],
+            "salary_min": row[7],
+            "salary_max": row[8],
+            "description": row[9],
+            "requirements": json.loads(row[10]) if row[10] else [],
+            "skills": json.loads(row[11]) if row[11] else [],
+            "benefits": json.loads(row[12]) if row[12] else [],
+            "remote_friendly": bool(row[13]),
+            "created_at": row[14],
+            "application_deadline": row[15],
+            "views": row[16],
+            "applications_count": row[17]
+        }
+    
+    def add_listener(self, listener: Callable[[str, Dict[str, Any]], None]) -> None:
+        """Register ``listener(event, job)`` for "created"/"updated" jobs"""
+        self._listeners.append(listener)
+    
+    def _notify(self, event: str, job: Dict[str, Any]) -> None:
+        self.invalidate_counts()
+        for listener in self._listeners:
+            try:
+                listener(event, job)
+            except Exception as e:
+                logger.error(f"Job listener failed for {job.get('id')}: {e}")
+    
+    @staticmethod
+    def _job_values(job_data: Dict[str, Any], fields: List[str]) -> List[Any]:
+        return [
+            json.dumps(job_data[field]) if field in JOB_JSON_FIELDS else job_data[field]
+            for field in fields
+        ]
+    
+    def _get_job_for_listeners(self, cursor, job_id: str) -> Optional[Dict[str, Any]]:
+        cursor.execute(f"SELECT {JOB_COLUMNS}, is_active, updated_at FROM jobs WHERE id = ?", (job_id,))
+        row = cursor.fetchone()
+        if not row:
+            return None
+        return {**self._row_to_job(row), "is_active": bool(row[18]), "updated_at": row[19]}
+    
+    def create_job(self, job_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Create a job posting and notify listeners"""
+        try:
+            job_id = job_data.get("id") or str(uuid.uuid4())
+            fields = [field for field in JOB_FIELDS if field in job_data]
+            with db_writer(self.db_path) as (conn, cursor):
+                cursor.execute(
+                    f"INSERT INTO jobs (id, {', '.join(fields)}) VALUES (?{', ?' * len(fields)})",
+                    [job_id] + self._job_values(job_data, fields)
+                )
+                job = self._get_job_for_listeners(cursor, job_id)
             
-            for job_data in demo_jobs:
-                job_id = str(uuid.uuid4())
-                cursor.execute('''
-                    INSERT INTO jobs (
-                        id, title, company, company_logo, location, job_type, experience_level,
-                        salary_min, salary_max, description, requirements, skills, benefits,
-                        remote_friendly, application_deadline
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    job_id, job_data["title"], job_data["company"], job_data["company_logo"],
-                    job_data["location"], job_data["job_type"], job_data["experience_level"],
-                    job_data["salary_min"], job_data["salary_max"], job_data["description"],
-                    json.dumps(job_data["requirements"]), json.dumps(job_data["skills"]),
-                    json.dumps(job_data["benefits"]), job_data["remote_friendly"],
-                    job_data["application_deadline"]
-                ))
+            self._notify("created", job)
+            return job
             
-            conn.commit()
-            conn.close()
-            logger.info(f"✅ Seeded {len(demo_jobs)} demo jobs")
+        except Exception as e:
+            logger.error(f"Failed to create job: {e}")
+            return None
+    
+    def update_job(self, job_id: str, job_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Update a job posting and notify listeners"""
+        try:
+            fields = [field for field in JOB_FIELDS if field in job_data]
+            with db_writer(self.db_path) as (conn, cursor):
+                if fields:
+                    assignments = ', '.join(f"{field} = ?" for field in fields)
+                    cursor.execute(
+                        f"UPDATE jobs SET {assignments}, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                        self._job_values(job_data, fields) + [job_id]
+                    )
+                job = self._get_job_for_listeners(cursor, job_id)
+            
+            if job:
+                self._notify("updated", job)
+            return job
             
         except Exception as e:
-            logger.error(f"❌ Failed to seed demo jobs: {e}")
+            logger.error(f"Failed to update job {job_id}: {e}")
+            return None
+    
+    def get_job_versions(self) -> Dict[str, Optional[str]]:
+        """``{job_id: updated_at}`` of every active job"""
+        with db_connection(self.db_path) as (conn, cursor):
+            cursor.execute("SELECT id, updated_at FROM jobs WHERE is_active = 1")
+            return dict(cursor.fetchall())
+    
+    def get_jobs_by_ids(self, job_ids: List[str]) -> List[Dict[str, Any]]:
+        """Active jobs with the given ids, including ``updated_at``"""
+        jobs = []
+        with db_connection(self.db_path) as (conn, cursor):
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(job_ids), 500):
+                chunk = job_ids[start:start + 500]
+                cursor.execute(f'''
+                    SELECT {JOB_COLUMNS}, updated_at FROM jobs
+                    WHERE is_active = 1 AND id IN ({', '.join('?' * len(chunk))})
+                ''', chunk)
+                jobs.extend({**self._row_to_job(row), "updated_at": row[18]} for row in cursor.fetchall())
+        return jobs
+    
+    def _cached_count(self, key: tuple) -> Optional[int]:
+        with self._count_lock:
+            entry = self._count_cache.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                self._count_cache.pop(key, None)
+                return None
+            self._count_cache.move_to_end(key)
+            return entry[0]
+    
+    def _store_count(self, key: tuple, total: int, generation: int) -> None:
+        with self._count_lock:
+            # A job changed while counting; the next request recounts
+            if generation != self._count_generation:
+                return
+            self._count_cache[key] = (total, time.monotonic() + self.count_cache_ttl)
+            self._count_cache.move_to_end(key)
+            while len(self._count_cache) > self.count_cache_size:
+                self._count_cache.popitem(last=False)
+    
+    def invalidate_counts(self) -> None:
+        """Drop cached listing totals, e.g. after jobs were written outside this service"""
+        with self._count_lock:
+            self._count_generation += 1
+            self._count_cache.clear()
+    
+    @staticmethod
+    def encode_cursor(mode: str, key: Any, job_id: str) -> str:
+        """Opaque page cursor: the sort key and id of the last job on a page"""
+        raw = json.dumps([mode, key, job_id], separators=(",", ":")).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+    
+    @staticmethod
+    def decode_cursor(page_cursor: str, mode: str) -> Tuple[Any, str]:
+        """Inverse of ``encode_cursor``; raises InvalidCursorError for foreign or malformed cursors"""
+        try:
+            raw = base64.urlsafe_b64decode(page_cursor + "=" * (-len(page_cursor) % 4))
+            cursor_mode, key, job_id = json.loads(raw)
+        except (ValueError, TypeError) as e:
+            raise InvalidCursorError(f"Invalid page cursor: {e}")
+        if cursor_mode != mode or not isinstance(job_id, str):
+            raise InvalidCursorError("Page cursor does not belong to this listing")
+        # Sort keys are timestamps or BM25 ranks; anything else cannot be bound as a parameter
+        if isinstance(key, bool) or not isinstance(key, (str, int, float)):
+            raise InvalidCursorError("Invalid page cursor: bad sort key")
+        return key, job_id
     
     def get_jobs(
         self, 
@@ -233,139 +446,125 @@ class JobService:
         experience_level: str = "",
         skills: List[str] = None,
         remote_only: bool = False,
-        search_query: str = ""
+        search_query: str = "",
+        page_cursor: str = ""
     ) -> Dict[str, Any]:
-        """Get jobs with filtering and pagination"""
+        """Get jobs with filtering and pagination.
+        
+        Pages continue either from ``offset`` or, cheaper on deep pages, from
+        ``page_cursor`` (the ``next_cursor`` of the previous page), which
+        seeks past the last job seen instead of skipping rows. ``total`` is
+        cached per filter combination for ``count_cache_ttl`` seconds.
+        """
+        match_expression = fts_query(search_query) if search_query and self.fts_enabled else ""
+        # Search results are ordered by BM25 rank, listings by recency; id breaks ties
+        mode = "rank" if match_expression else "recent"
+        after = self.decode_cursor(page_cursor, mode) if page_cursor else None
+        
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Build query
-            where_conditions = ["is_active = 1"]
-            params = []
-            
-            if location:
-                where_conditions.append("location LIKE ?")
-                params.append(f"%{location}%")
-            
-            if job_type:
-                where_conditions.append("job_type = ?")
-                params.append(job_type)
-            
-            if experience_level:
-                where_conditions.append("experience_level = ?")
-                params.append(experience_level)
-            
-            if remote_only:
-                where_conditions.append("remote_friendly = 1")
-            
-            if search_query:
-                where_conditions.append("(title LIKE ? OR company LIKE ? OR description LIKE ?)")
-                search_param = f"%{search_query}%"
-                params.extend([search_param, search_param, search_param])
-            
-            where_clause = " AND ".join(where_conditions)
-            
-            # Get total count
-            count_query = f"SELECT COUNT(*) FROM jobs WHERE {where_clause}"
-            cursor.execute(count_query, params)
-            total = cursor.fetchone()[0]
-            
-            # Get jobs
-            jobs_query = f'''
-                SELECT id, title, company, company_logo, location, job_type, experience_level,
-                       salary_min, salary_max, description, requirements, skills, benefits,
-                       remote_friendly, created_at, application_deadline, views, applications_count
-                FROM jobs 
-                WHERE {where_clause}
-                ORDER BY created_at DESC
-                LIMIT ? OFFSET ?
-            '''
-            
-            cursor.execute(jobs_query, params + [limit, offset])
-            rows = cursor.fetchall()
-            
-            jobs = []
-            for row in rows:
-                job = {
-                    "id": row[0],
-                    "title": row[1],
-                    "company": row[2],
-                    "company_logo": row[3],
-                    "location": row[4],
-                    "job_type": row[5],
-                    "experience_level": row[6],
-                    "salary_min": row[7],
-                    "salary_max": row[8],
-                    "description": row[9],
-                    "requirements": json.loads(row[10]) if row[10] else [],
-                    "skills": json.loads(row[11]) if row[11] else [],
-                    "benefits": json.loads(row[12]) if row[12] else [],
-                    "remote_friendly": bool(row[13]),
-                    "created_at": row[14],
-                    "application_deadline": row[15],
-                    "views": row[16],
-                    "applications_count": row[17]
-                }
-                jobs.append(job)
-            
-            conn.close()
+            with db_connection(self.db_path) as (conn, cursor):
+                # Build query
+                where_conditions = ["is_active = 1"]
+                params = []
+                
+                if location:
+                    where_conditions.append("location LIKE ?")
+                    params.append(f"%{location}%")
+                
+                if job_type:
+                    where_conditions.append("job_type = ?")
+                    params.append(job_type)
+                
+                if experience_level:
+                    where_conditions.append("experience_level = ?")
+                    params.append(experience_level)
+                
+                if remote_only:
+                    where_conditions.append("remote_friendly = 1")
+                
+                # Full-text matches, ranked by BM25 (lower is better). CROSS JOIN keeps
+                # the MATCH as the outer loop; otherwise SQLite may rerun it per job row.
+                source = "jobs"
+                if match_expression:
+                    source = f'''
+                        (
+                            SELECT rowid AS match_rowid, bm25(jobs_fts, {', '.join(map(str, SEARCH_WEIGHTS))}) AS rank
+                            FROM jobs_fts WHERE jobs_fts MATCH ?
+                        ) CROSS JOIN jobs ON jobs.rowid = match_rowid
+                    '''
+                    params.insert(0, match_expression)
+                elif search_query:
+                    where_conditions.append("(title LIKE ? OR company LIKE ? OR description LIKE ?)")
+                    search_param = f"%{search_query}%"
+                    params.extend([search_param, search_param, search_param])
+                
+                where_clause = " AND ".join(where_conditions)
+                
+                # Get total count, cached per filter combination
+                count_key = (location, job_type, experience_level, remote_only, match_expression or search_query)
+                total = self._cached_count(count_key)
+                if total is None:
+                    generation = self._count_generation
+                    cursor.execute(f"SELECT COUNT(*) FROM {source} WHERE {where_clause}", params)
+                    total = cursor.fetchone()[0]
+                    self._store_count(count_key, total, generation)
+                
+                # Get jobs, one extra row to know whether another page follows
+                if mode == "rank":
+                    sort_key, order_by, seek = "rank", "rank, id", "(rank, id) > (?, ?)"
+                else:
+                    sort_key, order_by, seek = "created_at", "created_at DESC, id DESC", "(created_at, id) < (?, ?)"
+                page_conditions, page_params = where_conditions, list(params)
+                if after is not None:
+                    page_conditions = where_conditions + [seek]
+                    page_params.extend(after)
+                
+                jobs_query = f'''
+                    SELECT {JOB_COLUMNS}, {sort_key}
+                    FROM {source}
+                    WHERE {" AND ".join(page_conditions)}
+                    ORDER BY {order_by}
+                    LIMIT ? OFFSET ?
+                '''
+                
+                cursor.execute(jobs_query, page_params + [limit + 1, 0 if after else offset])
+                rows = cursor.fetchall()
+                
+                has_more = len(rows) > limit
+                rows = rows[:limit]
+                jobs = [self._row_to_job(row) for row in rows]
             
             return {
                 "jobs": jobs,
                 "total": total,
                 "limit": limit,
                 "offset": offset,
-                "has_more": offset + limit < total
+                "has_more": has_more,
+                "next_cursor": self.encode_cursor(mode, rows[-1][-1], rows[-1][0]) if has_more else None
             }
             
         except Exception as e:
             logger.error(f"Failed to get jobs: {e}")
-            return {"jobs": [], "total": 0, "limit": limit, "offset": offset, "has_more": False}
+            return {"jobs": [], "total": 0, "limit": limit, "offset": offset, "has_more": False, "next_cursor": None}
     
     def get_job_by_id(self, job_id: str) -> Optional[Dict[str, Any]]:
-        """Get single job by ID"""
+        """Get single job by ID, counting a view"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Increment view count
-            cursor.execute("UPDATE jobs SET views = views + 1 WHERE id = ?", (job_id,))
-            
-            # Get job
-            cursor.execute('''
-                SELECT id, title, company, company_logo, location, job_type, experience_level,
-                       salary_min, salary_max, description, requirements, skills, benefits,
-                       remote_friendly, created_at, application_deadline, views, applications_count
-                FROM jobs 
-                WHERE id = ? AND is_active = 1
-            ''', (job_id,))
-            
-            row = cursor.fetchone()
-            conn.commit()
-            conn.close()
+            with db_connection(self.db_path) as (conn, cursor):
+                cursor.execute(f'''
+                    SELECT {JOB_COLUMNS}
+                    FROM jobs 
+                    WHERE id = ? AND is_active = 1
+                ''', (job_id,))
+                
+                row = cursor.fetchone()
             
             if row:
-                return {
-                    "id": row[0],
-                    "title": row[1],
-                    "company": row[2],
-                    "company_logo": row[3],
-                    "location": row[4],
-                    "job_type": row[5],
-                    "experience_level": row[6],
-                    "salary_min": row[7],
-                    "salary_max": row[8],
-                    "description": row[9],
-                    "requirements": json.loads(row[10]) if row[10] else [],
-                    "skills": json.loads(row[11]) if row[11] else [],
-                    "benefits": json.loads(row[12]) if row[12] else [],
-                    "remote_friendly": bool(row[13]),
-                    "created_at": row[14],
-                    "application_deadline": row[15],
-                    "views": row[16],
-                    "applications_count": row[17]
-                }
+                # Buffered; written to jobs.views by the view flusher
+                self.view_counter.record(job_id)
+                job = self._row_to_job(row)
+                job["views"] = (job["views"] or 0) + self.view_counter.pending(job_id)
+                return job
             
             return None
             
@@ -376,37 +575,33 @@ class JobService:
     def apply_to_job(self, user_id: str, job_id: str, cover_letter: str = "", resume_content: str = "") -> Dict[str, Any]:
         """Apply to a job"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Check if already applied
-            cursor.execute(
-                "SELECT id FROM job_applications WHERE user_id = ? AND job_id = ?",
-                (user_id, job_id)
-            )
-            
-            if cursor.fetchone():
-                conn.close()
-                return {
-                    "success": False,
-                    "message": "Bu pozisyona zaten başvuru yaptınız"
-                }
-            
-            # Create application
-            application_id = str(uuid.uuid4())
-            cursor.execute('''
-                INSERT INTO job_applications (id, user_id, job_id, cover_letter, resume_content)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (application_id, user_id, job_id, cover_letter, resume_content))
-            
-            # Update job application count
-            cursor.execute(
-                "UPDATE jobs SET applications_count = applications_count + 1 WHERE id = ?",
-                (job_id,)
-            )
-            
-            conn.commit()
-            conn.close()
+            with db_writer(self.db_path) as (conn, cursor):
+                # Check if already applied
+                cursor.execute(
+                    "SELECT id FROM job_applications WHERE user_id = ? AND job_id = ?",
+                    (user_id, job_id)
+                )
+                
+                if cursor.fetchone():
+                    return {
+                        "success": False,
+                        "message": "Bu pozisyona zaten başvuru yaptınız"
+                    }
+                
+                # Create application
+                application_id = str(uuid.uuid4())
+                cursor.execute('''
+                    INSERT INTO job_applications (id, user_id, job_id, cover_letter, resume_content)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (application_id, user_id, job_id, cover_letter, resume_content))
+                
+                # Update job application count
+                cursor.execute(
+                    "UPDATE jobs SET applications_count = applications_count + 1 WHERE id = ?",
+                    (job_id,)
+                )
+                
+                conn.commit()
             
             return {
                 "success": True,
@@ -424,20 +619,17 @@ class JobService:
     def get_user_applications(self, user_id: str) -> List[Dict[str, Any]]:
         """Get user's job applications"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT ja.id, ja.status, ja.applied_at, ja.updated_at,
-                       j.title, j.company, j.location, j.id as job_id
-                FROM job_applications ja
-                JOIN jobs j ON ja.job_id = j.id
-                WHERE ja.user_id = ?
-                ORDER BY ja.applied_at DESC
-            ''', (user_id,))
-            
-            rows = cursor.fetchall()
-            conn.close()
+            with db_connection(self.db_path) as (conn, cursor):
+                cursor.execute('''
+                    SELECT ja.id, ja.status, ja.applied_at, ja.updated_at,
+                           j.title, j.company, j.location, j.id as job_id
+                    FROM job_applications ja
+                    JOIN jobs j ON ja.job_id = j.id
+                    WHERE ja.user_id = ?
+                    ORDER BY ja.applied_at DESC
+                ''', (user_id,))
+                
+                rows = cursor.fetchall()
             
             return [{
                 "id": row[0],
@@ -459,35 +651,32 @@ class JobService:
     def bookmark_job(self, user_id: str, job_id: str) -> Dict[str, Any]:
         """Bookmark a job"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Check if already bookmarked
-            cursor.execute(
-                "SELECT id FROM job_bookmarks WHERE user_id = ? AND job_id = ?",
-                (user_id, job_id)
-            )
-            
-            if cursor.fetchone():
-                # Remove bookmark
+            with db_writer(self.db_path) as (conn, cursor):
+                # Check if already bookmarked
                 cursor.execute(
-                    "DELETE FROM job_bookmarks WHERE user_id = ? AND job_id = ?",
+                    "SELECT id FROM job_bookmarks WHERE user_id = ? AND job_id = ?",
                     (user_id, job_id)
                 )
-                message = "Favori listesinden çıkarıldı"
-                bookmarked = False
-            else:
-                # Add bookmark
-                bookmark_id = str(uuid.uuid4())
-                cursor.execute(
-                    "INSERT INTO job_bookmarks (id, user_id, job_id) VALUES (?, ?, ?)",
-                    (bookmark_id, user_id, job_id)
-                )
-                message = "Favori listesine eklendi"
-                bookmarked = True
-            
-            conn.commit()
-            conn.close()
+                
+                if cursor.fetchone():
+                    # Remove bookmark
+                    cursor.execute(
+                        "DELETE FROM job_bookmarks WHERE user_id = ? AND job_id = ?",
+                        (user_id, job_id)
+                    )
+                    message = "Favori listesinden çıkarıldı"
+                    bookmarked = False
+                else:
+                    # Add bookmark
+                    bookmark_id = str(uuid.uuid4())
+                    cursor.execute(
+                        "INSERT INTO job_bookmarks (id, user_id, job_id) VALUES (?, ?, ?)",
+                        (bookmark_id, user_id, job_id)
+                    )
+                    message = "Favori listesine eklendi"
+                    bookmarked = True
+                
+                conn.commit()
             
             return {
                 "success": True,
@@ -505,20 +694,17 @@ class JobService:
     def get_user_bookmarks(self, user_id: str) -> List[Dict[str, Any]]:
         """Get user's bookmarked jobs"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT j.id, j.title, j.company, j.location, j.salary_min, j.salary_max,
-                       j.job_type, j.remote_friendly, jb.created_at
-                FROM job_bookmarks jb
-                JOIN jobs j ON jb.job_id = j.id
-                WHERE jb.user_id = ? AND j.is_active = 1
-                ORDER BY jb.created_at DESC
-            ''', (user_id,))
-            
-            rows = cursor.fetchall()
-            conn.close()
+            with db_connection(self.db_path) as (conn, cursor):
+                cursor.execute('''
+                    SELECT j.id, j.title, j.company, j.location, j.salary_min, j.salary_max,
+                           j.job_type, j.remote_friendly, jb.created_at
+                    FROM job_bookmarks jb
+                    JOIN jobs j ON jb.job_id = j.id
+                    WHERE jb.user_id = ? AND j.is_active = 1
+                    ORDER BY jb.created_at DESC
+                ''', (user_id,))
+                
+                rows = cursor.fetchall()
             
             return [{
                 "id": row[0],
@@ -537,4 +723,19 @@ class JobService:
             return []
 
 # Global instance
-job_service = JobService()
+job_service = JobService(
+    count_cache_ttl=settings.JOB_COUNT_CACHE_TTL,
+    count_cache_size=settings.JOB_COUNT_CACHE_SIZE
+)
+
+async def start_job_view_flusher():
+    """Background task writing buffered job views to the database"""
+    while True:
+        try:
+            await asyncio.sleep(settings.JOB_VIEW_FLUSH_SECONDS)
+            if job_service.view_counter.pending():
+                await run_db(job_service.view_counter.flush)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Job view flush error: {e}")
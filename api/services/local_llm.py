@@ -0,0 +1,78 @@
+"""
+Local stand-in LLM for Up Hera
+Deterministic, network-free replacement for the Gemini model (AI_PROVIDER=local)
+"""
+
+import hashlib
+import random
+import time
+from typing import Any, Iterator, List, NamedTuple, Optional, Tuple
+
+VOCABULARY = [
+    "kariyer", "hedef", "mülakat", "beceri", "proje", "deneyim", "ekip", "yazılım",
+    "öğrenme", "portföy", "mentor", "network", "özgeçmiş", "başvuru", "geliştirme",
+    "teknik", "sorumluluk", "iletişim", "planlama", "motivasyon", "adım", "fırsat",
+    "güçlü", "yönlerin", "için", "ve", "ile", "bir", "bu", "daha", "önce", "sonra",
+]
+
+class LocalChunk(NamedTuple):
+    """A response or stream chunk, shaped like the SDK's (only ``text`` is read)"""
+    text: str
+
+class LocalModel:
+    """Stands in for ``genai.GenerativeModel``: same ``generate_content`` call, no network.
+
+    Replies are words drawn from a generator seeded by ``seed`` and the
+    prompt, so the same prompt always gets the same text and timing. The
+    first chunk arrives after ``first_token_ms`` plus normally distributed
+    jitter of ``jitter_ms``; tokens then follow at ``tokens_per_second``,
+    ``chunk_tokens`` per chunk. A reply has ``response_tokens`` tokens, or
+    the request's ``max_output_tokens`` when that is 0 or lower. Waits block
+    the calling thread, as the real SDK does, so the whole streaming path
+    (thread bridge, SSE framing, history writes) is exercised under load.
+    """
+
+    def __init__(
+        self,
+        tokens_per_second: float = 200.0,
+        first_token_ms: float = 300.0,
+        jitter_ms: float = 100.0,
+        chunk_tokens: int = 8,
+        response_tokens: int = 0,
+        seed: int = 0
+    ):
+        self.tokens_per_second = tokens_per_second
+        self.first_token_ms = first_token_ms
+        self.jitter_ms = jitter_ms
+        self.chunk_tokens = max(1, int(chunk_tokens))
+        self.response_tokens = int(response_tokens)
+        self.seed = seed
+
+    def _plan(self, contents: Any, generation_config: Optional[dict]) -> Tuple[List[str], float]:
+        """Tokens of the reply and the delay before the first one, in seconds"""
+        digest = hashlib.sha256(f"{self.seed}:{contents}".encode("utf-8")).digest()
+        rng = random.Random(digest)
+        limit = int((generation_config or {}).get("max_output_tokens") or 256)
+        count = min(self.response_tokens, limit) if self.response_tokens > 0 else limit
+        tokens = [rng.choice(VOCABULARY) for _ in range(count)]
+        delay = max(0.0, rng.gauss(self.first_token_ms, self.jitter_ms)) / 1000
+        return tokens, delay
+
+    def _interval(self, tokens: int) -> float:
+        return tokens / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def _stream(self, tokens: List[str], delay: float) -> Iterator[LocalChunk]:
+        time.sleep(delay)
+        for start in range(0, len(tokens), self.chunk_tokens):
+            chunk = tokens[start:start + self.chunk_tokens]
+            if start:
+                time.sleep(self._interval(len(chunk)))
+            last = start + self.chunk_tokens >= len(tokens)
+            yield LocalChunk(" ".join(chunk) + ("" if last else " "))
+
+    def generate_content(self, contents: Any, stream: bool = False, generation_config: Optional[dict] = None, **kwargs):
+        tokens, delay = self._plan(contents, generation_config)
+        if stream:
+            return self._stream(tokens, delay)
+        time.sleep(delay + self._interval(max(0, len(tokens) - self.chunk_tokens)))
+        return LocalChunk(" ".join(tokens))
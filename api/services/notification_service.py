@@ -5,12 +5,12 @@ Real-time Notification Service for Up Hera
 import asyncio
 import json
 import logging
-import sqlite3
 import uuid
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 from enum import Enum
 
+from api.database import db_connection, db_writer
 from api.services.websocket_service import websocket_service
 
 logger = logging.getLogger(__name__)
@@ -41,40 +41,37 @@ class NotificationService:
     def init_notifications_db(self):
         """Initialize notifications database table"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS notifications (
-                    id TEXT PRIMARY KEY,
-                    user_id TEXT NOT NULL,
-                    type TEXT NOT NULL,
-                    title TEXT NOT NULL,
-                    message TEXT NOT NULL,
-                    data TEXT, -- JSON data
-                    priority TEXT DEFAULT 'medium',
-                    is_read BOOLEAN DEFAULT FALSE,
-                    is_sent BOOLEAN DEFAULT FALSE,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    read_at TIMESTAMP,
-                    expires_at TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (id)
-                )
-            ''')
-            
-            # Index for performance
-            cursor.execute('''
-                CREATE INDEX IF NOT EXISTS idx_notifications_user_id 
-                ON notifications (user_id)
-            ''')
-            
-            cursor.execute('''
-                CREATE INDEX IF NOT EXISTS idx_notifications_created_at 
-                ON notifications (created_at)
-            ''')
-            
-            conn.commit()
-            conn.close()
+            with db_writer(self.db_path) as (conn, cursor):
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS notifications (
+                        id TEXT PRIMARY KEY,
+                        user_id TEXT NOT NULL,
+                        type TEXT NOT NULL,
+                        title TEXT NOT NULL,
+                        message TEXT NOT NULL,
+                        data TEXT, -- JSON data
+                        priority TEXT DEFAULT 'medium',
+                        is_read BOOLEAN DEFAULT FALSE,
+                        is_sent BOOLEAN DEFAULT FALSE,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        read_at TIMESTAMP,
+                        expires_at TIMESTAMP,
+                        FOREIGN KEY (user_id) REFERENCES users (id)
+                    )
+                ''')
+                
+                # Index for performance
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_notifications_user_id 
+                    ON notifications (user_id)
+                ''')
+                
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_notifications_created_at 
+                    ON notifications (created_at)
+                ''')
+                
+                conn.commit()
             
             logger.info("✅ Notifications database initialized")
             
@@ -101,26 +98,23 @@ class NotificationService:
             expires_at = datetime.now() + timedelta(hours=expires_in_hours)
         
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO notifications 
-                (id, user_id, type, title, message, data, priority, expires_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                notification_id,
-                user_id,
-                notification_type.value,
-                title,
-                message,
-                json.dumps(data) if data else None,
-                priority.value,
-                expires_at.isoformat() if expires_at else None
-            ))
-            
-            conn.commit()
-            conn.close()
+            with db_writer(self.db_path) as (conn, cursor):
+                cursor.execute('''
+                    INSERT INTO notifications 
+                    (id, user_id, type, title, message, data, priority, expires_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    notification_id,
+                    user_id,
+                    notification_type.value,
+                    title,
+                    message,
+                    json.dumps(data) if data else None,
+                    priority.value,
+                    expires_at.isoformat() if expires_at else None
+                ))
+                
+                conn.commit()
             
             logger.info(f"📬 Created notification {notification_id} for user {user_id}")
             
@@ -169,13 +163,10 @@ class NotificationService:
             await websocket_service.send_notification(notification['user_id'], ws_message)
             
             # Mark as sent
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('''
-                UPDATE notifications SET is_sent = TRUE WHERE id = ?
-            ''', (notification_id,))
-            conn.commit()
-            conn.close()
+            with db_writer(self.db_path) as (conn, cursor):
+                cursor.execute('''
+                    UPDATE notifications SET is_sent = TRUE WHERE id = ?
+                ''', (notification_id,))
             
             logger.info(f"📤 Sent notification {notification_id}")
             return True
@@ -187,15 +178,12 @@ class NotificationService:
     def get_notification(self, notification_id: str) -> Optional[Dict]:
         """Get notification by ID"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT * FROM notifications WHERE id = ?
-            ''', (notification_id,))
-            
-            row = cursor.fetchone()
-            conn.close()
+            with db_connection(self.db_path) as (conn, cursor):
+                cursor.execute('''
+                    SELECT * FROM notifications WHERE id = ?
+                ''', (notification_id,))
+                
+                row = cursor.fetchone()
             
             if row:
                 columns = [desc[0] for desc in cursor.description]
@@ -216,38 +204,34 @@ class NotificationService:
     ) -> List[Dict]:
         """Get notifications for a user"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            query = '''
-                SELECT * FROM notifications 
-                WHERE user_id = ?
-            '''
-            params = [user_id]
-            
-            if only_unread:
-                query += ' AND is_read = FALSE'
-            elif not include_read:
-                query += ' AND is_read = FALSE'
-            
-            query += ' ORDER BY created_at DESC LIMIT ?'
-            params.append(limit)
-            
-            cursor.execute(query, params)
-            rows = cursor.fetchall()
-            
-            columns = [desc[0] for desc in cursor.description]
-            notifications = [dict(zip(columns, row)) for row in rows]
-            
-            # Parse JSON data
-            for notification in notifications:
-                if notification['data']:
-                    try:
-                        notification['data'] = json.loads(notification['data'])
-                    except:
-                        notification['data'] = None
-            
-            conn.close()
+            with db_connection(self.db_path) as (conn, cursor):
+                query = '''
+                    SELECT * FROM notifications 
+                    WHERE user_id = ?
+                '''
+                params = [user_id]
+                
+                if only_unread:
+                    query += ' AND is_read = FALSE'
+                elif not include_read:
+                    query += ' AND is_read = FALSE'
+                
+                query += ' ORDER BY created_at DESC LIMIT ?'
+                params.append(limit)
+                
+                cursor.execute(query, params)
+                rows = cursor.fetchall()
+                
+                columns = [desc[0] for desc in cursor.description]
+                notifications = [dict(zip(columns, row)) for row in rows]
+                
+                # Parse JSON data
+                for notification in notifications:
+                    if notification['data']:
+                        try:
+                            notification['data'] = json.loads(notification['data'])
+                        except:
+                            notification['data'] = None
             
             return notifications
             
@@ -258,18 +242,15 @@ class NotificationService:
     def mark_notification_read(self, notification_id: str, user_id: str) -> bool:
         """Mark notification as read"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                UPDATE notifications 
-                SET is_read = TRUE, read_at = CURRENT_TIMESTAMP
-                WHERE id = ? AND user_id = ?
-            ''', (notification_id, user_id))
-            
-            success = cursor.rowcount > 0
-            conn.commit()
-            conn.close()
+            with db_writer(self.db_path) as (conn, cursor):
+                cursor.execute('''
+                    UPDATE notifications 
+                    SET is_read = TRUE, read_at = CURRENT_TIMESTAMP
+                    WHERE id = ? AND user_id = ?
+                ''', (notification_id, user_id))
+                
+                success = cursor.rowcount > 0
+                conn.commit()
             
             if success:
                 logger.info(f"📖 Marked notification {notification_id} as read")
@@ -283,18 +264,15 @@ class NotificationService:
     def mark_all_read(self, user_id: str) -> int:
         """Mark all notifications as read for a user"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                UPDATE notifications 
-                SET is_read = TRUE, read_at = CURRENT_TIMESTAMP
-                WHERE user_id = ? AND is_read = FALSE
-            ''', (user_id,))
-            
-            count = cursor.rowcount
-            conn.commit()
-            conn.close()
+            with db_writer(self.db_path) as (conn, cursor):
+                cursor.execute('''
+                    UPDATE notifications 
+                    SET is_read = TRUE, read_at = CURRENT_TIMESTAMP
+                    WHERE user_id = ? AND is_read = FALSE
+                ''', (user_id,))
+                
+                count = cursor.rowcount
+                conn.commit()
             
             logger.info(f"📖 Marked {count} notifications as read for user {user_id}")
             return count
@@ -306,16 +284,13 @@ class NotificationService:
     def get_unread_count(self, user_id: str) -> int:
         """Get count of unread notifications"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT COUNT(*) FROM notifications 
-                WHERE user_id = ? AND is_read = FALSE
-            ''', (user_id,))
-            
-            count = cursor.fetchone()[0]
-            conn.close()
+            with db_connection(self.db_path) as (conn, cursor):
+                cursor.execute('''
+                    SELECT COUNT(*) FROM notifications 
+                    WHERE user_id = ? AND is_read = FALSE
+                ''', (user_id,))
+                
+                count = cursor.fetchone()[0]
             
             return count
             
@@ -326,17 +301,14 @@ class NotificationService:
     async def cleanup_expired_notifications(self):
         """Clean up expired notifications"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                DELETE FROM notifications 
-                WHERE expires_at IS NOT NULL AND expires_at < CURRENT_TIMESTAMP
-            ''')
-            
-            deleted_count = cursor.rowcount
-            conn.commit()
-            conn.close()
+            with db_writer(self.db_path) as (conn, cursor):
+                cursor.execute('''
+                    DELETE FROM notifications 
+                    WHERE expires_at IS NOT NULL AND expires_at < CURRENT_TIMESTAMP
+                ''')
+                
+                deleted_count = cursor.rowcount
+                conn.commit()
             
             if deleted_count > 0:
                 logger.info(f"🗑️ Cleaned up {deleted_count} expired notifications")
@@ -0,0 +1,302 @@
+"""
+Job recommendation service for Up Hera
+Precomputed top-K job matches per user, served from job_recommendations
+"""
+
+import asyncio
+import json
+import logging
+import threading
+import uuid
+from typing import Any, Dict, List, Optional, Set
+
+import numpy as np
+
+from api.config import settings
+from api.database import db_connection, db_writer, run_db
+from api.services import take_dirty_users
+from api.services.ai_matching_service import ai_matcher, BatchMatchingEngine
+from api.services.job_service import job_service
+
+logger = logging.getLogger(__name__)
+
+class RecommendationService:
+    """Keeps the top ``top_k`` matches of every graduate in ``job_recommendations``.
+
+    Requests only read the stored rows. Profile and job changes mark users or
+    jobs dirty, and ``recompute`` rescores just those: a changed user is
+    scored against the whole indexed catalog, while a changed job is scored
+    against every user and merged into their existing top-K. When a job
+    leaves someone's top-K (it got worse or was closed), that user is fully
+    rescored, since the next-best job was never stored.
+    """
+
+    PRUNED_RESCORE_MAX_USERS = 32
+
+    def __init__(self, db_path: str = "uphera.db", top_k: int = 20):
+        self.db_path = db_path
+        self.top_k = top_k
+        self._lock = threading.Lock()
+        self._recompute_lock = threading.Lock()
+        self._dirty_users: Set[str] = set()
+        self._dirty_jobs: Set[str] = set()
+        self._removed_jobs: Set[str] = set()
+        self._stats = {"recomputes": 0, "users_rescored": 0, "jobs_rescored": 0, "served": 0}
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._stats[name] += amount
+
+    def mark_user_dirty(self, user_id: str) -> None:
+        """Queue a user whose profile changed"""
+        with self._lock:
+            self._dirty_users.add(user_id)
+
+    def on_job_changed(self, event: str, job: Dict[str, Any]) -> None:
+        """``JobService`` listener queueing changed and closed jobs"""
+        with self._lock:
+            if event == "deleted" or not job.get("is_active", True):
+                self._removed_jobs.add(job["id"])
+                self._dirty_jobs.discard(job["id"])
+            else:
+                self._dirty_jobs.add(job["id"])
+
+    def has_pending_work(self) -> bool:
+        with self._lock:
+            return bool(self._dirty_users or self._dirty_jobs or self._removed_jobs)
+
+    def _load_profiles(self, user_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Matching inputs of the given graduates, or of every graduate"""
+        query = '''
+            SELECT id, skills, experience_level, location, upschool_program
+            FROM users WHERE user_type = 'mezun'
+        '''
+        params: List[str] = []
+        if user_ids is not None:
+            query += " AND id IN ({})".format(', '.join('?' * len(user_ids)))
+            params = user_ids
+
+        with db_connection() as (conn, cursor):
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+
+        return [{
+            "id": row[0],
+            "skills": json.loads(row[1]) if row[1] else [],
+            "experienceLevel": row[2] or "entry",
+            "location": row[3] or "",
+            "upschoolProgram": row[4] or "",
+        } for row in rows]
+
+    def _reasons(self, profile: Dict[str, Any], job_id: str, index: BatchMatchingEngine) -> List[str]:
+        """Short, user-facing explanation of a match"""
+        facts = index.describe(job_id)
+        reasons = []
+        user_skills = {skill.lower(): skill for skill in profile["skills"]}
+        matched = [user_skills[req] for req in facts["requirements"] if req in user_skills]
+        if matched:
+            reasons.append(f"Eşleşen yetenekler: {', '.join(matched)}")
+        if facts["remote"]:
+            reasons.append("Uzaktan çalışmaya uygun")
+        elif profile["location"] and profile["location"].lower() == facts["location"]:
+            reasons.append("Konumunla uyumlu")
+        return reasons
+
+    def _recommendation_rows(self, user_id: str, matches: List[tuple], profile: Dict[str, Any], index: BatchMatchingEngine) -> List[tuple]:
+        return [
+            (str(uuid.uuid4()), user_id, job_id, score, json.dumps(self._reasons(profile, job_id, index)))
+            for job_id, score in matches
+        ]
+
+    @staticmethod
+    def _write(cursor, updates: Dict[str, List[tuple]]) -> None:
+        """Replace the stored top-K of every user in ``updates`` and record them as computed"""
+        users = [(user_id,) for user_id in updates]
+        cursor.executemany("DELETE FROM job_recommendations WHERE user_id = ?", users)
+        cursor.executemany('''
+            INSERT INTO job_recommendations (id, user_id, job_id, match_score, reasons)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [row for rows in updates.values() for row in rows])
+        cursor.executemany(
+            "INSERT OR REPLACE INTO recommendation_runs (user_id, computed_at) VALUES (?, CURRENT_TIMESTAMP)", users
+        )
+
+    def _top_k(self, job_ids: List[str], scores: np.ndarray) -> List[tuple]:
+        count = min(self.top_k, len(job_ids))
+        if count == 0:
+            return []
+        top = np.argpartition(-scores, count - 1)[:count]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(job_ids[i], float(scores[i])) for i in top]
+
+    def rescore_users(self, user_ids: List[str]) -> int:
+        """Recompute the full top-K of the given users"""
+        if not user_ids:
+            return 0
+        profiles = self._load_profiles(user_ids)
+        # Users without a graduate profile are recorded with no matches, so they are not retried
+        updates: Dict[str, List[tuple]] = {user_id: [] for user_id in user_ids}
+        if profiles:
+            # Job changes update the index in place; they wait until scoring is done
+            with ai_matcher.locked_job_index(job_service) as index:
+                # Few users: prune to jobs sharing a skill; many users: one matrix pass is cheaper
+                if len(profiles) <= self.PRUNED_RESCORE_MAX_USERS:
+                    matches = [index.top_k(profile, self.top_k) for profile in profiles]
+                else:
+                    matches = [self._top_k(index.job_ids, row) for row in index.score_many(profiles)]
+                for profile, top in zip(profiles, matches):
+                    updates[profile["id"]] = self._recommendation_rows(profile["id"], top, profile, index)
+
+        with db_writer(self.db_path) as (conn, cursor):
+            self._write(cursor, updates)
+
+        self._count("users_rescored", len(profiles))
+        return len(profiles)
+
+    def _merge_jobs(self, job_ids: List[str], skip_users: Set[str]) -> Set[str]:
+        """Score changed jobs against every user and merge them into stored top-Ks.
+
+        Returns users that need a full rescore instead.
+        """
+        profiles = [p for p in self._load_profiles() if p["id"] not in skip_users]
+        if not profiles:
+            return set()
+
+        with db_connection(self.db_path) as (conn, cursor):
+            cursor.execute("SELECT user_id, job_id, match_score FROM job_recommendations")
+            stored: Dict[str, Dict[str, float]] = {}
+            for user_id, job_id, score in cursor.fetchall():
+                stored.setdefault(user_id, {})[job_id] = score
+            cursor.execute("SELECT user_id FROM recommendation_runs")
+            computed = {row[0] for row in cursor.fetchall()}
+
+        full_rescore: Set[str] = set()
+        updates: Dict[str, List[tuple]] = {}
+        with ai_matcher.locked_job_index(job_service) as index:
+            job_ids = [job_id for job_id in job_ids if job_id in index]
+            if not job_ids:
+                return set()
+            scores = index.subset(job_ids).score_many(profiles)
+
+            for profile, row in zip(profiles, scores):
+                if profile["id"] not in computed:
+                    # Never computed; the first request scores the full catalog
+                    continue
+                current = stored.get(profile["id"], {})
+                new_scores = dict(zip(job_ids, row.tolist()))
+                if any(job_id in current and new_scores[job_id] < current[job_id] for job_id in job_ids):
+                    full_rescore.add(profile["id"])
+                    continue
+
+                merged = {**current, **new_scores}
+                ranked = sorted(merged.items(), key=lambda item: item[1], reverse=True)[:self.top_k]
+                if dict(ranked) != current:
+                    updates[profile["id"]] = self._recommendation_rows(profile["id"], ranked, profile, index)
+
+        if updates:
+            with db_writer(self.db_path) as (conn, cursor):
+                self._write(cursor, updates)
+
+        self._count("jobs_rescored", len(job_ids))
+        return full_rescore
+
+    def recompute(self) -> Dict[str, int]:
+        """Rescore everything queued since the last run"""
+        with self._recompute_lock:
+            with self._lock:
+                users, jobs, removed = self._dirty_users, self._dirty_jobs, self._removed_jobs
+                self._dirty_users, self._dirty_jobs, self._removed_jobs = set(), set(), set()
+
+            try:
+                return self._recompute(users, jobs, removed)
+            except Exception:
+                # Keep the work queued for the next run
+                with self._lock:
+                    self._dirty_users |= users
+                    self._dirty_jobs |= jobs
+                    self._removed_jobs |= removed
+                raise
+
+    def _recompute(self, users: Set[str], jobs: Set[str], removed: Set[str]) -> Dict[str, int]:
+        if removed:
+            removed_ids = list(removed)
+            with db_writer(self.db_path) as (conn, cursor):
+                cursor.execute(
+                    f"SELECT DISTINCT user_id FROM job_recommendations WHERE job_id IN ({', '.join('?' * len(removed_ids))})",
+                    removed_ids
+                )
+                users |= {row[0] for row in cursor.fetchall()}
+                cursor.execute(
+                    f"DELETE FROM job_recommendations WHERE job_id IN ({', '.join('?' * len(removed_ids))})",
+                    removed_ids
+                )
+
+        if jobs:
+            users |= self._merge_jobs(list(jobs), users)
+        rescored = self.rescore_users(list(users))
+
+        self._count("recomputes")
+        return {"users": rescored, "jobs": len(jobs), "removed_jobs": len(removed)}
+
+    def get_recommendations(self, user_id: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Stored top matches of a user, best first"""
+        limit = max(1, min(limit, self.top_k))
+
+        def stored() -> List[tuple]:
+            with db_connection(self.db_path) as (conn, cursor):
+                cursor.execute('''
+                    SELECT job_id, match_score, reasons FROM job_recommendations
+                    WHERE user_id = ?
+                    ORDER BY match_score DESC
+                    LIMIT ?
+                ''', (user_id, limit))
+                return cursor.fetchall()
+
+        def computed() -> bool:
+            with db_connection(self.db_path) as (conn, cursor):
+                cursor.execute("SELECT 1 FROM recommendation_runs WHERE user_id = ?", (user_id,))
+                return cursor.fetchone() is not None
+
+        rows = stored()
+        if not rows and not computed():
+            # First visit: compute this user's matches once, then serve from the table
+            self.rescore_users([user_id])
+            rows = stored()
+
+        jobs = {job["id"]: job for job in job_service.get_jobs_by_ids([row[0] for row in rows])}
+        self._count("served")
+        return [{
+            **jobs[job_id],
+            "match_score": score,
+            "reasons": json.loads(reasons) if reasons else []
+        } for job_id, score, reasons in rows if job_id in jobs]
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "top_k": self.top_k,
+                "dirty_users": len(self._dirty_users),
+                "dirty_jobs": len(self._dirty_jobs),
+                "removed_jobs": len(self._removed_jobs),
+                **self._stats,
+            }
+
+# Global recommendation service instance
+recommendation_service = RecommendationService(top_k=settings.RECOMMENDATION_TOP_K)
+
+async def start_recommendation_refresher():
+    """Background task recomputing recommendations for changed users and jobs, and saving the job index"""
+    while True:
+        try:
+            await asyncio.sleep(settings.RECOMMENDATION_REFRESH_SECONDS)
+            # Profile updates are queued without loading this module
+            for user_id in take_dirty_users():
+                recommendation_service.mark_user_dirty(user_id)
+            if recommendation_service.has_pending_work():
+                result = await run_db(recommendation_service.recompute)
+                logger.info(f"✅ Recommendations refreshed: {result}")
+            await run_db(ai_matcher.save_job_index)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Recommendation refresh error: {e}")
@@ -0,0 +1,144 @@
+"""
+Server-sent event framing for Up Hera
+Coalesces AI chunks into fewer frames, optionally gzips the body, and tracks frame rates
+"""
+
+import asyncio
+import json
+import threading
+import time
+import zlib
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+async def coalesce(chunks: AsyncIterator[str], max_bytes: int = 512, max_delay: float = 0.05) -> AsyncIterator[str]:
+    """Join text chunks into fewer, larger pieces.
+
+    The first chunk passes straight through so time to first byte is not
+    delayed. After that, a piece is emitted once it holds ``max_bytes`` of
+    UTF-8 or its oldest chunk has waited ``max_delay`` seconds, whichever
+    comes first. Closing the result closes ``chunks``.
+    """
+    loop = asyncio.get_running_loop()
+    iterator = chunks.__aiter__()
+    pending: Optional[asyncio.Future] = None
+    parts: List[str] = []
+    size = 0
+    deadline: Optional[float] = None
+    first = True
+    try:
+        while True:
+            # One __anext__ at a time; a window that runs out leaves it pending, never cancelled
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            timeout = None if deadline is None else max(0.0, deadline - loop.time())
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+            if done:
+                future, pending = pending, None
+                try:
+                    chunk = future.result()
+                except StopAsyncIteration:
+                    break
+                if not chunk:
+                    continue
+                if first:
+                    first = False
+                    yield chunk
+                    continue
+                parts.append(chunk)
+                size += len(chunk.encode("utf-8"))
+                if deadline is None:
+                    deadline = loop.time() + max_delay
+                if size < max_bytes:
+                    continue
+            piece = "".join(parts)
+            parts, size, deadline = [], 0, None
+            yield piece
+        if parts:
+            yield "".join(parts)
+    finally:
+        if pending is not None:
+            pending.cancel()
+            await asyncio.gather(pending, return_exceptions=True)
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+class StreamStats:
+    """Frame and byte counts of every SSE response, as rates over their streaming time"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {"streams": 0, "frames": 0, "bytes": 0, "wire_bytes": 0, "seconds": 0.0}
+
+    def record(self, frames: int, size: int, wire_size: int, seconds: float) -> None:
+        with self._lock:
+            self._stats["streams"] += 1
+            self._stats["frames"] += frames
+            self._stats["bytes"] += size
+            self._stats["wire_bytes"] += wire_size
+            self._stats["seconds"] += seconds
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        seconds = stats.pop("seconds")
+        return {
+            **stats,
+            "frames_per_second": round(stats["frames"] / seconds, 2) if seconds else 0.0,
+            "bytes_per_second": round(stats["bytes"] / seconds, 2) if seconds else 0.0,
+            "avg_frame_bytes": round(stats["bytes"] / stats["frames"], 1) if stats["frames"] else 0.0,
+            "compression_ratio": round(stats["wire_bytes"] / stats["bytes"], 4) if stats["bytes"] else 1.0,
+        }
+
+class SSEStream:
+    """Encodes the frames of one SSE response.
+
+    With ``gzip`` the body is one gzip stream, sync-flushed after every frame
+    so the client can decode each frame as soon as it arrives. EventSource
+    clients cannot be relied on to accept that, so only fetch-based
+    endpoints should turn it on. ``end`` returns the gzip trailer and records
+    the response in ``stats``; call it on every exit path.
+    """
+
+    def __init__(self, gzip: bool = False, stats: Optional[StreamStats] = None):
+        self.gzip = gzip
+        self.stats = stats if stats is not None else sse_stats
+        self._compressor = zlib.compressobj(wbits=31) if gzip else None
+        self._started = time.perf_counter()
+        self._frames = 0
+        self._bytes = 0
+        self._wire_bytes = 0
+        self._ended = False
+
+    def _write(self, data: bytes) -> bytes:
+        if self._compressor is not None:
+            data = self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        self._wire_bytes += len(data)
+        return data
+
+    def frame(self, payload: Dict[str, Any]) -> bytes:
+        data = f"data: {json.dumps(payload)}\n\n".encode("utf-8")
+        self._frames += 1
+        self._bytes += len(data)
+        return self._write(data)
+
+    def end(self) -> bytes:
+        if self._ended:
+            return b""
+        self._ended = True
+        tail = b""
+        if self._compressor is not None:
+            tail = self._compressor.flush()
+            self._wire_bytes += len(tail)
+        self.stats.record(self._frames, self._bytes, self._wire_bytes, time.perf_counter() - self._started)
+        return tail
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    """True if an Accept-Encoding header allows gzip"""
+    for coding in (accept_encoding or "").split(","):
+        name, _, params = coding.strip().partition(";")
+        if name.strip().lower() in ("gzip", "*"):
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+sse_stats = StreamStats()
@@ -8,6 +8,9 @@ import os
 import tempfile
 from unittest.mock import patch
 
+# Keep the password KDF cheap in tests; must be set before api.config is imported
+os.environ.setdefault("PASSWORD_HASH_ITERATIONS", "1000")
+
 from api.database import init_db
 from api.services.notification_service import notification_service
 from api.services.websocket_service import manager
@@ -11,6 +11,7 @@ import json
 from api.main import app
 from api.config import settings
 from api.database import init_db, create_user
+from api.services.job_service import job_service
 
 # Test client
 client = TestClient(app)
@@ -215,6 +216,17 @@ class TestProfileManagement:
         assert data["user"]["firstName"] == "Updated"
         assert data["user"]["skills"] == ["Python", "JavaScript", "React"]
     
+    def test_update_profile_queues_a_rescore(self, auth_headers):
+        """Test profile updates queue recommendations without importing the matcher"""
+        from api.services import LazyService, take_dirty_users
+        take_dirty_users()
+        
+        with patch.object(LazyService, "resolve", side_effect=AssertionError("service imported")):
+            response = client.put("/api/auth/profile", json={"skills": ["Python", "JavaScript", "React"]}, headers=auth_headers)
+        
+        assert response.status_code == 200
+        assert take_dirty_users() == {response.json()["user"]["id"]}
+    
     def test_logout(self, auth_headers):
         """Test user logout"""
         response = client.post("/api/auth/logout", headers=auth_headers)
@@ -222,6 +234,168 @@ class TestProfileManagement:
         assert response.status_code == 200
         data = response.json()
         assert data["success"] is True
+    
+    def test_signed_token_login_and_logout(self):
+        """Test login, profile and logout with AUTH_TOKEN_MODE=jwt"""
+        with patch.object(settings, "AUTH_TOKEN_MODE", "jwt"):
+            response = client.post("/api/auth/login", json={
+                "email": "test@uphera.com",
+                "password": "TestPass123!"
+            })
+            token = response.json()["access_token"]
+            assert token.count(".") == 2
+            headers = {"Authorization": f"Bearer {token}"}
+            
+            response = client.get("/api/auth/profile", headers=headers)
+            assert response.status_code == 200
+            assert response.json()["user"]["email"] == "test@uphera.com"
+            
+            assert client.post("/api/auth/logout", headers=headers).status_code == 200
+            assert client.get("/api/auth/profile", headers=headers).status_code == 401
+
+class TestJobRecommendations:
+    """Test precomputed job recommendations"""
+    
+    def test_recommended_jobs(self):
+        """Test the recommended jobs endpoint"""
+        response = client.post("/api/auth/login", json={
+            "email": "test@uphera.com",
+            "password": "TestPass123!"
+        })
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        
+        response = client.get("/api/jobs/recommended?limit=3", headers=headers)
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert data["success"] is True
+        assert 0 < data["total"] <= 3
+        assert all("match_score" in job and "reasons" in job for job in data["jobs"])
+    
+    def test_recommended_jobs_unauthorized(self):
+        """Test recommendations require authentication"""
+        response = client.get("/api/jobs/recommended")
+        
+        assert response.status_code == 401
+
+class TestJobListing:
+    """Test job listing pagination"""
+    
+    def test_cursor_pagination(self):
+        """Test walking job pages with next_cursor"""
+        response = client.post("/api/auth/login", json={
+            "email": "test@uphera.com",
+            "password": "TestPass123!"
+        })
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        
+        first = client.get("/api/jobs?limit=2", headers=headers).json()
+        assert first["success"] is True and first["has_more"] is True
+        
+        second = client.get(f"/api/jobs?limit=2&cursor={first['next_cursor']}", headers=headers).json()
+        assert second["jobs"]
+        assert not {job["id"] for job in first["jobs"]} & {job["id"] for job in second["jobs"]}
+        assert second["total"] == first["total"]
+        
+        response = client.get("/api/jobs?cursor=not-a-cursor", headers=headers)
+        assert response.status_code == 400
+        
+        response = client.get(f"/api/jobs?cursor={job_service.encode_cursor('recent', [1], 'x')}", headers=headers)
+        assert response.status_code == 400
+        
+        # Other ValueErrors are server errors, not bad cursors
+        with patch.object(job_service, "get_jobs", side_effect=json.JSONDecodeError("bad skills", "[", 1)):
+            response = client.get("/api/jobs", headers=headers)
+        assert response.status_code == 500
+
+class TestAIInsights:
+    """Test the AI coach insights endpoint"""
+    
+    def test_insights_use_the_ai_service(self):
+        """Test insights are generated through the cached Gemini path"""
+        response = client.post("/api/auth/login", json={
+            "email": "test@uphera.com",
+            "password": "TestPass123!"
+        })
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        
+        from api.services.enhanced_ai_service import enhanced_ai_service
+        with patch.object(enhanced_ai_service, "chat_nonstream", return_value="Kariyer önerileri") as chat:
+            response = client.get("/ai-coach/insights", headers=headers)
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert data["success"] is True
+        assert data["insights"] == "Kariyer önerileri"
+        assert "test@uphera.com" in chat.call_args.args[0]
+    
+    def test_insights_report_busy_and_failed_calls(self):
+        """Test fallback replies of the AI service are not returned as insights"""
+        response = client.post("/api/auth/login", json={
+            "email": "test@uphera.com",
+            "password": "TestPass123!"
+        })
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        
+        from api.services.enhanced_ai_service import enhanced_ai_service, AI_BUSY_MESSAGE
+        for reply in (AI_BUSY_MESSAGE, "❌ AI servis hatası: timeout"):
+            with patch.object(enhanced_ai_service, "chat_nonstream", return_value=reply):
+                data = client.get("/ai-coach/insights", headers=headers).json()
+            assert data["success"] is False
+            assert data["message"] == reply
+
+class TestAIHistory:
+    """Test the AI coach history endpoint"""
+    
+    def test_history_is_served_from_the_table(self):
+        """Test chat history returns saved exchanges, newest first"""
+        response = client.post("/api/auth/login", json={
+            "email": "test@uphera.com",
+            "password": "TestPass123!"
+        })
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        user_id = client.get("/api/auth/profile", headers=headers).json()["user"]["id"]
+        
+        from api.services.enhanced_ai_service import enhanced_ai_service
+        for message in ["İlk soru", "İkinci soru"]:
+            enhanced_ai_service.save_chat_history(user_id, message, "Yanıt", "career")
+        
+        response = client.get("/ai-coach/history?limit=2", headers=headers)
+        
+        assert response.status_code == 200
+        history = response.json()["history"]
+        assert [item["message"] for item in history] == ["İkinci soru", "İlk soru"]
+
+class TestAIStream:
+    """Test the AI coach streaming endpoint"""
+    
+    def test_chunks_are_coalesced_and_gzipped(self):
+        """Test many small chunks arrive as fewer frames in a gzip body"""
+        response = client.post("/api/auth/login", json={
+            "email": "test@uphera.com",
+            "password": "TestPass123!"
+        })
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}", "Accept-Encoding": "gzip"}
+        
+        async def chunks(*args, **kwargs):
+            for i in range(40):
+                yield f"parça{i} "
+        
+        from api.services.enhanced_ai_service import enhanced_ai_service
+        with patch.object(enhanced_ai_service, "enhanced_chat", side_effect=chunks), \
+             patch.object(settings, "AI_SSE_GZIP", True):
+            response = client.post("/ai-coach/chat/stream", headers=headers, json={
+                "message": "Uzun bir yanıt ver",
+                "context": "general"
+            })
+        
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == "gzip"
+        events = [json.loads(line[len("data: "):]) for line in response.text.splitlines() if line.startswith("data: ")]
+        text = "".join(event.get("chunk", "") for event in events)
+        assert text == "".join(f"parça{i} " for i in range(40))
+        assert events[-1] == {"done": True}
+        assert len(events) < 10
 
 class TestErrorHandling:
     """Test error handling scenarios"""
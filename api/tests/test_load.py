@@ -11,12 +11,24 @@ import statistics
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from unittest.mock import patch, MagicMock
 from fastapi.testclient import TestClient
+import numpy as np
 import psutil
 import os
+import subprocess
+import sys
+import threading
+import tracemalloc
+import httpx
+import uvicorn
 
 # Import test dependencies
 from api.main import app
-from api.services.enhanced_ai_service import enhanced_ai_service
+from api.database import create_user, create_session, validate_session, get_pool, db_writer
+from api.security import password_hasher
+from api.services.ai_matching_service import AIMatchingService, BatchMatchingEngine
+from api.services.job_service import JobService
+from api.services.enhanced_ai_service import UpstreamLimiter, enhanced_ai_service
+from api.services.local_llm import LocalModel
 from api.services.websocket_service import manager
 from api.services.notification_service import notification_service
 
@@ -163,37 +175,36 @@ class TestHighLoadScenarios:
                     "user_id": f"chat_user_{i}"
                 })
         
+        # Mock quick AI response
+        async def quick_ai_response(*args, **kwargs):
+            yield "Bu bir "
+            yield "load test "
+            yield "yanıtıdır."
+        
         def make_ai_chat_request(user_data):
-            with patch.object(enhanced_ai_service, 'enhanced_chat') as mock_chat:
-                # Mock quick AI response
-                async def quick_ai_response():
-                    yield "Bu bir "
-                    yield "load test "
-                    yield "yanıtıdır."
-                
-                mock_chat.return_value = quick_ai_response()
-                
-                start_time = time.time()
-                
-                response = client.post("/ai-coach/chat",
-                    headers=user_data["headers"],
-                    json={
-                        "message": "Load test mesajı",
-                        "context": "general"
-                    }
-                )
-                
-                end_time = time.time()
-                
-                return {
-                    "user_id": user_data["user_id"],
-                    "status_code": response.status_code,
-                    "response_time": end_time - start_time,
-                    "success": response.status_code == 200
+            start_time = time.time()
+            
+            response = client.post("/ai-coach/chat",
+                headers=user_data["headers"],
+                json={
+                    "message": "Load test mesajı",
+                    "context": "general"
                 }
+            )
+            
+            end_time = time.time()
+            
+            return {
+                "user_id": user_data["user_id"],
+                "status_code": response.status_code,
+                "response_time": end_time - start_time,
+                "success": response.status_code == 200
+            }
         
-        # Concurrent AI chat requests
-        with ThreadPoolExecutor(max_workers=10) as executor:
+        # Concurrent AI chat requests; patched once here, since patches racing
+        # across worker threads restore out of order and leave the mock behind
+        with patch.object(enhanced_ai_service, 'enhanced_chat', side_effect=quick_ai_response), \
+             ThreadPoolExecutor(max_workers=10) as executor:
             futures = [executor.submit(make_ai_chat_request, user) for user in authenticated_users[:num_users]]
             results = [future.result() for future in as_completed(futures)]
         
@@ -353,26 +364,25 @@ class TestMemoryAndResourceUsage:
                     client.get("/api/auth/profile", headers=headers)
                     client.get("/api/jobs", headers=headers)
                     
-                    # AI Chat (mocked)
-                    with patch.object(enhanced_ai_service, 'enhanced_chat') as mock_chat:
-                        async def memory_response():
-                            # Generate medium-sized response
-                            for i in range(100):
-                                yield f"Memory test word {i} "
-                        
-                        mock_chat.return_value = memory_response()
-                        client.post("/ai-coach/chat", headers=headers, json={
-                            "message": "Memory test message",
-                            "context": "general"
-                        })
+                    # AI Chat (mocked around the thread pool below)
+                    client.post("/ai-coach/chat", headers=headers, json={
+                        "message": "Memory test message",
+                        "context": "general"
+                    })
             
             return process.memory_info().rss
         
+        async def memory_response(*args, **kwargs):
+            # Generate medium-sized response
+            for i in range(100):
+                yield f"Memory test word {i} "
+        
         # Run memory-intensive operations
         num_operations = 25
         memory_measurements = []
         
-        with ThreadPoolExecutor(max_workers=10) as executor:
+        with patch.object(enhanced_ai_service, 'enhanced_chat', side_effect=memory_response), \
+             ThreadPoolExecutor(max_workers=10) as executor:
             futures = [executor.submit(memory_intensive_operation, i) for i in range(num_operations)]
             
             for future in as_completed(futures):
@@ -510,6 +520,404 @@ class TestDatabasePerformanceUnderLoad:
             assert stats['avg'] < 2.0, f"{operation} average time too high: {stats['avg']}s"
             assert stats['max'] < 5.0, f"{operation} max time too high: {stats['max']}s"
 
+class TestDatabaseReadScaling:
+    """Concurrent readers on the WAL database no longer queue behind one lock"""
+    
+    @pytest.fixture(scope="class")
+    def session_token(self):
+        user_id = create_user({
+            "email": f"readscale.{time.time_ns()}@uphera.com",
+            "password": "ReadScale123!",
+            "firstName": "Read",
+            "lastName": "Scale",
+            "upschoolProgram": "Load Testing Program",
+            "skills": ["Python", "SQL"]
+        })
+        return create_session(user_id)
+    
+    def test_session_lookup_throughput_by_worker_count(self, session_token):
+        """Benchmark validate_session throughput with 1-8 worker threads"""
+        lookups = 400
+        throughput = {}
+        
+        for workers in (1, 2, 4, 8):
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                found = list(executor.map(lambda _: validate_session(session_token), range(lookups)))
+            elapsed = time.perf_counter() - start
+            
+            assert all(user is not None for user in found)
+            throughput[workers] = lookups / elapsed
+        
+        print(f"✅ Session Lookup Throughput ({lookups} lookups, {os.cpu_count()} CPUs):")
+        for workers, rate in throughput.items():
+            print(f"   {workers} workers: {rate:.0f} lookups/s ({rate / throughput[1]:.2f}x)")
+        
+        # Extra readers must never collapse throughput; with spare cores they add to it
+        assert throughput[4] >= throughput[1] * 0.6
+        if (os.cpu_count() or 1) >= 4:
+            assert throughput[4] > throughput[1] * 1.2
+    
+    def test_reads_proceed_while_writer_holds_lock(self, session_token):
+        """Readers are served while a write transaction is open"""
+        with get_pool().writer() as conn:
+            conn.execute("DELETE FROM user_sessions WHERE token = ?", ("not-a-real-token",))
+            
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                futures = [executor.submit(validate_session, session_token) for _ in range(20)]
+                users = [future.result(timeout=5) for future in futures]
+        
+        assert all(user is not None for user in users)
+        assert get_pool().metrics()["writes"] >= 1
+
+class TestPasswordHashingUnderLoad:
+    """Login latency with a realistic password KDF cost"""
+    
+    def test_login_p99_under_concurrent_load(self):
+        """Benchmark login p50/p99 with concurrent clients and 20k PBKDF2 iterations"""
+        num_users = 20
+        logins_per_user = 3
+        users = []
+        
+        with patch.object(password_hasher, "iterations", 20000):
+            for i in range(num_users):
+                email = f"kdf{i}.{time.time_ns()}@uphera.com"
+                create_user({
+                    "email": email,
+                    "password": f"KdfTest{i}123!",
+                    "firstName": f"Kdf{i}",
+                    "lastName": "LoadTest",
+                    "upschoolProgram": "Login Testing"
+                })
+                users.append((email, f"KdfTest{i}123!"))
+            
+            def login(user):
+                started = time.perf_counter()
+                response = client.post("/api/auth/login", json={"email": user[0], "password": user[1]})
+                return response.status_code, time.perf_counter() - started
+            
+            derivations = password_hasher.metrics()["derivations"]
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=10) as executor:
+                results = list(executor.map(login, users * logins_per_user))
+            elapsed = time.perf_counter() - started
+        
+        latencies = sorted(latency for status, latency in results if status == 200)
+        p50 = statistics.median(latencies)
+        p99 = latencies[int(len(latencies) * 0.99) - 1]
+        
+        assert len(latencies) == len(results)
+        assert password_hasher.metrics()["derivations"] - derivations >= len(results)
+        assert p99 < 5.0
+        
+        print(f"✅ Login KDF Benchmark ({password_hasher.max_workers} hasher workers):")
+        print(f"   Logins: {len(results)} in {elapsed:.2f}s ({len(results) / elapsed:.1f}/s)")
+        print(f"   p50: {p50 * 1000:.1f}ms  p99: {p99 * 1000:.1f}ms")
+
+class TestMatchingEnginePerformance:
+    """Batch job scoring versus the per-job scoring loop"""
+    
+    SKILLS = ["Python", "React", "TypeScript", "Docker", "AWS", "SQL", "Django", "FastAPI",
+              "Pandas", "Machine Learning", "Swift", "Kotlin", "Node.js", "Git", "Kubernetes"]
+    
+    def make_jobs(self, count):
+        return [{
+            "id": f"job-{i}",
+            "title": f"Engineer {i}",
+            "description": "Backend services in Python" if i % 2 else "Frontend apps in React",
+            "required_skills": [self.SKILLS[(i + k) % len(self.SKILLS)] for k in range(1 + i % 5)],
+            "experience_level": ["entry", "junior", "mid", "senior"][i % 4],
+            "location": ["Istanbul", "Ankara", "Izmir"][i % 3],
+            "remote_friendly": i % 7 == 0
+        } for i in range(count)]
+    
+    def test_batch_ranking_outpaces_per_job_loop(self):
+        """Benchmark rank_jobs against calling calculate_match_score per job"""
+        matcher = AIMatchingService()
+        jobs = self.make_jobs(300)
+        user = {"skills": ["Python", "Docker", "SQL"], "experienceLevel": "mid",
+                "location": "Istanbul", "upschoolProgram": "Backend Development"}
+        
+        started = time.perf_counter()
+        for job in jobs:
+            matcher.calculate_match_score(user, job)
+        loop_time = time.perf_counter() - started
+        
+        started = time.perf_counter()
+        ranked = matcher.rank_jobs(user, jobs)
+        batch_time = time.perf_counter() - started
+        
+        assert len(ranked) == len(jobs)
+        assert batch_time * 5 < loop_time
+        
+        print(f"✅ Matching Benchmark ({len(jobs)} jobs):")
+        print(f"   Per-job loop: {loop_time * 1000:.1f}ms")
+        print(f"   Batch engine: {batch_time * 1000:.1f}ms ({loop_time / batch_time:.1f}x)")
+    
+    def test_many_users_in_one_product(self):
+        """Benchmark scoring 200 users against 2000 jobs"""
+        engine = BatchMatchingEngine(AIMatchingService()).fit(self.make_jobs(2000))
+        users = [{"skills": self.SKILLS[i % 10:i % 10 + 3], "experienceLevel": "junior",
+                  "location": "Ankara", "upschoolProgram": "Data Science"} for i in range(200)]
+        
+        started = time.perf_counter()
+        scores = engine.score_many(users)
+        elapsed = time.perf_counter() - started
+        
+        assert scores.shape == (200, 2000)
+        assert elapsed < 10.0
+        print(f"✅ Scored {scores.size} user/job pairs in {elapsed * 1000:.1f}ms")
+
+    def benchmark_pruned_top_k(self, count):
+        # A wide skill vocabulary, so a user's skills appear in only part of the catalog
+        vocabulary = [f"tool{n:03d}" for n in range(300)]
+        jobs = [{
+            "id": f"job-{i}", "title": f"Engineer {i}", "description": "Product engineering",
+            "required_skills": [vocabulary[(i * 7 + k * 13) % len(vocabulary)] for k in range(1 + i % 4)],
+            "experience_level": ["entry", "junior", "mid", "senior"][i % 4],
+            "location": ["Istanbul", "Ankara", "Izmir"][i % 3], "remote_friendly": i % 7 == 0
+        } for i in range(count)]
+        engine = BatchMatchingEngine(AIMatchingService()).fit(jobs)
+        user = {"skills": ["tool007", "tool142"], "experienceLevel": "mid",
+                "location": "Istanbul", "upschoolProgram": "Backend Development"}
+        
+        started = time.perf_counter()
+        for _ in range(5):
+            full = np.sort(engine.score(user))[::-1][:20]
+        full_time = (time.perf_counter() - started) / 5
+        
+        started = time.perf_counter()
+        for _ in range(5):
+            pruned = engine.top_k(user, 20)
+        pruned_time = (time.perf_counter() - started) / 5
+        
+        candidates = len(engine.candidate_rows(user["skills"]))
+        assert [score for _, score in pruned] == pytest.approx(full.tolist())
+        assert engine.stats == {"pruned": 5, "full_scans": 0}
+        assert candidates < count // 10
+        
+        print(f"✅ Top-20 over {count} jobs ({candidates} candidates):")
+        print(f"   Full scan: {full_time * 1000:.1f}ms")
+        print(f"   Pruned:    {pruned_time * 1000:.1f}ms ({full_time / pruned_time:.1f}x)")
+        return full_time, pruned_time
+    
+    def test_pruned_top_k_10k_jobs(self):
+        """Benchmark skill-index pruning against a full scan over 10k jobs"""
+        full_time, pruned_time = self.benchmark_pruned_top_k(10000)
+        # Vectorizing the user's skills costs the same either way and dominates at
+        # this size; pruning must not cost more than that (the speedup shows at 100k)
+        assert pruned_time < full_time * 1.5
+    
+    @pytest.mark.slow
+    def test_pruned_top_k_100k_jobs(self):
+        """Benchmark skill-index pruning against a full scan over 100k jobs"""
+        full_time, pruned_time = self.benchmark_pruned_top_k(100000)
+        assert pruned_time < full_time
+
+class TestJobSearchPerformance:
+    """Job search and deep listing pages on a synthetic catalog"""
+    
+    WORDS = ["platform", "payments", "mobile", "analytics", "cloud", "design", "security",
+             "growth", "search", "billing", "logistics", "health", "gaming", "media"]
+    CITIES = ["İstanbul", "Ankara", "İzmir", "Bursa", "Antalya"]
+    
+    def benchmark_search(self, count, tmp_path):
+        service = JobService(db_path=str(tmp_path / "search.db"))
+        rows = [(
+            f"bench-{i}", f"{self.WORDS[i % 14].title()} Engineer {i}", f"Şirket {i % 997}",
+            self.CITIES[i % 5],
+            f"Work on {self.WORDS[(i * 3) % 14]} and {self.WORDS[(i * 5) % 14]} systems, ticket {i}",
+            json.dumps([self.WORDS[(i * 7) % 14], "Python" if i % 3 else "Kotlin"])
+        ) for i in range(count)]
+        with db_writer(service.db_path) as (conn, cursor):
+            cursor.executemany(
+                "INSERT INTO jobs (id, title, company, location, description, skills) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+        
+        def timed(query):
+            started = time.perf_counter()
+            for _ in range(5):
+                result = service.get_jobs(search_query=query, limit=20)
+            return result, (time.perf_counter() - started) / 5
+        
+        # A rare term: FTS reads one posting list, LIKE scans every row
+        fts_result, fts_time = timed("ticket 4242")
+        service.fts_enabled = False
+        like_result, like_time = timed("ticket 4242")
+        service.fts_enabled = True
+        
+        assert "bench-4242" in [job["id"] for job in fts_result["jobs"]]
+        assert "bench-4242" in [job["id"] for job in like_result["jobs"]]
+        assert fts_time < like_time
+        
+        ranked, ranked_time = timed("billing engineer")
+        assert ranked["total"] > 0
+        assert all("Billing" in job["title"] for job in ranked["jobs"])
+        
+        # Deep listing page: OFFSET walks every skipped row, a cursor seeks past them
+        depth = count * 3 // 4
+        page_cursor = service.get_jobs(limit=20, offset=depth - 20)["next_cursor"]
+        started = time.perf_counter()
+        by_offset = service.get_jobs(limit=20, offset=depth)
+        offset_time = time.perf_counter() - started
+        started = time.perf_counter()
+        by_cursor = service.get_jobs(limit=20, page_cursor=page_cursor)
+        cursor_time = time.perf_counter() - started
+        assert [job["id"] for job in by_cursor["jobs"]] == [job["id"] for job in by_offset["jobs"]]
+        assert cursor_time < offset_time
+        
+        print(f"✅ Job Search Benchmark ({count} jobs):")
+        print(f"   LIKE scan:  {like_time * 1000:.1f}ms")
+        print(f"   FTS5:       {fts_time * 1000:.1f}ms ({like_time / fts_time:.1f}x)")
+        print(f"   FTS5 ranked common terms: {ranked_time * 1000:.1f}ms ({ranked['total']} matches)")
+        print(f"   Page at {depth}: OFFSET {offset_time * 1000:.1f}ms, cursor {cursor_time * 1000:.1f}ms")
+    
+    def test_search_20k_jobs(self, tmp_path):
+        """Benchmark FTS5 search against LIKE over 20k jobs"""
+        self.benchmark_search(20000, tmp_path)
+    
+    @pytest.mark.slow
+    def test_search_100k_jobs(self, tmp_path):
+        """Benchmark FTS5 search against LIKE over 100k jobs"""
+        self.benchmark_search(100000, tmp_path)
+
+class TestAIStreamingBenchmark:
+    """/ai-coach/chat/stream end to end against the local stand-in model"""
+    
+    STREAMS = 16
+    RESPONSE_TOKENS = 96
+    
+    @pytest.fixture
+    def auth_headers(self):
+        credentials = {"email": "stream.bench@uphera.com", "password": "StreamBench123!"}
+        client.post("/api/auth/graduate/register", json={
+            **credentials,
+            "firstName": "Stream",
+            "lastName": "Bench",
+            "upschoolProgram": "Benchmark",
+            "experienceLevel": "entry"
+        })
+        token = client.post("/api/auth/login", json=credentials).json()["access_token"]
+        return {"Authorization": f"Bearer {token}"}
+    
+    @pytest.fixture(scope="class")
+    def server_url(self):
+        """A real uvicorn server on a free local port; TestClient buffers whole responses"""
+        server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, lifespan="off", log_level="warning"))
+        thread = threading.Thread(target=server.run, daemon=True)
+        thread.start()
+        deadline = time.time() + 10
+        while not server.started:
+            assert time.time() < deadline, "server did not start"
+            time.sleep(0.01)
+        port = server.servers[0].sockets[0].getsockname()[1]
+        yield f"http://127.0.0.1:{port}"
+        server.should_exit = True
+        thread.join(timeout=10)
+    
+    @pytest.fixture
+    def local_model(self):
+        model = LocalModel(
+            tokens_per_second=400, first_token_ms=50, jitter_ms=10,
+            chunk_tokens=8, response_tokens=self.RESPONSE_TOKENS
+        )
+        # Measure the streaming path, not our own upstream budget
+        limiter = UpstreamLimiter(max_concurrent=self.STREAMS, requests_per_minute=10000, tokens_per_minute=10**7)
+        with patch.object(enhanced_ai_service, "_gemini_checked", True), \
+             patch.object(enhanced_ai_service, "_gemini_ready", True), \
+             patch.object(enhanced_ai_service, "_genai", None), \
+             patch.object(enhanced_ai_service, "gemini_model", model), \
+             patch.object(enhanced_ai_service, "limiter", limiter):
+            yield model
+    
+    def stream_chat(self, http, headers, index):
+        started = time.perf_counter()
+        first_chunk = None
+        chunks = []
+        with http.stream("POST", "/ai-coach/chat/stream", headers=headers, json={
+            "message": f"Benchmark sorusu {index}",
+            "context": "career"
+        }) as response:
+            for line in response.iter_lines():
+                if not line.startswith("data: "):
+                    continue
+                event = json.loads(line[len("data: "):])
+                if "chunk" in event:
+                    if first_chunk is None:
+                        first_chunk = time.perf_counter() - started
+                    chunks.append(event["chunk"])
+        return {"ttfb": first_chunk, "total": time.perf_counter() - started, "text": "".join(chunks)}
+    
+    def test_concurrent_streams(self, server_url, local_model, auth_headers):
+        """Time to first byte, token throughput and memory of concurrent chat streams"""
+        user_id = client.get("/api/auth/profile", headers=auth_headers).json()["user"]["id"]
+        
+        # One shared client: building one per request costs more than the stream itself
+        limits = httpx.Limits(max_connections=self.STREAMS)
+        with httpx.Client(base_url=server_url, timeout=30, limits=limits) as http:
+            tracemalloc.start()
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=self.STREAMS) as executor:
+                results = list(executor.map(lambda i: self.stream_chat(http, auth_headers, i), range(self.STREAMS)))
+            elapsed = time.perf_counter() - started
+            _, peak_memory = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        
+        assert all(len(r["text"].split()) == self.RESPONSE_TOKENS for r in results)
+        ttfb = sorted(r["ttfb"] for r in results)
+        tokens = sum(len(r["text"].split()) for r in results)
+        # Every exchange reached the history table
+        history = enhanced_ai_service.get_chat_history(user_id, limit=50)
+        assert {f"Benchmark sorusu {i}" for i in range(self.STREAMS)} <= {row["message"] for row in history}
+        
+        assert statistics.median(ttfb) < 1.0
+        assert max(r["total"] for r in results) < 5.0
+        
+        print(f"✅ AI Streaming Benchmark ({self.STREAMS} concurrent streams, local model):")
+        print(f"   TTFB p50: {statistics.median(ttfb) * 1000:.0f}ms, max: {ttfb[-1] * 1000:.0f}ms")
+        print(f"   Stream workers: {enhanced_ai_service.stream_bridge.max_workers} (later streams queue for one)")
+        print(f"   Stream duration avg: {statistics.mean(r['total'] for r in results) * 1000:.0f}ms")
+        print(f"   Throughput: {tokens / elapsed:.0f} tokens/s over {elapsed:.2f}s")
+        print(f"   Peak traced memory: {peak_memory / 1024 / 1024:.1f} MB")
+
+class TestColdStart:
+    """Serverless cold start: what a fresh interpreter pays to import the app"""
+    
+    IMPORT_BUDGET_SECONDS = 1.5
+    DEFERRED_MODULES = ["sklearn", "scipy", "numpy", "google.generativeai", "jose", "sqlalchemy"]
+    
+    def import_times(self, tmp_path):
+        """``{module: cumulative seconds}`` from ``python -X importtime`` in a fresh process"""
+        repo_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        env = {**os.environ, "PYTHONPATH": repo_root, "VERCEL": "1", "DB_PATH": str(tmp_path / "cold.db")}
+        # Services open the relative uphera.db, so keep it out of the checkout
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import api.main"],
+            cwd=tmp_path, env=env, capture_output=True, text=True, timeout=120
+        )
+        assert result.returncode == 0, result.stderr[-2000:]
+        
+        times = {}
+        for line in result.stderr.splitlines():
+            if line.startswith("import time:") and "|" in line:
+                _, cumulative, name = line.split("|")
+                if cumulative.strip().isdigit():
+                    times[name.strip()] = int(cumulative) / 1e6
+        return times
+    
+    def test_app_import_within_budget(self, tmp_path):
+        """Importing the entry point stays cheap and leaves heavy dependencies unloaded"""
+        times = self.import_times(tmp_path)
+        
+        print(f"✅ Cold import of api.main: {times['api.main'] * 1000:.0f}ms")
+        for name in sorted(times, key=times.get, reverse=True)[:5]:
+            print(f"   {name}: {times[name] * 1000:.0f}ms")
+        
+        assert times["api.main"] < self.IMPORT_BUDGET_SECONDS
+        loaded = [name for name in self.DEFERRED_MODULES if name in times]
+        assert not loaded, f"imported at startup: {loaded}"
+
 class TestStressTestScenarios:
     """Stress test scenarios that push system limits"""
     
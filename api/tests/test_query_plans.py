@@ -0,0 +1,130 @@
+"""
+Query plan regression tests: every hot query must be served by an index.
+
+Each case runs a real service call against a scratch database, records the
+SQL it issued through sqlite's trace callback, and checks ``EXPLAIN QUERY
+PLAN`` for full table scans and for sorts an index should have provided.
+"""
+
+import os
+import sqlite3
+import uuid
+from unittest.mock import patch
+
+import pytest
+
+from api import database
+from api.migrations import JOB_INDEXES
+from api.services.enhanced_ai_service import enhanced_ai_service
+from api.services.job_service import JobService
+from api.services.recommendation_service import RecommendationService
+
+USER_ID = "plan-user"
+
+@pytest.fixture(scope="module")
+def traced(tmp_path_factory):
+    """``(service, statements)``: a JobService whose connections log every statement"""
+    db_path = str(tmp_path_factory.mktemp("plans") / "jobs.db")
+    statements = []
+    configure = database._configure_connection
+
+    def configure_traced(conn):
+        configure(conn)
+        # Only this module's database; other pools may open connections meanwhile
+        if conn.execute("PRAGMA database_list").fetchone()[2] == os.path.realpath(db_path):
+            conn.set_trace_callback(statements.append)
+
+    with patch("api.database._configure_connection", configure_traced):
+        service = JobService(db_path=db_path)
+        jobs = [service.create_job({
+            "title": f"Plan Engineer {i}", "company": "Up Hera", "location": "Istanbul",
+            "job_type": "contract" if i % 2 else "full-time", "experience_level": "junior",
+            "remote_friendly": i % 3 == 0, "description": "Python services", "skills": ["Python"]
+        }) for i in range(30)]
+        for job in jobs[:5]:
+            service.apply_to_job(USER_ID, job["id"])
+            service.bookmark_job(USER_ID, job["id"])
+        with database.db_writer(db_path) as (conn, cursor):
+            cursor.executemany(
+                "INSERT INTO job_recommendations (id, user_id, job_id, match_score, reasons) VALUES (?, ?, ?, ?, '[]')",
+                [(str(uuid.uuid4()), USER_ID, job["id"], 50.0 + i) for i, job in enumerate(jobs[:10])]
+            )
+        yield service, statements
+
+def chat_history(service):
+    with patch.object(enhanced_ai_service, "db_path", service.db_path):
+        with database.db_writer(service.db_path) as (conn, cursor):
+            cursor.execute(
+                "INSERT INTO chat_history (id, user_id, message, response) VALUES (?, ?, 'Merhaba', 'Merhaba!')",
+                (str(uuid.uuid4()), USER_ID)
+            )
+        return enhanced_ai_service.get_chat_history(USER_ID)
+
+def second_page_cursor(service, **filters):
+    return service.get_jobs(limit=5, **filters)["next_cursor"]
+
+HOT_QUERIES = {
+    "list": lambda s: s.get_jobs(),
+    "list_by_type": lambda s: s.get_jobs(job_type="contract"),
+    "list_by_level": lambda s: s.get_jobs(experience_level="junior"),
+    "list_remote": lambda s: s.get_jobs(remote_only=True),
+    "list_by_location": lambda s: s.get_jobs(location="Istanbul"),
+    "list_next_page": lambda s: s.get_jobs(limit=5, page_cursor=second_page_cursor(s)),
+    "list_by_type_next_page": lambda s: s.get_jobs(
+        limit=5, job_type="contract", page_cursor=second_page_cursor(s, job_type="contract")
+    ),
+    "search": lambda s: s.get_jobs(search_query="python engineer"),
+    "search_next_page": lambda s: s.get_jobs(
+        limit=5, search_query="python", page_cursor=second_page_cursor(s, search_query="python")
+    ),
+    "job_detail": lambda s: s.get_job_by_id(s.get_jobs(limit=1)["jobs"][0]["id"]),
+    "jobs_by_ids": lambda s: s.get_jobs_by_ids([job["id"] for job in s.get_jobs(limit=5)["jobs"]]),
+    "job_versions": lambda s: s.get_job_versions(),
+    "apply": lambda s: s.apply_to_job("plan-applicant", s.get_jobs(limit=1)["jobs"][0]["id"]),
+    "applications": lambda s: s.get_user_applications(USER_ID),
+    "bookmark_toggle": lambda s: s.bookmark_job("plan-applicant", s.get_jobs(limit=1)["jobs"][0]["id"]),
+    "bookmarks": lambda s: s.get_user_bookmarks(USER_ID),
+    "chat_history": chat_history,
+    "recommendations_for_closed_jobs": lambda s: RecommendationService(db_path=s.db_path)._recompute(
+        set(), set(), {job["id"] for job in s.get_jobs(limit=2)["jobs"]}
+    ),
+}
+
+def query_plan(db_path, sql):
+    conn = sqlite3.connect(db_path)
+    try:
+        return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+    finally:
+        conn.close()
+
+def plan_problems(plan, sql):
+    problems = []
+    for detail in plan:
+        # Scanning the FTS5 table is how a MATCH is answered
+        if detail.startswith("SCAN ") and "VIRTUAL TABLE" not in detail:
+            problems.append(detail)
+        # Relevance order can only come from a sort
+        if detail.startswith("USE TEMP B-TREE FOR ORDER BY") and "bm25(" not in sql:
+            problems.append(detail)
+    return problems
+
+@pytest.mark.parametrize("name", list(HOT_QUERIES))
+def test_hot_query_uses_indexes(traced, name):
+    service, statements = traced
+    statements.clear()
+    HOT_QUERIES[name](service)
+
+    checked = 0
+    for sql in list(statements):
+        if not sql.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE", "WITH")):
+            continue
+        problems = plan_problems(query_plan(service.db_path, sql), sql)
+        assert not problems, f"{name}: {problems} in\n{sql}"
+        checked += 1
+    assert checked, f"{name} issued no queries"
+
+def test_migrated_database_has_every_index(traced):
+    service, _ = traced
+    with database.db_connection(service.db_path) as (conn, cursor):
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+        assert {name for name, _, _ in JOB_INDEXES} <= {row[0] for row in cursor.fetchall()}
@@ -2,9 +2,40 @@
 Basic unit tests to satisfy CI matrix and verify core endpoints.
 """
 
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import aclosing
+from unittest.mock import patch
+
+import pytest
 from fastapi.testclient import TestClient
 
+from api.database import (
+    ConnectionPool, DatabaseBusyError, DatabaseExecutor, SessionCache, get_pool, db_connection,
+    create_user, create_session, delete_session, update_user, validate_session, session_cache,
+    TokenRevocationList, create_access_token, decode_access_token,
+    authenticate_user, get_login_record, update_password_hash,
+)
+from api.database import migrate_db
+from api.migrations import LATEST_VERSION, MIGRATIONS, schema_version
+from api.security import PasswordHasher, password_hasher
+from api.services.ai_matching_service import AIMatchingService, BatchMatchingEngine, ai_matcher
+from api.services.recommendation_service import RecommendationService
+from api.config import settings
 from api.main import app
+from api.services import LazyService
+from api.services.enhanced_ai_service import (
+    AI_BUSY_MESSAGE, AIBusyError, AIResponseCache, AIWriteBuffer, ConversationMemory, PromptAssembler,
+    SharedRateLimits, SingleFlight, StreamBridge, UpstreamLimiter, enhanced_ai_service, estimate_tokens,
+)
+from api.services.job_service import InvalidCursorError, JobService, fts_query, job_service
+from api.services.local_llm import LocalModel
+from api.streaming import SSEStream, StreamStats, accepts_gzip, coalesce
 
 client = TestClient(app)
 
@@ -28,3 +59,1536 @@ def test_security_headers_present():
     assert "X-Frame-Options" in resp.headers
     assert "X-XSS-Protection" in resp.headers
 
+
+
+class TestConnectionPool:
+    """Pooled SQLite connections used by database.py and the services"""
+
+    def test_connections_are_reused(self, tmp_path):
+        pool = ConnectionPool(str(tmp_path / "pool.db"), max_size=2)
+        with pool.connection() as first:
+            mode = first.execute("PRAGMA journal_mode").fetchone()[0]
+        with pool.connection() as second:
+            pass
+
+        assert first is second
+        assert mode == "wal"
+        metrics = pool.metrics()
+        assert metrics["checkouts"] == 2
+        assert metrics["created"] == 1
+        assert metrics["open"] == 1
+        pool.close()
+
+    def test_pool_is_bounded(self, tmp_path):
+        pool = ConnectionPool(str(tmp_path / "pool.db"), max_size=1, timeout=0.05)
+        conn = pool.acquire()
+        with pytest.raises(sqlite3.OperationalError):
+            pool.acquire()
+        pool.release(conn)
+
+        metrics = pool.metrics()
+        assert metrics["waits"] == 1
+        assert metrics["timeouts"] == 1
+        assert metrics["in_use"] == 0
+        pool.close()
+
+    def test_waiter_gets_released_connection(self, tmp_path):
+        pool = ConnectionPool(str(tmp_path / "pool.db"), max_size=1, timeout=2)
+        conn = pool.acquire()
+        timer = threading.Timer(0.05, pool.release, args=(conn,))
+        timer.start()
+        with pool.connection() as reused:
+            assert reused is conn
+        timer.join()
+        assert pool.metrics()["waits"] == 1
+        pool.close()
+
+    def test_broken_idle_connection_is_replaced(self, tmp_path):
+        pool = ConnectionPool(str(tmp_path / "pool.db"), max_size=1, health_check_interval=0)
+        with pool.connection() as conn:
+            pass
+        conn.close()  # idle connection goes bad while parked in the pool
+        with pool.connection() as fresh:
+            assert fresh.execute("SELECT 1").fetchone() == (1,)
+
+        metrics = pool.metrics()
+        assert metrics["discarded"] == 1
+        assert metrics["created"] == 2
+        assert metrics["open"] == 1
+        pool.close()
+
+    def test_services_share_pool(self):
+        pool = get_pool(job_service.db_path)
+        before = pool.metrics()["checkouts"]
+        job_service.get_jobs(limit=1)
+        assert pool.metrics()["checkouts"] == before + 1
+
+
+class TestDatabaseExecutor:
+    """Blocking DB helpers run off the event loop with bounded queueing"""
+
+    @pytest.mark.asyncio
+    async def test_run_returns_result_and_records_timing(self):
+        executor = DatabaseExecutor(max_workers=2)
+
+        def lookup(value, scale=1):
+            return value * scale
+
+        assert await executor.run(lookup, 21, scale=2) == 42
+        stats = executor.metrics()["queries"][lookup.__qualname__]
+        assert stats["count"] == 1
+        assert stats["errors"] == 0
+        executor.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_loop_stays_responsive_during_slow_query(self):
+        executor = DatabaseExecutor(max_workers=1)
+        slow = asyncio.ensure_future(executor.run(time.sleep, 0.2))
+
+        started = time.perf_counter()
+        await asyncio.sleep(0.01)
+        assert time.perf_counter() - started < 0.1
+        await slow
+        executor.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_backpressure_rejects_when_saturated(self):
+        executor = DatabaseExecutor(max_workers=1, max_pending=1, queue_timeout=0.05)
+        release = threading.Event()
+        blocked = asyncio.ensure_future(executor.run(release.wait, 2))
+        await asyncio.sleep(0.01)
+
+        with pytest.raises(DatabaseBusyError):
+            await executor.run(lambda: None)
+        release.set()
+        assert await blocked is True
+
+        metrics = executor.metrics()
+        assert metrics["rejected"] == 1
+        assert metrics["in_flight"] == 0
+        executor.shutdown()
+
+
+class TestSessionCache:
+    """Token -> user cache in front of validate_session"""
+
+    @pytest.fixture
+    def session_token(self):
+        user_id = create_user({
+            "email": f"cache.{time.time_ns()}@uphera.com",
+            "password": "CacheTest123!",
+            "firstName": "Cache",
+            "lastName": "Test",
+            "upschoolProgram": "Data Science",
+            "skills": ["Python"]
+        })
+        return user_id, create_session(user_id)
+
+    def test_repeat_lookups_skip_database(self, session_token):
+        user_id, token = session_token
+        assert validate_session(token)["id"] == user_id
+
+        checkouts = get_pool().metrics()["checkouts"]
+        hits = session_cache.metrics()["hits"]
+        user = validate_session(token)
+
+        assert user["id"] == user_id
+        assert get_pool().metrics()["checkouts"] == checkouts
+        assert session_cache.metrics()["hits"] == hits + 1
+
+    def test_cached_user_is_a_copy(self, session_token):
+        _, token = session_token
+        validate_session(token)["skills"].append("Mutated")
+        assert validate_session(token)["skills"] == ["Python"]
+
+    def test_logout_invalidates_session(self, session_token):
+        _, token = session_token
+        assert validate_session(token) is not None
+        assert delete_session(token) is True
+        assert validate_session(token) is None
+
+    def test_profile_update_invalidates_cached_user(self, session_token):
+        user_id, token = session_token
+        assert validate_session(token)["location"] in ("", None)
+        update_user(user_id, {
+            "firstName": "Cache", "lastName": "Test", "upschoolProgram": "Data Science",
+            "location": "Izmir", "skills": ["Python"]
+        })
+        assert validate_session(token)["location"] == "Izmir"
+
+    def test_entries_expire_and_are_bounded(self):
+        cache = SessionCache(max_size=2, ttl=60)
+        cache.put("a", {"id": "u1"})
+        cache.put("b", {"id": "u2"})
+        cache.put("c", {"id": "u3"})
+        assert cache.get("a") is None
+        assert cache.get("c")["id"] == "u3"
+        assert cache.metrics()["evictions"] == 1
+
+        cache.put("d", {"id": "u4"}, session_expires_at=time.time() - 1)
+        assert cache.get("d") is None
+        assert cache.metrics()["expirations"] == 1
+
+    def test_stale_lookup_is_not_cached_after_invalidation(self):
+        cache = SessionCache()
+        generation = cache.generation()
+        cache.invalidate_user("u1")
+        cache.put("token", {"id": "u1"}, generation=generation)
+        assert cache.get("token") is None
+
+
+class TestSignedTokens:
+    """AUTH_TOKEN_MODE=jwt: stateless tokens with a revocation list"""
+
+    @pytest.fixture
+    def user_id(self):
+        return create_user({
+            "email": f"jwt.{time.time_ns()}@uphera.com",
+            "password": "JwtTest123!",
+            "firstName": "Jwt",
+            "lastName": "Test",
+            "upschoolProgram": "Data Science",
+            "userType": "admin"
+        })
+
+    @pytest.fixture(autouse=True)
+    def jwt_mode(self):
+        with patch.object(settings, "AUTH_TOKEN_MODE", "jwt"):
+            yield
+
+    def test_token_embeds_identity_and_expiry(self, user_id):
+        token = create_session(user_id)
+        claims = decode_access_token(token)
+
+        assert claims["sub"] == user_id
+        assert claims["type"] == "admin"
+        assert claims["exp"] - claims["iat"] == settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+        assert validate_session(token)["id"] == user_id
+
+    def test_verified_token_skips_database(self, user_id):
+        token = create_session(user_id, "mezun")
+        validate_session(token)
+
+        checkouts = get_pool().metrics()["checkouts"]
+        for _ in range(50):
+            assert validate_session(token)["id"] == user_id
+        assert get_pool().metrics()["checkouts"] == checkouts
+
+    def test_tampered_and_expired_tokens_are_rejected(self, user_id):
+        token = create_session(user_id, "mezun")
+        header, payload, signature = token.split(".")
+        forged = ".".join([header, payload, signature[::-1]])
+        assert validate_session(forged) is None
+
+        with patch.object(settings, "ACCESS_TOKEN_EXPIRE_MINUTES", -1):
+            expired = create_access_token(user_id)
+        assert validate_session(expired) is None
+
+    def test_logout_revokes_token_across_replicas(self, user_id):
+        token = create_session(user_id, "mezun")
+        assert validate_session(token) is not None
+        assert delete_session(token) is True
+        assert validate_session(token) is None
+
+        # Another replica learns about the revocation on its next refresh
+        replica = TokenRevocationList()
+        assert replica.refresh() >= 1
+        assert replica.is_revoked(decode_access_token(token, check_revoked=False)["jti"])
+
+
+class TestPasswordHasher:
+    """Salted PBKDF2 hashing with rehash-on-login"""
+
+    def test_hashes_are_salted_and_verifiable(self):
+        hasher = PasswordHasher(iterations=1000)
+        first, second = hasher.hash("Secret123!"), hasher.hash("Secret123!")
+
+        assert first != second
+        assert first.startswith("pbkdf2_sha256$1000$")
+        assert hasher.verify("Secret123!", first)
+        assert not hasher.verify("Wrong123!", first)
+        assert not hasher.verify("Secret123!", "garbage")
+
+    def test_weaker_hashes_are_upgraded(self):
+        legacy = hashlib.sha256(b"Secret123!").hexdigest()
+        weak = PasswordHasher(iterations=500).hash("Secret123!")
+        hasher = PasswordHasher(iterations=1000)
+
+        for stored in (legacy, weak):
+            valid, new_hash = hasher.check("Secret123!", stored)
+            assert valid and new_hash.startswith("pbkdf2_sha256$1000$")
+        assert hasher.check("Secret123!", hasher.hash("Secret123!")) == (True, None)
+        assert hasher.check("Wrong123!", legacy) == (False, None)
+
+    def test_legacy_hash_is_replaced_on_login(self):
+        email = f"legacy.{time.time_ns()}@uphera.com"
+        user_id = create_user({
+            "email": email,
+            "password": "Legacy123!",
+            "firstName": "Legacy",
+            "lastName": "User",
+            "upschoolProgram": "Data Science"
+        })
+        update_password_hash(user_id, hashlib.sha256(b"Legacy123!").hexdigest())
+
+        assert authenticate_user(email, "Wrong123!") is None
+        assert get_login_record(email)[1] == hashlib.sha256(b"Legacy123!").hexdigest()
+        assert authenticate_user(email, "Legacy123!")["id"] == user_id
+        assert get_login_record(email)[1].startswith("pbkdf2_sha256$")
+        assert authenticate_user(email, "Legacy123!")["id"] == user_id
+
+    @pytest.mark.asyncio
+    async def test_async_hashing_keeps_loop_responsive(self):
+        hasher = PasswordHasher(iterations=200000, max_workers=2)
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.005)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        try:
+            encoded = await hasher.hash_async("Secret123!")
+            assert await hasher.check_async("Secret123!", encoded) == (True, None)
+            assert await hasher.check_async("Secret123!", None) == (False, None)
+        finally:
+            task.cancel()
+            hasher.shutdown()
+        assert ticks > 0
+        assert hasher.metrics()["derivations"] >= 3
+
+
+MATCHING_JOBS = [
+    {"id": "j1", "title": "Frontend Developer", "description": "React and TypeScript UI work",
+     "required_skills": ["React", "TypeScript", "CSS"], "experience_level": "junior",
+     "location": "Istanbul", "remote_friendly": False},
+    {"id": "j2", "title": "Mobile Engineer", "description": "React Native apps for iOS and Android",
+     "required_skills": ["React Native", "React", "Swift"], "experience_level": "mid",
+     "location": "Ankara", "remote_friendly": False},
+    {"id": "j3", "title": "Data Scientist", "description": "Machine learning with Python and pandas",
+     "required_skills": ["Python", "Machine Learning", "Pandas"], "experience_level": "senior",
+     "location": "Remote", "remote_friendly": True},
+    {"id": "j4", "title": "Office Manager", "description": "Operations",
+     "required_skills": [], "experience_level": "entry", "location": "Bursa"},
+]
+
+MATCHING_USERS = [
+    {"skills": ["React", "TypeScript"], "experienceLevel": "junior",
+     "location": "Istanbul", "upschoolProgram": "Frontend Development"},
+    {"skills": ["Python", "Pandas", "SQL"], "experienceLevel": "entry",
+     "location": "Izmir", "upschoolProgram": "Data Science"},
+    {"skills": [], "experienceLevel": "lead", "location": "", "upschoolProgram": "Other"},
+]
+
+class TestBatchMatchingEngine:
+    """Vectorised scoring must agree with the per-job rules"""
+
+    @pytest.fixture
+    def matcher(self):
+        return AIMatchingService()
+
+    def test_rule_based_boosts_match_per_job_methods(self, matcher):
+        engine = BatchMatchingEngine(matcher).fit(MATCHING_JOBS)
+
+        for user in MATCHING_USERS:
+            expected = {
+                "skill_boost": [matcher.calculate_skill_boost(user["skills"], job["required_skills"])
+                                for job in MATCHING_JOBS],
+                "experience": [matcher.calculate_experience_match(user["experienceLevel"], job["experience_level"])
+                               for job in MATCHING_JOBS],
+                "location": [matcher.calculate_location_match(user["location"], job["location"],
+                                                              job.get("remote_friendly", False))
+                             for job in MATCHING_JOBS],
+                "program": [matcher.calculate_program_relevance(user["upschoolProgram"], job["title"],
+                                                                job["description"])
+                            for job in MATCHING_JOBS],
+            }
+            assert engine.skill_boost(user["skills"]).tolist() == pytest.approx(expected["skill_boost"])
+            assert engine.experience_match(user["experienceLevel"]).tolist() == pytest.approx(expected["experience"])
+            assert engine.location_match(user["location"]).tolist() == pytest.approx(expected["location"])
+            assert engine.program_relevance(user["upschoolProgram"]).tolist() == pytest.approx(expected["program"])
+
+    def test_first_matching_requirement_decides_partial_boost(self, matcher):
+        # "react native" precedes "react", so the per-job loop counts a partial match
+        engine = BatchMatchingEngine(matcher).fit([MATCHING_JOBS[1]])
+        expected = matcher.calculate_skill_boost(["React"], MATCHING_JOBS[1]["required_skills"])
+        assert engine.skill_boost(["React"])[0] == pytest.approx(expected)
+
+    def test_similarity_uses_one_corpus_vocabulary(self, matcher):
+        engine = BatchMatchingEngine(matcher).fit(MATCHING_JOBS)
+        similarity = engine.skill_similarity([["React", "TypeScript", "CSS"], []])
+
+        assert similarity.shape == (2, len(MATCHING_JOBS))
+        assert similarity[0][0] == pytest.approx(1.0)
+        assert similarity[0][2] == 0.0 and similarity[0][3] == 0.0
+        assert not similarity[1].any()
+
+    def test_rank_jobs_and_score_many_agree(self, matcher):
+        engine = BatchMatchingEngine(matcher).fit(MATCHING_JOBS)
+        many = engine.score_many(MATCHING_USERS)
+
+        for row, user in enumerate(MATCHING_USERS):
+            assert many[row].tolist() == engine.score(user).tolist()
+            ranked = matcher.rank_jobs(user, MATCHING_JOBS)
+            assert [job["match_score"] for job in ranked] == sorted(many[row].tolist(), reverse=True)
+            assert all(0 <= job["match_score"] <= 100 for job in ranked)
+
+        ranked = matcher.rank_jobs(MATCHING_USERS[0], MATCHING_JOBS)
+        assert ranked[0]["id"] == "j1"
+        assert matcher.rank_jobs(MATCHING_USERS[0], []) == []
+
+    def test_requirement_index_matches_linear_scan(self, matcher):
+        engine = BatchMatchingEngine(matcher).fit(MATCHING_JOBS)
+        requirements = list(engine._requirement_index.items())
+
+        for skill in ["react", "react native", "reactjs", "c", "ss", "machine", "python3", "go", ""]:
+            expected = {col for req, col in requirements if skill in req or req in skill}
+            assert engine.matching_requirements(skill) == expected
+
+        engine.upsert({"id": "j5", "title": "Go Developer", "required_skills": ["Go"]})
+        assert engine.matching_requirements("golang") == {engine._requirement_index["go"]}
+
+    def test_pruned_top_k_equals_full_ranking(self, matcher):
+        skills = ["Python", "React", "Go", "Rust", "SQL", "Swift", "Kotlin", "Docker"]
+        jobs = MATCHING_JOBS + [{
+            "id": f"s{i}", "title": f"Engineer {i}", "description": "Product work",
+            "required_skills": [skills[i % len(skills)], skills[(i * 3) % len(skills)]],
+            "experience_level": ["entry", "junior", "mid", "senior"][i % 4],
+            "location": ["Istanbul", "Ankara", "Izmir"][i % 3], "remote_friendly": i % 5 == 0
+        } for i in range(60)]
+        engine = BatchMatchingEngine(matcher).fit(jobs)
+
+        for user in MATCHING_USERS + [{"skills": ["Rust"], "experienceLevel": "mid",
+                                       "location": "Ankara", "upschoolProgram": "Backend Development"}]:
+            for k in (1, 5, 20):
+                full = sorted(engine.score(user).tolist(), reverse=True)[:k]
+                assert [score for _, score in engine.top_k(user, k)] == pytest.approx(full)
+
+        assert engine.stats["pruned"] > 0 and engine.stats["full_scans"] > 0
+        assert len(engine.candidate_rows(["Rust"])) < len(jobs)
+        assert engine.top_k(MATCHING_USERS[0], 0) == []
+
+class TestJobFeatureIndex:
+    """Persisted, incrementally updated job features"""
+
+    @pytest.fixture
+    def matcher(self):
+        return AIMatchingService()
+
+    def test_saved_index_scores_identically(self, matcher, tmp_path):
+        path = str(tmp_path / "jobs.npz")
+        engine = BatchMatchingEngine(matcher).fit(MATCHING_JOBS)
+        engine.save(path)
+
+        loaded = BatchMatchingEngine.load(path, matcher)
+        assert loaded.job_ids == ["j1", "j2", "j3", "j4"]
+        assert loaded.score_many(MATCHING_USERS).tolist() == engine.score_many(MATCHING_USERS).tolist()
+
+        matcher.skill_weights["react"] = 2.0
+        assert BatchMatchingEngine.load(path, matcher) is None
+
+    def test_upsert_and_remove_match_a_fresh_fit(self, matcher):
+        engine = BatchMatchingEngine(matcher).fit(MATCHING_JOBS[:2])
+        engine.upsert(MATCHING_JOBS[2])
+        engine.upsert(MATCHING_JOBS[3])
+        engine.upsert({**MATCHING_JOBS[0], "required_skills": ["Go", "React"], "location": "Izmir"})
+        engine.remove("j2")
+
+        jobs = [{**MATCHING_JOBS[0], "required_skills": ["Go", "React"], "location": "Izmir"}] + MATCHING_JOBS[2:]
+        fresh = BatchMatchingEngine(matcher).fit(jobs)
+        assert engine.job_ids == fresh.job_ids
+        for user in MATCHING_USERS:
+            # Only skill similarity may differ, as upserts reuse the original vocabulary
+            assert engine.skill_boost(user["skills"]).tolist() == fresh.skill_boost(user["skills"]).tolist()
+            assert engine.location_match(user["location"]).tolist() == fresh.location_match(user["location"]).tolist()
+            assert engine.program_relevance(user["upschoolProgram"]).tolist() == \
+                fresh.program_relevance(user["upschoolProgram"]).tolist()
+        assert engine.upserts_since_fit == 3
+
+    def test_upserts_avoid_copying_the_matrices(self, matcher):
+        engine = BatchMatchingEngine(matcher).fit(MATCHING_JOBS[:2])
+        engine.upsert(MATCHING_JOBS[2])
+        engine.upsert(MATCHING_JOBS[3])
+        # New jobs are queued, then stacked together on the next read
+        assert engine.job_matrix.shape[0] == 2 and len(engine) == 4
+        assert engine.score(MATCHING_USERS[0]).shape == (4,)
+        assert engine.job_matrix.shape[0] == 4
+
+        # A changed job with as many terms is rewritten where it is
+        job_matrix = engine.job_matrix
+        engine.upsert({**MATCHING_JOBS[1], "location": "Izmir"})
+        assert engine.job_matrix is job_matrix
+
+        fresh = BatchMatchingEngine(matcher).fit(MATCHING_JOBS[:2])
+        fresh.upsert({**MATCHING_JOBS[1], "location": "Izmir"})
+        fresh.upsert(MATCHING_JOBS[2])
+        fresh.upsert(MATCHING_JOBS[3])
+        assert engine.score_many(MATCHING_USERS).tolist() == fresh.score_many(MATCHING_USERS).tolist()
+
+    def test_job_service_changes_reach_index(self, matcher, tmp_path):
+        path = str(tmp_path / "jobs.npz")
+        index = matcher.load_job_index(path, job_service)
+        assert set(index.job_ids) == set(job_service.get_job_versions())
+
+        job_service.add_listener(matcher.on_job_changed)
+        try:
+            job = job_service.create_job({
+                "title": "Index Test Engineer", "company": "Up Hera",
+                "location": "Izmir", "skills": ["Rust", "Python"], "experience_level": "mid"
+            })
+            assert job["id"] in matcher.job_index
+            scores = matcher.score_indexed_jobs({"skills": ["Rust"], "location": "Izmir"})
+            assert scores[job["id"]] == max(scores.values())
+
+            # The file is written later, off the request
+            assert job["id"] not in BatchMatchingEngine.load(path, matcher)
+            assert matcher.save_job_index() and not matcher.save_job_index()
+            assert job["id"] in BatchMatchingEngine.load(path, matcher)
+
+            # A second process picks the persisted index up without refitting
+            reloaded = AIMatchingService().load_job_index(path, job_service)
+            assert job["id"] in reloaded
+
+            job_service.update_job(job["id"], {"is_active": False})
+            assert job["id"] not in matcher.job_index
+        finally:
+            job_service._listeners.remove(matcher.on_job_changed)
+
+class TestJobSearch:
+    """FTS5-backed job search"""
+
+    @pytest.fixture
+    def service(self, tmp_path):
+        service = JobService(db_path=str(tmp_path / "jobs.db"))
+        for job in [
+            {"title": "Yazılım Geliştirici", "company": "Işık Teknoloji", "location": "İstanbul",
+             "description": "Çağrı merkezi yazılımları", "skills": ["Python"]},
+            {"title": "Data Analyst", "company": "Veri A.Ş.", "location": "Ankara",
+             "description": "Reporting with SQL; some Python scripting", "skills": ["SQL"]},
+            {"title": "Python Engineer", "company": "Up Hera", "location": "Izmir",
+             "description": "Backend APIs", "skills": ["Python", "FastAPI"]},
+        ]:
+            service.create_job(job)
+        return service
+
+    def titles(self, service, query, **filters):
+        return [job["title"] for job in service.get_jobs(search_query=query, limit=50, **filters)["jobs"]]
+
+    def test_turkish_letters_and_case_are_folded(self, service):
+        assert service.fts_enabled
+        assert self.titles(service, "yazilim") == ["Yazılım Geliştirici"]
+        assert self.titles(service, "ISIK") == ["Yazılım Geliştirici"]
+        assert self.titles(service, "cagri merkez") == ["Yazılım Geliştirici"]
+        assert fts_query('c++ "OR" İş') == '"c"* "OR"* "iş"*'
+
+    def test_results_are_ranked_and_filtered(self, service):
+        # Title matches outrank skill and description matches
+        assert self.titles(service, "python")[0] == "Python Engineer"
+        assert set(self.titles(service, "python")) >= {"Data Analyst", "Yazılım Geliştirici"}
+        assert self.titles(service, "python", location="Ankara") == ["Data Analyst"]
+        page = service.get_jobs(search_query="python", limit=1)
+        assert page["total"] == len(self.titles(service, "python")) and page["has_more"]
+
+    def test_index_follows_updates(self, service):
+        job = service.get_jobs(search_query="data analyst")["jobs"][0]
+        service.update_job(job["id"], {"title": "Machine Learning Analyst"})
+        assert self.titles(service, "data analyst") == []
+        assert self.titles(service, "machine learning") == ["Machine Learning Analyst"]
+
+    def test_like_fallback_without_fts(self, service):
+        service.fts_enabled = False
+        assert self.titles(service, "Python Engineer") == ["Python Engineer"]
+
+    def test_index_is_created_once_fts_is_available(self, service):
+        # As left by the migration on a SQLite build without FTS5
+        with get_pool(service.db_path).writer() as conn:
+            for trigger in ("jobs_fts_insert", "jobs_fts_delete", "jobs_fts_update"):
+                conn.execute(f"DROP TRIGGER {trigger}")
+            conn.execute("DROP TABLE jobs_fts")
+
+        restarted = JobService(db_path=service.db_path)
+        assert restarted.fts_enabled
+        assert self.titles(restarted, "yazilim") == ["Yazılım Geliştirici"]
+
+class TestJobPagination:
+    """Keyset pagination and cached listing totals"""
+
+    @pytest.fixture
+    def service(self, tmp_path):
+        service = JobService(db_path=str(tmp_path / "jobs.db"), count_cache_ttl=60)
+        with get_pool(service.db_path).writer() as conn:
+            # Shared timestamps force the id tie-breaker
+            conn.executemany(
+                "INSERT INTO jobs (id, title, company, job_type, description, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [(f"page-{i:02d}", f"Pager {i}", "Up Hera", "contract" if i % 2 else "full-time",
+                  "Paging python jobs", f"2030-01-0{1 + i % 3} 09:00:00") for i in range(25)]
+            )
+        service.invalidate_counts()
+        return service
+
+    def walk(self, service, limit, **filters):
+        ids, page_cursor = [], ""
+        while True:
+            page = service.get_jobs(limit=limit, page_cursor=page_cursor, **filters)
+            ids.extend(job["id"] for job in page["jobs"])
+            if not page["next_cursor"]:
+                return ids
+            page_cursor = page["next_cursor"]
+
+    def test_cursor_pages_match_offset_pages(self, service):
+        total = service.get_jobs(limit=1)["total"]
+        by_offset = [job["id"] for offset in range(0, total, 7)
+                     for job in service.get_jobs(limit=7, offset=offset)["jobs"]]
+        assert self.walk(service, 7) == by_offset
+        assert len(set(by_offset)) == total
+
+        contract = [job_id for job_id in self.walk(service, 4, job_type="contract") if job_id.startswith("page-")]
+        assert contract == [job_id for job_id in by_offset if job_id.startswith("page-") and int(job_id[-2:]) % 2]
+
+        ranked = self.walk(service, 4, search_query="python pager")
+        assert sorted(ranked) == sorted(f"page-{i:02d}" for i in range(25))
+
+    def test_cursor_is_tied_to_its_ordering(self, service):
+        page_cursor = service.get_jobs(limit=2)["next_cursor"]
+        with pytest.raises(InvalidCursorError):
+            service.get_jobs(limit=2, search_query="python", page_cursor=page_cursor)
+        with pytest.raises(InvalidCursorError):
+            service.get_jobs(page_cursor="%%%")
+        for key in ([1], {"a": 1}, None, True):
+            with pytest.raises(InvalidCursorError):
+                service.get_jobs(page_cursor=service.encode_cursor("recent", key, "page-00"))
+
+    def test_totals_are_cached_until_jobs_change(self, service):
+        total = service.get_jobs(job_type="contract")["total"]
+        with get_pool(service.db_path).writer() as conn:
+            conn.execute("UPDATE jobs SET job_type = 'contract'")
+        assert service.get_jobs(job_type="contract")["total"] == total
+
+        service.create_job({"title": "Fresh", "company": "Up Hera", "job_type": "contract"})
+        assert service.get_jobs(job_type="contract")["total"] == service.get_jobs(limit=1)["total"]
+
+class TestMigrations:
+    """Versioned schema migrations"""
+
+    def tables(self, db_path):
+        with get_pool(db_path).connection() as conn:
+            return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+    def test_fresh_database_reaches_latest_version(self, tmp_path):
+        db_path = str(tmp_path / "fresh.db")
+        assert migrate_db(db_path) == LATEST_VERSION
+
+        with get_pool(db_path).connection() as conn:
+            versions = [row[0] for row in conn.execute("SELECT version FROM schema_version ORDER BY version")]
+        assert versions == [version for version, _, _ in MIGRATIONS]
+        assert {"users", "user_sessions", "jobs", "job_applications", "jobs_fts"} <= self.tables(db_path)
+        assert "applications" not in self.tables(db_path)
+
+    def test_up_to_date_database_skips_the_writer(self, tmp_path):
+        db_path = str(tmp_path / "fresh.db")
+        migrate_db(db_path)
+        writes = get_pool(db_path).metrics()["writes"]
+
+        assert migrate_db(db_path) == LATEST_VERSION
+        assert get_pool(db_path).metrics()["writes"] == writes
+
+    def test_repeat_checks_skip_the_database(self, tmp_path):
+        db_path = str(tmp_path / "fresh.db")
+        migrate_db(db_path)
+        checkouts = get_pool(db_path).metrics()["checkouts"]
+
+        assert migrate_db(db_path) == LATEST_VERSION
+        assert get_pool(db_path).metrics()["checkouts"] == checkouts
+
+    def test_unversioned_database_is_upgraded(self, tmp_path):
+        db_path = str(tmp_path / "legacy.db")
+        conn = sqlite3.connect(db_path)
+        conn.executescript('''
+            CREATE TABLE users (id TEXT PRIMARY KEY, email TEXT UNIQUE NOT NULL, password_hash TEXT NOT NULL,
+                                first_name TEXT NOT NULL, last_name TEXT NOT NULL, skills TEXT);
+            CREATE TABLE jobs (id TEXT PRIMARY KEY, title TEXT NOT NULL, company TEXT NOT NULL, location TEXT,
+                               description TEXT, requirements TEXT, salary_min INTEGER, salary_max INTEGER,
+                               job_type TEXT, experience_level TEXT DEFAULT 'entry', skills TEXT, benefits TEXT,
+                               remote_friendly BOOLEAN DEFAULT FALSE, is_active BOOLEAN DEFAULT TRUE,
+                               created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, updated_at TIMESTAMP,
+                               application_deadline TIMESTAMP, views INTEGER DEFAULT 0,
+                               applications_count INTEGER DEFAULT 0, company_logo TEXT);
+            CREATE TABLE applications (id TEXT PRIMARY KEY, user_id TEXT NOT NULL, job_id TEXT NOT NULL,
+                                       status TEXT DEFAULT 'pending', applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+            INSERT INTO jobs (id, title, company, skills) VALUES ('old-job', 'Legacy Engineer', 'Up Hera', '["COBOL"]');
+            INSERT INTO applications (id, user_id, job_id, status) VALUES ('old-app', 'u1', 'old-job', 'reviewed');
+        ''')
+        conn.close()
+
+        assert migrate_db(db_path) == LATEST_VERSION
+        with get_pool(db_path).connection() as conn:
+            assert "user_type" in [row[1] for row in conn.execute("PRAGMA table_info(users)")]
+            assert conn.execute("SELECT status FROM job_applications WHERE id = 'old-app'").fetchone() == ("reviewed",)
+            assert conn.execute("SELECT rowid FROM jobs_fts WHERE jobs_fts MATCH 'cobol'").fetchall()
+        assert "applications" not in self.tables(db_path)
+
+    def test_failed_step_is_rolled_back(self, tmp_path):
+        db_path = str(tmp_path / "broken.db")
+
+        def broken(cursor):
+            cursor.execute("CREATE TABLE half_done (id TEXT)")
+            raise sqlite3.OperationalError("boom")
+
+        with patch("api.migrations.MIGRATIONS", MIGRATIONS[:2] + [(3, "broken", broken)]):
+            with pytest.raises(sqlite3.OperationalError):
+                migrate_db(db_path)
+        with get_pool(db_path).connection() as conn:
+            assert schema_version(conn.cursor()) == 2
+        assert "half_done" not in self.tables(db_path)
+
+class TestJobViewCounter:
+    """Buffered job view counts"""
+
+    @pytest.fixture
+    def service(self, tmp_path):
+        service = JobService(db_path=str(tmp_path / "jobs.db"))
+        service.create_job({"id": "viewed", "title": "Viewed", "company": "Up Hera"})
+        return service
+
+    def stored_views(self, service):
+        with get_pool(service.db_path).connection() as conn:
+            return conn.execute("SELECT views FROM jobs WHERE id = 'viewed'").fetchone()[0]
+
+    def test_detail_reads_do_not_write(self, service):
+        writes = get_pool(service.db_path).metrics()["writes"]
+        views = [service.get_job_by_id("viewed")["views"] for _ in range(3)]
+
+        assert views == [1, 2, 3]
+        assert get_pool(service.db_path).metrics()["writes"] == writes
+        assert self.stored_views(service) == 0
+        assert service.get_job_by_id("missing") is None
+
+        assert service.view_counter.flush() == 3
+        assert self.stored_views(service) == 3
+        assert service.get_job_by_id("viewed")["views"] == 4
+        assert service.view_counter.flush() == 1 and service.view_counter.flush() == 0
+
+    def test_no_views_lost_across_concurrent_flushes(self, service):
+        counter = service.view_counter
+
+        def view(count):
+            for _ in range(count):
+                counter.record("viewed")
+
+        def flush_repeatedly():
+            for _ in range(20):
+                counter.flush()
+
+        threads = [threading.Thread(target=view, args=(500,)) for _ in range(4)]
+        threads += [threading.Thread(target=flush_repeatedly) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        counter.flush()
+
+        assert self.stored_views(service) == 2000
+        assert counter.metrics()["flushed"] == 2000 and counter.pending() == 0
+
+    def test_failed_flush_keeps_counts(self, service):
+        counter = service.view_counter
+        counter.record("viewed")
+        with patch("api.services.job_service.db_writer", side_effect=sqlite3.OperationalError("database is locked")):
+            with pytest.raises(sqlite3.OperationalError):
+                counter.flush()
+        counter.record("viewed")
+
+        assert counter.pending("viewed") == 2
+        assert counter.flush() == 2 and self.stored_views(service) == 2
+        assert counter.metrics()["failures"] == 1
+
+class TestLazyService:
+    """Service globals imported on first use"""
+
+    def test_resolves_on_first_attribute_access(self):
+        proxy = LazyService("job_service", "job_service")
+        assert not proxy.loaded
+
+        assert proxy.db_path == job_service.db_path
+        assert proxy.loaded and proxy.resolve() is job_service
+
+    def test_forwards_calls_and_assignments(self):
+        assert LazyService("job_service", "fts_query")("python") == fts_query("python")
+
+        proxy = LazyService("job_service", "job_service")
+        with patch.object(job_service, "fts_enabled", job_service.fts_enabled):
+            proxy.fts_enabled = False
+            assert job_service.fts_enabled is False
+
+class TestStreamBridge:
+    """Synchronous SDK streams relayed to asyncio from a bounded pool"""
+
+    @pytest.mark.asyncio
+    async def test_relays_chunks_and_records_first_chunk_latency(self):
+        bridge = StreamBridge(max_workers=2)
+
+        def open_stream():
+            time.sleep(0.02)
+            return iter(["Mer", "ha", "ba"])
+
+        assert [chunk async for chunk in bridge.stream(open_stream)] == ["Mer", "ha", "ba"]
+        metrics = bridge.metrics()
+        assert metrics["completed"] == 1 and metrics["chunks"] == 3
+        assert metrics["active_streams"] == 0 and metrics["waiting_for_worker"] == 0
+        assert metrics["max_ttft_ms"] >= 20
+        bridge.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_slow_consumer_throttles_the_producer(self):
+        bridge = StreamBridge(max_workers=1, buffer_size=4)
+        produced = []
+
+        def open_stream():
+            for i in range(100):
+                produced.append(i)
+                yield i
+
+        async with aclosing(bridge.stream(open_stream)) as chunks:
+            assert await chunks.__anext__() == 0
+            await asyncio.sleep(0.1)
+            # The buffer plus the chunk the worker is holding while it waits
+            assert len(produced) <= 4 + 2
+        bridge.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_closing_the_stream_stops_the_worker(self):
+        bridge = StreamBridge(max_workers=1, buffer_size=2)
+        closed = threading.Event()
+
+        def open_stream():
+            try:
+                while True:
+                    yield "chunk"
+            finally:
+                closed.set()
+
+        async with aclosing(bridge.stream(open_stream)) as chunks:
+            await chunks.__anext__()
+        assert await asyncio.to_thread(closed.wait, 2)
+
+        # The single worker is free again
+        assert [chunk async for chunk in bridge.stream(lambda: ["next"])] == ["next"]
+        metrics = bridge.metrics()
+        assert metrics["cancelled"] == 1 and metrics["completed"] == 1
+        assert metrics["active_streams"] == 0
+        bridge.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_sdk_errors_reach_the_consumer(self):
+        bridge = StreamBridge(max_workers=1)
+
+        def open_stream():
+            yield "partial"
+            raise ValueError("quota exceeded")
+
+        received = []
+        with pytest.raises(ValueError, match="quota exceeded"):
+            async for chunk in bridge.stream(open_stream):
+                received.append(chunk)
+        assert received == ["partial"]
+        assert bridge.metrics()["errors"] == 1
+        bridge.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_gemini_stream_runs_through_the_bridge(self):
+        class Chunk:
+            def __init__(self, text):
+                self.text = text
+
+        class Model:
+            def generate_content(self, prompt, stream=False, generation_config=None):
+                assert stream
+                return iter([Chunk("Merhaba"), Chunk(" dünya")])
+
+        with patch.object(enhanced_ai_service, "_gemini_checked", True), \
+             patch.object(enhanced_ai_service, "_gemini_ready", True), \
+             patch.object(enhanced_ai_service, "gemini_model", Model()):
+            before = enhanced_ai_service.stream_bridge.metrics()["completed"]
+            chunks = [chunk async for chunk in enhanced_ai_service.chat_with_gemini_stream("Selam")]
+
+        assert chunks == ["Merhaba", " dünya"]
+        assert enhanced_ai_service.stream_bridge.metrics()["completed"] == before + 1
+
+class TestAIResponseCache:
+    """Gemini responses reused for identical prompts"""
+
+    @pytest.fixture
+    def cache(self, tmp_path):
+        db_path = str(tmp_path / "cache.db")
+        migrate_db(db_path)
+        return AIResponseCache(db_path, ttl=60, max_entries=3)
+
+    def test_key_covers_prompt_and_config(self):
+        key = AIResponseCache.key("gemini", "sys", "Merhaba", {"temperature": 0.7})
+        assert key == AIResponseCache.key("gemini", "sys", "Merhaba", {"temperature": 0.7})
+        assert key != AIResponseCache.key("gemini", "sys", "Merhaba", {"temperature": 0.2})
+        assert key != AIResponseCache.key("gemini", "other", "Merhaba", {"temperature": 0.7})
+        assert key == AIResponseCache.key("gemini", "sys", "  Merhaba\n", {"temperature": 0.7})
+
+    def test_hits_misses_and_lru_eviction(self, cache):
+        assert cache.get("a") is None
+        for name in "abc":
+            cache.put(name, f"answer {name}")
+        assert cache.get("a") == "answer a"
+
+        # "b" is now the least recently used entry
+        cache.put("d", "answer d")
+        assert cache.get("b") is None
+        assert [cache.get(name) for name in "acd"] == ["answer a", "answer c", "answer d"]
+
+        metrics = cache.metrics()
+        assert metrics["hits"] == 4 and metrics["misses"] == 2
+        assert metrics["evictions"] == 1 and metrics["hit_rate"] == round(4 / 6, 4)
+
+    def test_hits_are_written_in_batches(self, cache):
+        cache.put("a", "answer a")
+        writes = get_pool(cache.db_path).metrics()["writes"]
+        for _ in range(3):
+            assert cache.get("a") == "answer a"
+        assert get_pool(cache.db_path).metrics()["writes"] == writes
+        assert cache.metrics()["pending_usage"] == 1
+
+        assert cache.flush_usage() == 1
+        with db_connection(cache.db_path) as (conn, cursor):
+            cursor.execute("SELECT hits FROM ai_response_cache WHERE key = 'a'")
+            assert cursor.fetchone()[0] == 3
+        assert cache.metrics()["pending_usage"] == 0
+
+    def test_expired_entries_miss(self, cache):
+        cache.put("old", "stale")
+        with patch("api.services.enhanced_ai_service.time.time", return_value=time.time() + 120):
+            assert cache.get("old") is None
+
+    @pytest.mark.asyncio
+    async def test_identical_requests_skip_gemini(self, cache):
+        calls = []
+
+        class Model:
+            def generate_content(self, prompt, generation_config=None):
+                calls.append(prompt)
+                if "hata" in prompt:
+                    raise RuntimeError("quota exceeded")
+                return type("Response", (), {"text": f"Yanıt {len(calls)}"})()
+
+        with patch.object(enhanced_ai_service, "_gemini_checked", True), \
+             patch.object(enhanced_ai_service, "_gemini_ready", True), \
+             patch.object(enhanced_ai_service, "gemini_model", Model()), \
+             patch.object(enhanced_ai_service, "response_cache", cache):
+            first = await enhanced_ai_service.chat_nonstream("CV ipuçları", "career")
+            assert await enhanced_ai_service.chat_nonstream("CV ipuçları", "career") == first
+            assert await enhanced_ai_service.chat_nonstream("CV ipuçları", "career", response_mode="short") != first
+
+            # Failures are not cached
+            await enhanced_ai_service.chat_nonstream("hata", "career")
+            await enhanced_ai_service.chat_nonstream("hata", "career")
+
+        assert len(calls) == 4
+        assert cache.metrics()["hits"] == 1
+
+class TestSingleFlight:
+    """Concurrent identical AI requests share one upstream call"""
+
+    async def collect(self, chunks):
+        return [chunk async for chunk in chunks]
+
+    @pytest.mark.asyncio
+    async def test_concurrent_calls_share_one_upstream_call(self):
+        flight = SingleFlight()
+        calls = []
+
+        async def upstream(name):
+            calls.append(name)
+            await asyncio.sleep(0.05)
+            return f"answer {name}"
+
+        results = await asyncio.gather(
+            *[flight.call("same", lambda: upstream("same")) for _ in range(5)],
+            flight.call("other", lambda: upstream("other"))
+        )
+
+        assert results == ["answer same"] * 5 + ["answer other"]
+        assert calls == ["same", "other"]
+        metrics = flight.metrics()
+        assert metrics["calls"] == 2 and metrics["coalesced_calls"] == 4
+        assert metrics["in_flight_calls"] == 0
+
+    @pytest.mark.asyncio
+    async def test_cancelled_caller_does_not_fail_the_others(self):
+        flight = SingleFlight()
+
+        async def upstream():
+            await asyncio.sleep(0.05)
+            return "answer"
+
+        leader = asyncio.ensure_future(flight.call("key", upstream))
+        follower = asyncio.ensure_future(flight.call("key", upstream))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+
+        assert await follower == "answer"
+
+    @pytest.mark.asyncio
+    async def test_stream_subscribers_fan_out_from_one_upstream(self):
+        flight = SingleFlight()
+        opened = []
+        second_chunk = asyncio.Event()
+
+        async def upstream():
+            opened.append(True)
+            yield "Mer"
+            await second_chunk.wait()
+            yield "haba"
+
+        first = flight.stream("key", upstream)
+        assert await first.__anext__() == "Mer"
+        # A late subscriber replays what was already produced
+        late = asyncio.ensure_future(self.collect(flight.stream("key", upstream)))
+        await asyncio.sleep(0.01)
+        second_chunk.set()
+
+        assert ["Mer"] + [chunk async for chunk in first] == ["Mer", "haba"]
+        assert await late == ["Mer", "haba"]
+        assert opened == [True]
+        assert flight.metrics()["coalesced_streams"] == 1
+
+    @pytest.mark.asyncio
+    async def test_upstream_stops_when_the_last_subscriber_leaves(self):
+        flight = SingleFlight()
+        closed = asyncio.Event()
+
+        async def upstream():
+            try:
+                while True:
+                    yield "chunk"
+                    await asyncio.sleep(0.01)
+            finally:
+                closed.set()
+
+        async with aclosing(flight.stream("key", upstream)) as first, \
+                aclosing(flight.stream("key", upstream)) as second:
+            await first.__anext__()
+            await second.__anext__()
+        await asyncio.wait_for(closed.wait(), 1)
+        assert flight.metrics()["in_flight_streams"] == 0
+
+    @pytest.mark.asyncio
+    async def test_concurrent_identical_chats_call_gemini_once(self):
+        calls = []
+
+        class Model:
+            def generate_content(self, prompt, generation_config=None):
+                calls.append(prompt)
+                time.sleep(0.05)
+                return type("Response", (), {"text": "Yanıt"})()
+
+        with patch.object(enhanced_ai_service, "_gemini_checked", True), \
+             patch.object(enhanced_ai_service, "_gemini_ready", True), \
+             patch.object(enhanced_ai_service, "gemini_model", Model()), \
+             patch.object(enhanced_ai_service.response_cache, "ttl", 0):
+            answers = await asyncio.gather(*[
+                enhanced_ai_service.chat_nonstream("Demo CV  analizi", "profile") for _ in range(5)
+            ], enhanced_ai_service.chat_nonstream("Demo CV analizi", "profile"))
+
+        assert answers == ["Yanıt"] * 6
+        assert len(calls) == 1
+
+class TestUpstreamLimiter:
+    """Gemini concurrency, rate budget and priority queueing"""
+
+    async def hold(self, limiter, priority, order, seconds=0.02, tokens=0):
+        async with limiter.reserve(priority, tokens):
+            order.append(priority)
+            await asyncio.sleep(seconds)
+
+    @pytest.mark.asyncio
+    async def test_concurrency_is_capped(self):
+        limiter = UpstreamLimiter(max_concurrent=2)
+        peak = []
+
+        async def call():
+            async with limiter.reserve():
+                peak.append(limiter.metrics()["active"])
+                await asyncio.sleep(0.02)
+
+        await asyncio.gather(*[call() for _ in range(6)])
+        assert max(peak) == 2
+        metrics = limiter.metrics()
+        assert metrics["granted"] == 6 and metrics["active"] == 0 and metrics["queue_depth"] == 0
+        assert metrics["max_wait_ms"] > 0
+
+    @pytest.mark.asyncio
+    async def test_short_chats_go_before_long_generations(self):
+        limiter = UpstreamLimiter(max_concurrent=1)
+        order = []
+        blocker = asyncio.ensure_future(self.hold(limiter, 1, order, seconds=0.05))
+        await asyncio.sleep(0.01)
+
+        queued = [asyncio.ensure_future(self.hold(limiter, UpstreamLimiter.priority_for(mode), order))
+                  for mode in ["long", "auto", "short", "long"]]
+        await asyncio.sleep(0.01)
+        assert limiter.metrics()["queue_depth_by_priority"] == {"short": 1, "auto": 1, "long": 2}
+
+        await asyncio.gather(blocker, *queued)
+        assert order == [1, 0, 1, 2, 2]
+
+    @pytest.mark.asyncio
+    async def test_exhausted_request_budget_times_out(self):
+        limiter = UpstreamLimiter(requests_per_minute=2, queue_timeout=0.05)
+        for _ in range(2):
+            async with limiter.reserve():
+                pass
+
+        with pytest.raises(AIBusyError):
+            async with limiter.reserve():
+                pass
+        assert limiter.metrics()["timeouts"] == 1 and limiter.metrics()["queue_depth"] == 0
+
+    @pytest.mark.asyncio
+    async def test_unused_output_tokens_are_refunded(self):
+        limiter = UpstreamLimiter(tokens_per_minute=1000, queue_timeout=0.05)
+        async with limiter.reserve(tokens=800) as grant:
+            grant.used_tokens = 100
+        # Without the refund only ~200 tokens would be left
+        async with limiter.reserve(tokens=800):
+            pass
+
+    @pytest.mark.asyncio
+    async def test_shared_budget_spans_instances(self, tmp_path):
+        db_path = str(tmp_path / "limits.db")
+        migrate_db(db_path)
+        first, second = [
+            UpstreamLimiter(queue_timeout=0.05, shared=SharedRateLimits(db_path, 2, 1000))
+            for _ in range(2)
+        ]
+
+        for _ in range(2):
+            async with first.reserve(tokens=10):
+                pass
+        with pytest.raises(AIBusyError):
+            async with second.reserve(tokens=10):
+                pass
+        assert second.metrics()["active"] == 0
+
+    @pytest.mark.asyncio
+    async def test_busy_provider_returns_a_friendly_message(self):
+        class Model:
+            def generate_content(self, prompt, generation_config=None):
+                return type("Response", (), {"text": "Yanıt"})()
+
+        with patch.object(enhanced_ai_service, "_gemini_checked", True), \
+             patch.object(enhanced_ai_service, "_gemini_ready", True), \
+             patch.object(enhanced_ai_service, "gemini_model", Model()), \
+             patch.object(enhanced_ai_service.response_cache, "ttl", 0), \
+             patch.object(enhanced_ai_service, "limiter", UpstreamLimiter(requests_per_minute=1, queue_timeout=0.05)):
+            assert await enhanced_ai_service.chat_nonstream("Birinci soru") == "Yanıt"
+            assert await enhanced_ai_service.chat_nonstream("İkinci soru") == AI_BUSY_MESSAGE
+            chunks = [chunk async for chunk in enhanced_ai_service.chat_with_gemini_stream("Üçüncü soru")]
+            assert chunks == [AI_BUSY_MESSAGE]
+
+class TestPromptAssembler:
+    """Memoized system prompts and per-request prompt token accounting"""
+
+    def test_system_prompt_is_built_once_per_context_and_mode(self):
+        builds = []
+
+        def build(context, mode):
+            builds.append((context, mode))
+            return f"{context}:{mode} " + "persona " * 100
+
+        assembler = PromptAssembler(build)
+        for _ in range(3):
+            assembler.assemble("Merhaba", "career", "short")
+            assembler.assemble("Merhaba", "career", "SHORT")
+        assembler.assemble("Merhaba", "interview")
+        assert builds == [("career", "short"), ("interview", "auto")]
+        assert assembler.metrics()["memoized_prompts"] == 2
+        assert assembler.metrics()["memo_hits"] == 5
+
+    def test_tokens_are_counted_per_request(self):
+        assembler = PromptAssembler(lambda context, mode: "x" * 400)
+        prompt = assembler.assemble("y" * 40, "career", "long")
+        assert prompt.system_tokens == 100
+        assert prompt.user_tokens == estimate_tokens(prompt.user_turn)
+        assert prompt.text == "x" * 400 + "\n\n" + prompt.user_turn
+
+        metrics = assembler.metrics()
+        assert metrics["requests"] == 1 and metrics["system_tokens"] == 100
+        assert metrics["by_mode"]["long"]["user_tokens"] == prompt.user_tokens
+        assert 0.5 < metrics["boilerplate_share"] < 1
+
+    @pytest.mark.asyncio
+    async def test_system_prompt_is_sent_as_model_instruction(self):
+        sent, models = [], []
+
+        class Model:
+            def __init__(self, name, generation_config=None, system_instruction=None):
+                self.system_instruction = system_instruction
+                models.append(self)
+
+            def generate_content(self, contents, stream=False, generation_config=None):
+                sent.append((self.system_instruction, contents))
+                return type("Response", (), {"text": "Yanıt"})()
+
+        genai = type("GenAI", (), {"GenerativeModel": Model})
+        with patch.object(enhanced_ai_service, "_gemini_checked", True), \
+             patch.object(enhanced_ai_service, "_gemini_ready", True), \
+             patch.object(enhanced_ai_service, "gemini_model", Model("default")), \
+             patch.object(enhanced_ai_service, "_genai", genai), \
+             patch.object(enhanced_ai_service, "_system_models", {}), \
+             patch.object(enhanced_ai_service.response_cache, "ttl", 0):
+            for message in ["Birinci soru", "İkinci soru"]:
+                assert await enhanced_ai_service.chat_nonstream(message, "interview") == "Yanıt"
+
+        system_prompt = enhanced_ai_service.prompts.system_prompt("interview")
+        assert sent == [
+            (system_prompt, "Kullanıcı: Birinci soru\n\nAda AI:"),
+            (system_prompt, "Kullanıcı: İkinci soru\n\nAda AI:"),
+        ]
+        # The default model plus one for the interview prompt
+        assert len(models) == 2
+
+    def test_model_creation_does_not_block_other_prompts(self):
+        slow = enhanced_ai_service.prompts.assemble("Soru", "interview")
+        ready = enhanced_ai_service.prompts.assemble("Soru", "career")
+        creating, release = threading.Event(), threading.Event()
+
+        def create(prompt):
+            creating.set()
+            release.wait(5)
+            return "interview model", float("inf")
+
+        with patch.object(enhanced_ai_service, "_genai", object()), \
+             patch.object(enhanced_ai_service, "_system_models", {ready.system_prompt: ("career model", float("inf"))}), \
+             patch.object(enhanced_ai_service, "_create_system_model", side_effect=create):
+            worker = threading.Thread(target=enhanced_ai_service._model_for, args=(slow,))
+            worker.start()
+            assert creating.wait(5)
+            # Served while the interview model is still being created
+            served = []
+            reader = threading.Thread(target=lambda: served.append(enhanced_ai_service._model_for(ready)))
+            reader.start()
+            reader.join(2)
+            assert served == [("career model", ready.user_turn)]
+            release.set()
+            worker.join(5)
+            assert enhanced_ai_service._model_for(slow) == ("interview model", slow.user_turn)
+
+class TestConversationMemory:
+    """Bounded per-user chat context with a rolling summary"""
+
+    def history(self, exchanges):
+        rows = [{"message": f"Soru {i}", "response": f"Yanıt {i}"} for i in range(exchanges)]
+        return lambda user_id, limit: list(reversed(rows))[:limit]
+
+    def test_context_stays_bounded(self):
+        memory = ConversationMemory(self.history(0), turns=3, summary_turns=5, max_tokens=120)
+        memory.context("uzun")
+        for i in range(200):
+            memory.record("uzun", f"Soru {i} " + "ayrıntı " * 10, f"Yanıt {i}")
+
+        context = memory.context("uzun")
+        assert estimate_tokens(context) <= 120
+        assert "Soru 199" in context and "Yanıt 199" in context
+        assert "Soru 150" not in context
+        assert memory.metrics()["folded_turns"] >= 197
+
+    def test_history_is_read_from_the_table_once(self):
+        loads = []
+        load = self.history(10)
+        memory = ConversationMemory(lambda user_id, limit: loads.append(limit) or load(user_id, limit), turns=2, summary_turns=3)
+
+        context = memory.context("ayse")
+        assert loads == [5]
+        assert "- Soru 7" in context and "- Soru 4" not in context
+        assert context.endswith("Kullanıcı: Soru 9\nAda AI: Yanıt 9")
+
+        memory.record("ayse", "Soru 10", "❌ AI servis hatası: zaman aşımı")
+        memory.record("ayse", "Soru 11", "Yanıt 11")
+        context = memory.context("ayse")
+        assert loads == [5] and memory.metrics()["hits"] == 1
+        assert "- Soru 8" in context and "- Soru 5" not in context and "Soru 10" not in context
+        assert context.endswith("Kullanıcı: Soru 11\nAda AI: Yanıt 11")
+
+    @pytest.mark.asyncio
+    async def test_earlier_turns_reach_the_prompt(self):
+        sent = []
+
+        class Model:
+            def generate_content(self, prompt, generation_config=None):
+                sent.append(prompt)
+                return type("Response", (), {"text": f"Yanıt {len(sent)}"})()
+
+        user_id = f"memory-{time.time_ns()}"
+        with patch.object(enhanced_ai_service, "_gemini_checked", True), \
+             patch.object(enhanced_ai_service, "_gemini_ready", True), \
+             patch.object(enhanced_ai_service, "gemini_model", Model()), \
+             patch.object(enhanced_ai_service.response_cache, "ttl", 0):
+            for message in ["Python öğrenmek istiyorum", "Nereden başlamalıyım?"]:
+                async for _ in enhanced_ai_service.enhanced_chat(user_id, message, use_streaming=False):
+                    pass
+
+        assert "Kullanıcı: Python öğrenmek istiyorum\nAda AI: Yanıt 1" in sent[1]
+        assert sent[1].endswith("Kullanıcı: Nereden başlamalıyım?\n\nAda AI:")
+        history = enhanced_ai_service.get_chat_history(user_id)
+        assert [row["message"] for row in history] == ["Nereden başlamalıyım?", "Python öğrenmek istiyorum"]
+
+class TestLocalModel:
+    """Deterministic stand-in for the Gemini model"""
+
+    def test_replies_are_deterministic_and_bounded(self):
+        model = LocalModel(first_token_ms=0, jitter_ms=0, tokens_per_second=0, chunk_tokens=4)
+        config = {"max_output_tokens": 10}
+
+        chunks = [chunk.text for chunk in model.generate_content("Merhaba", stream=True, generation_config=config)]
+        assert len(chunks) == 3 and len("".join(chunks).split()) == 10
+        assert "".join(chunks) == model.generate_content("Merhaba", generation_config=config).text
+        assert model.generate_content("Merhaba", generation_config=config).text != \
+            model.generate_content("Selam", generation_config=config).text
+        assert len(LocalModel(response_tokens=3, first_token_ms=0, jitter_ms=0, tokens_per_second=0)
+                   .generate_content("Merhaba", generation_config=config).text.split()) == 3
+
+    def test_tokens_arrive_at_the_configured_rate(self):
+        model = LocalModel(first_token_ms=30, jitter_ms=0, tokens_per_second=400, chunk_tokens=4)
+        started = time.perf_counter()
+        stream = model.generate_content("Merhaba", stream=True, generation_config={"max_output_tokens": 40})
+        next(stream)
+        first = time.perf_counter() - started
+        list(stream)
+        total = time.perf_counter() - started
+        assert 0.03 <= first < 0.1
+        # Nine more chunks of four tokens at 400 tokens/s
+        assert total >= 0.03 + 0.09
+
+    @pytest.mark.asyncio
+    async def test_local_provider_serves_the_chat(self):
+        with patch.object(settings, "AI_PROVIDER", "local"), \
+             patch.object(settings, "AI_LOCAL_FIRST_TOKEN_MS", 0), \
+             patch.object(settings, "AI_LOCAL_TOKENS_PER_SECOND", 0), \
+             patch.object(enhanced_ai_service, "_gemini_checked", False), \
+             patch.object(enhanced_ai_service, "_gemini_ready", False), \
+             patch.object(enhanced_ai_service, "gemini_model", None), \
+             patch.object(enhanced_ai_service, "gemini_model_name", enhanced_ai_service.gemini_model_name), \
+             patch.object(enhanced_ai_service.response_cache, "ttl", 0):
+            chunks = [chunk async for chunk in enhanced_ai_service.chat_with_gemini_stream("Merhaba", max_tokens=64)]
+            reply = await enhanced_ai_service.chat_nonstream("Merhaba", max_tokens=64)
+            assert isinstance(enhanced_ai_service.gemini_model, LocalModel)
+
+        assert len(chunks) > 1 and "".join(chunks) == reply
+
+class TestSSEFraming:
+    """Chunk coalescing, gzip framing and stream stats of the SSE endpoints"""
+
+    async def source(self, chunks, delay=0.0, closed=None):
+        try:
+            for chunk in chunks:
+                if delay:
+                    await asyncio.sleep(delay)
+                yield chunk
+        finally:
+            if closed is not None:
+                closed.append(True)
+
+    @pytest.mark.asyncio
+    async def test_chunks_are_joined_up_to_the_size_limit(self):
+        chunks = ["İlk"] + ["abcd"] * 10
+        pieces = [piece async for piece in coalesce(self.source(chunks), max_bytes=12, max_delay=10)]
+        assert pieces == ["İlk", "abcd" * 3, "abcd" * 3, "abcd" * 3, "abcd"]
+
+    @pytest.mark.asyncio
+    async def test_slow_chunks_are_flushed_after_the_delay(self):
+        chunks = ["a", "b", "c", "d"]
+        pieces = [piece async for piece in coalesce(self.source(chunks, delay=0.03), max_bytes=1024, max_delay=0.005)]
+        assert pieces == chunks
+
+    @pytest.mark.asyncio
+    async def test_closing_closes_the_source(self):
+        closed = []
+        stream = coalesce(self.source(["a", "b", "c"], delay=0.02, closed=closed), max_bytes=1024, max_delay=0.001)
+        async with aclosing(stream):
+            assert await stream.__anext__() == "a"
+            assert await stream.__anext__() == "b"
+        assert closed == [True]
+
+    def test_gzip_frames_decode_one_by_one(self):
+        stats = StreamStats()
+        sse = SSEStream(gzip=True, stats=stats)
+        decoder = zlib.decompressobj(wbits=31)
+        for text in ["Merhaba", "dünya"]:
+            assert decoder.decompress(sse.frame({"chunk": text})) == f"data: {json.dumps({'chunk': text})}\n\n".encode()
+        decoder.decompress(sse.end())
+        assert decoder.eof and sse.end() == b""
+
+        metrics = stats.metrics()
+        assert metrics["streams"] == 1 and metrics["frames"] == 2
+        assert metrics["frames_per_second"] > 0 and metrics["bytes_per_second"] > 0
+        assert accepts_gzip("br, gzip;q=0.8") and not accepts_gzip("gzip;q=0") and not accepts_gzip(None)
+
+class TestAIWriteBuffer:
+    """Batched chat history, insight and document writes"""
+
+    @pytest.fixture
+    def db_path(self, tmp_path):
+        db_path = str(tmp_path / "writes.db")
+        migrate_db(db_path)
+        return db_path
+
+    def stored(self, db_path, table):
+        with get_pool(db_path).connection() as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def chat_row(self, i, user_id="ayse"):
+        return (f"chat-{i}", user_id, f"Soru {i}", f"Yanıt {i}", "career", AIWriteBuffer.timestamp())
+
+    def test_rows_are_written_in_one_transaction(self, db_path):
+        writes = AIWriteBuffer(db_path)
+        for i in range(5):
+            writes.add("chat_history", self.chat_row(i))
+        writes.add("ai_insights", ("insight-1", "ayse", "career", "{}", AIWriteBuffer.timestamp()))
+        writes.add("user_documents", ("doc-1", "ayse", "cv.txt", "Python", ".txt", AIWriteBuffer.timestamp()))
+        assert self.stored(db_path, "chat_history") == 0
+        assert [row[0] for row in writes.pending("chat_history", "ayse")] == [f"chat-{i}" for i in range(5)]
+
+        transactions = get_pool(db_path).metrics()["writes"]
+        assert writes.flush() == 7
+        assert get_pool(db_path).metrics()["writes"] == transactions + 1
+        assert [self.stored(db_path, table) for table in AIWriteBuffer.TABLES] == [5, 1, 1]
+        assert writes.flush() == 0 and writes.metrics()["pending"] == 0
+
+    def test_failed_flush_keeps_rows(self, db_path):
+        writes = AIWriteBuffer(db_path)
+        writes.add("chat_history", self.chat_row(1))
+        with patch("api.services.enhanced_ai_service.db_writer", side_effect=sqlite3.OperationalError("database is locked")):
+            with pytest.raises(sqlite3.OperationalError):
+                writes.flush()
+        writes.add("chat_history", self.chat_row(2))
+
+        assert [row[0] for row in writes.pending()] == ["chat-1", "chat-2"]
+        assert writes.flush() == 2 and self.stored(db_path, "chat_history") == 2
+        assert writes.metrics()["failures"] == 1
+
+    @pytest.mark.asyncio
+    async def test_full_batch_wakes_the_flusher(self, db_path):
+        writes = AIWriteBuffer(db_path, max_batch=3)
+        waiting = asyncio.ensure_future(writes.wait(10))
+        await asyncio.sleep(0.01)
+        # Rows usually arrive from worker threads
+        await asyncio.to_thread(lambda: [writes.add("chat_history", self.chat_row(i)) for i in range(3)])
+        await asyncio.wait_for(waiting, 1)
+        assert len(writes.pending()) == 3
+
+    def test_write_through_without_write_behind(self, db_path):
+        writes = AIWriteBuffer(db_path, write_behind=False)
+        writes.add("chat_history", self.chat_row(1))
+        assert self.stored(db_path, "chat_history") == 1 and writes.pending() == []
+
+class TestRecommendationService:
+    """Stored top-K matches with incremental recompute"""
+
+    @pytest.fixture
+    def service(self):
+        service = RecommendationService(top_k=3)
+        job_service.add_listener(ai_matcher.on_job_changed)
+        job_service.add_listener(service.on_job_changed)
+        yield service
+        job_service._listeners.remove(ai_matcher.on_job_changed)
+        job_service._listeners.remove(service.on_job_changed)
+
+    @pytest.fixture
+    def user_id(self):
+        return create_user({
+            "email": f"reco.{time.time_ns()}@uphera.com",
+            "password": "RecoTest123!",
+            "firstName": "Reco",
+            "lastName": "Test",
+            "upschoolProgram": "Frontend Development",
+            "skills": ["React", "TypeScript"]
+        })
+
+    def test_recommendations_are_computed_once_then_served(self, service, user_id):
+        first = service.get_recommendations(user_id, limit=3)
+        assert len(first) == 3
+        assert [job["match_score"] for job in first] == sorted((job["match_score"] for job in first), reverse=True)
+        assert any("React" in reason for job in first for reason in job["reasons"])
+
+        with patch.object(service, "rescore_users") as rescore:
+            assert service.get_recommendations(user_id, limit=3) == first
+            rescore.assert_not_called()
+
+    def test_only_graduates_are_rescored(self, service, user_id):
+        company_id = create_user({
+            "email": f"reco.company.{time.time_ns()}@uphera.com",
+            "password": "RecoTest123!",
+            "firstName": "Reco",
+            "lastName": "Company",
+            "upschoolProgram": "",
+            "skills": ["React"],
+            "userType": "company"
+        })
+        assert service.rescore_users([user_id, company_id]) == 1
+        assert service.metrics()["users_rescored"] == 1
+
+        # Recorded as computed, so requests do not score them again
+        with patch.object(service, "rescore_users") as rescore:
+            assert service.get_recommendations(company_id) == []
+            rescore.assert_not_called()
+
+    def test_job_changes_wait_for_scoring(self, service, user_id):
+        service.get_recommendations(user_id, limit=3)
+        index = ai_matcher.job_index
+        scoring, changed = threading.Event(), threading.Event()
+        job = {"id": f"lock-{time.time_ns()}", "title": "React Engineer", "required_skills": ["React"]}
+
+        def change():
+            scoring.wait(5)
+            ai_matcher.on_job_changed("created", job)
+            changed.set()
+
+        def top_k(profile, k):
+            scoring.set()
+            # The index must not change under a running scorer
+            assert not changed.wait(0.2)
+            return BatchMatchingEngine.top_k(index, profile, k)
+
+        changer = threading.Thread(target=change)
+        changer.start()
+        try:
+            with patch.object(index, "top_k", side_effect=top_k):
+                assert service.rescore_users([user_id]) == 1
+            assert changed.wait(5)
+        finally:
+            changer.join(5)
+            ai_matcher.on_job_changed("deleted", job)
+
+    def test_changed_jobs_and_profiles_are_rescored(self, service, user_id):
+        service.get_recommendations(user_id, limit=3)
+        job = job_service.create_job({
+            "title": "Senior React Engineer", "company": "Up Hera", "location": "Istanbul",
+            "description": "React TypeScript frontend", "skills": ["React", "TypeScript"],
+            "experience_level": "entry"
+        })
+        assert service.has_pending_work()
+
+        with patch.object(service, "rescore_users", wraps=service.rescore_users) as rescore:
+            service.recompute()
+            # The new job is merged into stored top-Ks without rescoring the catalog
+            rescore.assert_called_once_with([])
+        assert service.get_recommendations(user_id, limit=1)[0]["id"] == job["id"]
+
+        job_service.update_job(job["id"], {"is_active": False})
+        assert service.recompute()["users"] >= 1
+        assert job["id"] not in [j["id"] for j in service.get_recommendations(user_id, limit=3)]
+
+        before = service.get_recommendations(user_id, limit=3)
+        update_user(user_id, {"firstName": "Reco", "lastName": "Test", "skills": ["Python", "Pandas"],
+                              "upschoolProgram": "Data Science"})
+        service.mark_user_dirty(user_id)
+        assert service.recompute()["users"] == 1
+        assert service.get_recommendations(user_id, limit=3) != before
+        assert not service.has_pending_work()
@@ -7,11 +7,12 @@ import asyncio
 import json
 import uuid
 from fastapi.testclient import TestClient
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 
 # Import test dependencies
 from api.main import app
 from api.services.websocket_service import manager, websocket_service
+from api.database import get_pool
 from api.services.notification_service import notification_service, NotificationType, NotificationPriority
 
 # Test client for HTTP requests
@@ -219,6 +220,25 @@ class TestNotificationService:
         assert notification["type"] == NotificationType.JOB_MATCH.value
         assert notification["priority"] == NotificationPriority.HIGH.value
     
+    @pytest.mark.asyncio
+    async def test_send_notification_marks_it_sent(self):
+        """Test the sent flag is written on the serialized write path"""
+        notification_id = await notification_service.create_notification(
+            user_id="test_sent_user",
+            notification_type=NotificationType.JOB_MATCH,
+            title="Sent Notification",
+            message="This notification gets sent",
+            send_immediately=False
+        )
+        writes = get_pool(notification_service.db_path).metrics()["writes"]
+        
+        with patch.object(websocket_service, "send_notification", new=AsyncMock()) as send:
+            assert await notification_service.send_notification(notification_id)
+        
+        send.assert_awaited_once()
+        assert notification_service.get_notification(notification_id)["is_sent"]
+        assert get_pool(notification_service.db_path).metrics()["writes"] == writes + 1
+    
     def test_get_user_notifications(self):
         """Test retrieving user notifications"""
         user_id = "test_user_notifications"